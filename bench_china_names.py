@@ -0,0 +1,79 @@
+"""
+对比 china-names 编译前后的 dnsmasq 配置：
+
+* 旧版本的输出：每个上游一个文件，列表中的每个条目一行 `server=/domain/upstream`
+* 编译之后：DomainTrie 去掉重复和被上级域名覆盖的条目，server_lines 把域名拼接成长行，每个上游一行
+
+输出两者的行数，以及 `dnsmasq --test --conf-file=...` 的加载时间（RUNS 次中最快的一次）。
+默认使用 names_root 中的列表（`gw fetch china-names` 下载的），也可以用 --lists 指定其他文件。
+没有安装 dnsmasq 时只输出行数。
+
+    python bench_china_names.py
+    python bench_china_names.py --lists accelerated-domains.china.conf,apple.china.conf
+"""
+
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from typing import Annotated
+
+import typer
+
+from xrouter.utils.domains import DomainTrie, parse_server_domains, server_lines
+
+UPSTREAMS = ["114.114.114.114", "223.5.5.5"]
+RUNS = 5
+
+
+def read_domains(files: list[Path]) -> list[str]:
+    domains = []
+    for file in files:
+        with file.open(encoding="utf8") as fp:
+            domains.extend(domain for domain, _ in parse_server_domains(fp))
+    return domains
+
+
+def load_time(conf: Path) -> float:
+    best = float("inf")
+    for _ in range(RUNS):
+        start = time.monotonic()
+        subprocess.run(["dnsmasq", "--test", f"--conf-file={conf}"], check=True, capture_output=True)
+        best = min(best, time.monotonic() - start)
+    return best
+
+
+def main(
+    lists: Annotated[str, typer.Option(help="Comma separated list files, default: all *.conf in names_root")] = "",
+):
+    from xrouter.gwlib import gw
+
+    files = [Path(name) for name in lists.split(",")] if lists else sorted(gw.names_root.glob("*.conf"))
+    domains = read_domains(files)
+    if not domains:
+        print("no domains found, run `gw fetch china-names` first or pass --lists")
+        raise typer.Exit(1)
+
+    trie = DomainTrie()
+    for domain in domains:
+        trie.add(domain)
+
+    before = [f"server=/{domain}/{upstream}\n" for upstream in UPSTREAMS for domain in domains]
+    after = list(server_lines(list(trie), UPSTREAMS))
+    print(f"{len(domains)} entries -> {len(list(trie))} domains, {len(UPSTREAMS)} upstreams")
+    print(f"server lines: {len(before)} -> {len(after)}")
+
+    if shutil.which("dnsmasq") is None:
+        print("dnsmasq is not installed, load time skipped")
+        return
+
+    with tempfile.TemporaryDirectory(prefix="xrouter-bench-") as tmp:
+        legacy, compiled = Path(tmp) / "legacy.conf", Path(tmp) / "compiled.conf"
+        legacy.write_text("".join(before))
+        compiled.write_text("".join(after))
+        print(f"dnsmasq --test: {load_time(legacy) * 1000:.1f}ms -> {load_time(compiled) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,178 @@
+"""
+网关故障切换时间的基准测试，使用 network namespace 搭建测试环境：
+
+    netns xrbench-r（路由器）              netns xrbench-p（上游）
+    xrb-pri 10.201.0.1/30  <-- veth -->   xrb-pri-p 10.201.0.2/30   主网关 pri
+    xrb-bak 10.202.0.1/30  <-- veth -->   xrb-bak-p 10.202.0.2/30   备用网关 bak
+
+脚本在 xrbench-r 中重新执行自己，路由表 TABLE 中 10.98.0.0/16 使用 `pri,bak`，
+在子进程中运行 Route.watch（与 `gw gateways watch` 相同）。Route.sync 会删除 main 表的默认路由，
+在单独的 namespace 中运行不会影响本机的路由。
+每一轮在 namespace 中 down 掉 xrb-pri-p（host 一侧失去载波，相当于 PPPoE 掉线），
+测量路由切换到 xrb-bak 的时间（failover），再 up 回来测量切换回 xrb-pri 的时间（failback）。
+时间从执行 `ip link set` 之前开始，到 RTM_GETROUTE 读到新的出接口为止（每 0.5ms 读取一次）。
+只测量链路状态触发的切换，probe 触发的切换取决于 --interval 和 probe 的超时。
+
+需要 root 和 `ip netns`，否则跳过（退出码 0）。结束时删除两个 namespace。
+
+    python bench_failover.py --runs 10
+"""
+
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Annotated
+
+import typer
+
+ROUTER_NETNS = "xrbench-r"
+PEER_NETNS = "xrbench-p"
+# 在 ROUTER_NETNS 中重新执行时设置
+INSIDE_ENV = "XRBENCH_INSIDE"
+TABLE = 4321
+TARGET = "10.98.0.0/16"
+# 内核的 linkwatch 对非紧急的载波变化限速，距离上一次处理不到 1 秒的事件会被推迟到满 1 秒，
+# 每次切换之前等待超过 1 秒，测到的是 xrouter 的反应时间，而不是 linkwatch 的排队时间
+SETTLE = 1.2
+LINKS = {
+    # host 接口: (namespace 中的对端, host 地址, 网关地址)
+    "xrb-pri": ("xrb-pri-p", "10.201.0.1/30", "10.201.0.2"),
+    "xrb-bak": ("xrb-bak-p", "10.202.0.1/30", "10.202.0.2"),
+}
+
+# 子进程：只依赖 Route 配置，不需要 xrouter.yml
+WATCH_CODE = """
+import json, logging, sys
+from xrouter.gwlib import gw
+from xrouter.gwlib.config.route import Route
+gw.setup(verbose=False)
+gw.logger.setLevel(logging.WARNING)
+Route.model_validate(json.loads(sys.argv[1])).watch(float(sys.argv[2]))
+"""
+
+
+def ip(*args: str, check: bool = True):
+    subprocess.run(["ip", *args], check=check, capture_output=True)
+
+
+def setup_netns():
+    ip("netns", "add", ROUTER_NETNS)
+    ip("netns", "add", PEER_NETNS)
+    ip("-n", ROUTER_NETNS, "link", "set", "lo", "up")
+    for host, (peer, address, _) in LINKS.items():
+        ip("-n", ROUTER_NETNS, "link", "add", host, "type", "veth", "peer", "name", peer, "netns", PEER_NETNS)
+        ip("-n", ROUTER_NETNS, "addr", "add", address, "dev", host)
+        ip("-n", ROUTER_NETNS, "link", "set", host, "up")
+        ip("-n", PEER_NETNS, "link", "set", peer, "up")
+
+
+def cleanup():
+    # 删除 namespace 时其中的 veth 和路由表一起删除
+    ip("netns", "del", ROUTER_NETNS, check=False)
+    ip("netns", "del", PEER_NETNS, check=False)
+
+
+def route_oif() -> int | None:
+    from xrouter.utils.cidr import parse_cidr
+    from xrouter.utils.netlink import dump_routes
+
+    target = parse_cidr(TARGET)
+    for route in dump_routes(TABLE, socket.AF_INET):
+        if route.dst == target:
+            return route.oif
+    return None
+
+
+def wait_oif(index: int, start: float, timeout: float = 10.0) -> float:
+    """
+    等待路由切换到 index 接口，返回从 start 开始的秒数
+    """
+    while time.perf_counter() - start < timeout:
+        if route_oif() == index:
+            return time.perf_counter() - start
+        time.sleep(0.0005)
+    raise TimeoutError(f"route did not switch to ifindex {index} in {timeout:g}s")
+
+
+def summary(name: str, values: list[float]) -> str:
+    ms = [value * 1000 for value in values]
+    return f"{name}: min {min(ms):.1f} ms, median {statistics.median(ms):.1f} ms, max {max(ms):.1f} ms"
+
+
+def main(
+    runs: Annotated[int, typer.Option(help="Number of failover/failback rounds")] = 5,
+    interval: Annotated[float, typer.Option(help="Probe interval passed to Route.watch")] = 5.0,
+):
+    if os.environ.get(INSIDE_ENV):
+        measure(runs, interval)
+        return
+
+    if os.geteuid() != 0:
+        print("skipped: needs root to create network namespaces")
+        return
+
+    cleanup()
+    try:
+        setup_netns()
+    except subprocess.CalledProcessError as e:
+        cleanup()
+        print(f"skipped: failed to set up network namespaces: {e.stderr.decode().strip()}")
+        return
+
+    try:
+        command = [sys.executable, __file__, "--runs", str(runs), "--interval", str(interval)]
+        env = dict(os.environ, **{INSIDE_ENV: "1"})
+        code = subprocess.run(["ip", "netns", "exec", ROUTER_NETNS, *command], env=env).returncode
+    finally:
+        cleanup()
+
+    if code:
+        raise typer.Exit(code)
+
+
+def measure(runs: int, interval: float):
+    route = {
+        "gateways": {name: f"via {gateway} dev {name}" for name, (_, _, gateway) in LINKS.items()},
+        "tables": {TABLE: [[TARGET, ",".join(LINKS)]]},
+    }
+    primary, backup = (socket.if_nametoindex(name) for name in LINKS)
+    primary_peer = LINKS["xrb-pri"][0]
+
+    env = dict(os.environ, PYTHONPATH=str(Path(__file__).parent))
+    watch = subprocess.Popen([sys.executable, "-c", WATCH_CODE, json.dumps(route), str(interval)], env=env)
+    failovers, failbacks = [], []
+    try:
+        wait_oif(primary, time.perf_counter())
+        time.sleep(SETTLE)
+        # 第一轮为预热，新建的 veth 第一次失去载波时，内核经常延迟数百毫秒才发出事件，不计入结果
+        for i in range(runs + 1):
+            # 从执行 ip 命令之前开始计时，包含 ip 命令本身约 1ms 的开销
+            start = time.perf_counter()
+            ip("-n", PEER_NETNS, "link", "set", primary_peer, "down")
+            failover = wait_oif(backup, start)
+            time.sleep(SETTLE)
+            start = time.perf_counter()
+            ip("-n", PEER_NETNS, "link", "set", primary_peer, "up")
+            failback = wait_oif(primary, start)
+            time.sleep(SETTLE)
+
+            name = f"run {i}" if i else "warmup"
+            print(f"{name}: failover {failover * 1000:.1f} ms, failback {failback * 1000:.1f} ms")
+            if i:
+                failovers.append(failover)
+                failbacks.append(failback)
+    finally:
+        watch.terminate()
+        watch.wait()
+
+    print(summary("failover", failovers))
+    print(summary("failback", failbacks))
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,235 @@
+"""
+对比两种按目标地址选择网关的方式在 10k/100k 前缀时的加载时间和查找开销：
+
+* route table: route.tables 中的 zone，每个前缀一条路由，通过 netlink 下发（Route.sync）
+* set: route.marks 中的 zone，编译为 nftables interval set（Route.export_mark_sets + `nft -f`），
+  匹配的包打上 fwmark，再 `fwmark lookup` 只有一条默认路由的路由表
+
+前缀为固定种子生成的随机 /24（不合并，aggregate=False），查找地址一半在前缀中，一半不在。
+
+查找开销无法单独测量内核中的一次查找，这里用批量请求近似：
+
+* route table: `ip -batch` 执行 LOOKUPS 次 `route get ADDR mark M`（fwmark 规则指向测试的路由表）
+* set: `nft -f` 执行 LOOKUPS 次 `get element`
+
+两者都减去同样的请求在空路由表、空 set 上的耗时，剩下的部分近似为前缀数量带来的查找开销。
+
+脚本在单独的 network namespace 中重新执行自己（Route.sync 会删除 main 表的默认路由，不能影响本机），
+需要 root 和 `ip netns`，否则跳过（退出码 0）。没有安装 nft 时只测量 set 文件的生成时间。
+
+    python bench_steering.py --sizes 10000,100000
+"""
+
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Annotated
+
+import typer
+
+NETNS = "xrbench-s"
+# 在 NETNS 中重新执行时设置
+INSIDE_ENV = "XRBENCH_INSIDE"
+DEV = "xrb-gw"
+GATEWAY = "10.203.0.2"
+TABLE = 4322
+MARK = 0x4322
+LOOKUPS = 20000
+SEED = 4322
+
+
+def ip(*args: str, check: bool = True):
+    subprocess.run(["ip", *args], check=check, capture_output=True)
+
+
+def prefixes(count: int) -> list[str]:
+    """
+    count 个不重复的随机 /24，只使用 1.0.0.0 - 223.255.255.0 中除 127/8 之外的地址
+    """
+    rng = random.Random(SEED)
+    networks: set[int] = set()
+    while len(networks) < count:
+        network = rng.randrange(1 << 16, 224 << 16)
+        if network >> 16 != 127:
+            networks.add(network)
+    return [f"{n >> 16}.{(n >> 8) & 255}.{n & 255}.0/24" for n in sorted(networks)]
+
+
+def lookup_addresses(zone: list[str], count: int) -> list[str]:
+    rng = random.Random(SEED + 1)
+    addresses = []
+    for i in range(count):
+        if i % 2:
+            network = rng.choice(zone).split("/")[0].rsplit(".", 1)[0]
+            addresses.append(f"{network}.{rng.randrange(1, 255)}")
+        else:
+            # 224/4 之后的地址不在任何前缀中
+            addresses.append(f"{rng.randrange(224, 240)}.{rng.randrange(256)}.{rng.randrange(256)}.1")
+    return addresses
+
+
+def timed(run) -> float:
+    start = time.perf_counter()
+    run()
+    return time.perf_counter() - start
+
+
+def run_batch(command: list[str], lines: list[str]) -> float:
+    """
+    用一个进程执行一批命令，返回耗时。命令失败（如 get element 查不到）不影响计时
+    """
+    with tempfile.NamedTemporaryFile("w", suffix=".batch") as fp:
+        fp.writelines(line + "\n" for line in lines)
+        fp.flush()
+        start = time.perf_counter()
+        subprocess.run([*command, fp.name], capture_output=True)
+        return time.perf_counter() - start
+
+
+def route_lookup(addresses: list[str]) -> float:
+    return run_batch(["ip", "-force", "-batch"], [f"route get {address} mark {MARK:#x}" for address in addresses])
+
+
+def set_lookup(set_name: str, addresses: list[str]) -> float:
+    return run_batch(["nft", "-f"], [f"get element inet route {set_name} {{ {address} }}" for address in addresses])
+
+
+def per_lookup(total: float, baseline: float, count: int) -> str:
+    return f"{max(total - baseline, 0) / count * 1e6:.2f} us/lookup (total {total * 1000:.0f} ms)"
+
+
+def bench_route_table(size: int, zone: str, addresses: list[str]):
+    from xrouter.gwlib.config.route import Route
+
+    route = Route(
+        gateways={"gw": f"via {GATEWAY} dev {DEV}"},
+        tables={TABLE: [(zone, "gw")]},
+        rules=[f"fwmark {MARK:#x} lookup {TABLE} pref 100"],
+        aggregate=False,
+    )
+    empty = Route(
+        gateways={"gw": f"via {GATEWAY} dev {DEV}"},
+        tables={TABLE: []},
+        rules=[f"fwmark {MARK:#x} lookup {TABLE} pref 100"],
+    )
+
+    empty.sync()
+    baseline = route_lookup(addresses)
+
+    install = timed(route.sync)
+    resync = timed(route.sync)
+    lookup = route_lookup(addresses)
+    # 确认查找确实经过 fwmark 规则命中了测试的路由表
+    result = subprocess.run(
+        ["ip", "route", "get", addresses[1], "mark", f"{MARK:#x}"], capture_output=True, text=True, check=True
+    )
+    assert f"dev {DEV}" in result.stdout, result.stdout
+    print(f"  route table: install {install * 1000:.0f} ms, no-op resync {resync * 1000:.0f} ms")
+    print(f"  route table: lookup {per_lookup(lookup, baseline, len(addresses))}")
+
+    empty.sync()
+
+
+def bench_set(size: int, zone: str, addresses: list[str], work_dir: Path):
+    from xrouter.gwlib.config.route import Route
+
+    route = Route(
+        gateways={"gw": f"via {GATEWAY} dev {DEV}"},
+        marks={"bench": {"mark": MARK, "table": TABLE, "gateway": "gw", "targets": [zone], "priority": 100}},
+    )
+    set_name = route.mark_set_name("bench", 4)
+
+    sets_file = work_dir / f"route-sets-{size}.nft"
+    generate = timed(lambda: route.export_mark_sets(sets_file))
+    print(f"  set: file generation {generate * 1000:.0f} ms ({sets_file.stat().st_size // 1024} KiB)")
+
+    if shutil.which("nft") is None:
+        print("  set: nft load and lookup skipped, nft is not installed")
+        return
+
+    empty_file = work_dir / "route-sets-empty.nft"
+    empty_file.write_text(
+        "add table inet route\n"
+        f"add set inet route {set_name} {{ type ipv4_addr; flags interval; auto-merge; }}\n"
+        f"flush set inet route {set_name}\n"
+    )
+    subprocess.run(["nft", "-f", str(empty_file)], check=True)
+    baseline = set_lookup(set_name, addresses)
+
+    load = timed(lambda: subprocess.run(["nft", "-f", str(sets_file)], check=True))
+    lookup = set_lookup(set_name, addresses)
+    print(f"  set: nft -f load {load * 1000:.0f} ms")
+    print(f"  set: lookup {per_lookup(lookup, baseline, len(addresses))}")
+
+    subprocess.run(["nft", "delete", "table", "inet", "route"], check=True)
+
+
+def measure(sizes: list[int]):
+    from xrouter.gwlib import gw
+
+    ip("link", "set", "lo", "up")
+    # 网关只需要一个处于 up 状态的接口，对端不收发数据
+    ip("link", "add", DEV, "type", "veth", "peer", "name", f"{DEV}-p")
+    ip("link", "set", f"{DEV}-p", "up")
+    ip("addr", "add", "10.203.0.1/24", "dev", DEV)
+    ip("link", "set", DEV, "up")
+
+    work_dir = Path(tempfile.mkdtemp(prefix="xrbench-"))
+    try:
+        gw.setup(verbose=False)
+        gw.logger.setLevel("WARNING")
+        gw.zones_root = work_dir / "zones"
+        gw.bin_root = work_dir / "bin"
+        gw.backup_root = work_dir / "backups"
+        gw.cache_root = work_dir / "cache"
+        gw.zones_root.mkdir()
+
+        for size in sizes:
+            zone = prefixes(size)
+            name = f"bench{size}"
+            (gw.zones_root / f"{name}.txt").write_text("\n".join(zone) + "\n")
+            addresses = lookup_addresses(zone, LOOKUPS)
+
+            print(f"{size} prefixes, {LOOKUPS} lookups:")
+            bench_route_table(size, name, addresses)
+            bench_set(size, name, addresses, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main(sizes: Annotated[str, typer.Option(help="Comma separated prefix counts")] = "10000,100000"):
+    counts = [int(size) for size in sizes.split(",")]
+
+    if os.environ.get(INSIDE_ENV):
+        measure(counts)
+        return
+
+    if os.geteuid() != 0:
+        print("skipped: needs root to create a network namespace")
+        return
+
+    ip("netns", "del", NETNS, check=False)
+    try:
+        ip("netns", "add", NETNS)
+    except subprocess.CalledProcessError as e:
+        print(f"skipped: failed to create a network namespace: {e.stderr.decode().strip()}")
+        return
+
+    try:
+        command = [sys.executable, __file__, "--sizes", sizes]
+        env = dict(os.environ, PYTHONPATH=str(Path(__file__).parent), **{INSIDE_ENV: "1"})
+        code = subprocess.run(["ip", "netns", "exec", NETNS, *command], env=env).returncode
+    finally:
+        ip("netns", "del", NETNS, check=False)
+
+    if code:
+        raise typer.Exit(code)
+
+
+if __name__ == "__main__":
+    typer.run(main)
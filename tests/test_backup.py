@@ -0,0 +1,27 @@
+import os
+from pathlib import Path
+
+from xrouter.gwlib.backup import BackupStore
+
+
+def test_gc_migrates_runs_without_manifest(tmp_path: Path):
+    # 旧版本的备份：files/{run_id}/ 中的完整副本，没有 manifest
+    for run_id in ("20240101-000000-000000", "20240102-000000-000000"):
+        etc = tmp_path / "files" / run_id / "etc"
+        etc.mkdir(parents=True)
+        (etc / "same.conf").write_text("same\n")
+        (etc / "run.conf").write_text(run_id)
+        (etc / "run.conf").chmod(0o600)
+
+    store = BackupStore(tmp_path, keep_runs=1)
+    assert store.gc() == (1, 1)
+
+    assert not (tmp_path / "files" / "20240101-000000-000000").exists()
+    [run] = store.runs()
+    assert run.run_id == "20240102-000000-000000"
+    assert run.files["/etc/run.conf"]["mode"] == "600"
+
+    # 副本替换为指向 blob 的硬链接
+    kept = tmp_path / "files" / run.run_id / "etc" / "same.conf"
+    assert kept.read_text() == "same\n"
+    assert os.stat(kept).st_nlink == 2
@@ -0,0 +1,16 @@
+from xrouter.utils.cidr import aggregate_cidrs, cidrs_to_intervals
+
+
+def test_aggregate_generator_keeps_both_families():
+    cidrs = [(4, 0x01020200, 24), (4, 0x01020300, 24), (4, 0x01020304, 32), (6, 0x20010DB8 << 96, 32)]
+
+    assert aggregate_cidrs(cidr for cidr in cidrs) == [(4, 0x01020200, 23), (6, 0x20010DB8 << 96, 32)]
+
+
+def test_intervals_generator_keeps_both_families():
+    cidrs = [(4, 0x0A000000, 24), (4, 0x0A000100, 24), (6, 0x20010DB8 << 96, 32)]
+
+    assert cidrs_to_intervals(cidr for cidr in cidrs) == [
+        (4, 0x0A000000, 0x0A0001FF),
+        (6, 0x20010DB8 << 96, (0x20010DB9 << 96) - 1),
+    ]
@@ -0,0 +1,53 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# 一次 hook 调用：run_root 指向临时目录，handle_dispatcher_events 只把这一批事件的 IFACE 写入 batches 目录，
+# 拿到锁的进程可能处理多批（处理期间写入的事件），每一批一个文件
+HOOK = """
+import json
+import sys
+import uuid
+from pathlib import Path
+
+from xrouter import cli
+from xrouter.gwlib import gw
+
+gw.run_root = Path(sys.argv[1])
+gw.dispatcher_debounce = 1.0
+gw.dispatcher_max_wait = 10.0
+
+
+def handle_dispatcher_events(events):
+    batch = gw.run_root / "batches" / f"{uuid.uuid4().hex}.json"
+    batch.write_text(json.dumps([event.get("IFACE") for event in events]))
+
+
+cli.handle_dispatcher_events = handle_dispatcher_events
+cli.dispatcher_routable_hook()
+"""
+
+
+def test_burst_is_coalesced(tmp_path: Path):
+    (tmp_path / "batches").mkdir()
+    ifaces = [f"eth{i}" for i in range(8)]
+
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-c", HOOK, str(tmp_path)],
+            cwd=Path(__file__).parents[1],
+            env={**os.environ, "IFACE": iface, "STATE": "routable"},
+            stdout=subprocess.DEVNULL,
+        )
+        for iface in ifaces
+    ]
+    for process in processes:
+        assert process.wait(timeout=30) == 0
+
+    batches = [json.loads(path.read_text()) for path in (tmp_path / "batches").iterdir()]
+    # 每个事件只处理一次，一批中包含多个事件
+    assert sorted(iface for batch in batches for iface in batch) == ifaces
+    assert len(batches) < len(ifaces)
+    assert not list((tmp_path / "dispatcher-events").glob("*.json"))
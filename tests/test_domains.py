@@ -0,0 +1,53 @@
+from pathlib import Path
+
+import pytest
+
+from xrouter.utils.domains import DomainTrie, parse_server_domains, server_lines
+
+UPSTREAMS = ["114.114.114.114", "223.5.5.5"]
+
+
+@pytest.fixture
+def china_list(tmp_path: Path) -> Path:
+    """
+    dnsmasq-china-list 格式的列表：有重复的条目、大小写不同的条目，以及已经被上级域名覆盖的子域名
+    """
+    lines = ["# comment\n"]
+    for i in range(2000):
+        lines.append(f"server=/site{i}.cn/114.114.114.114\n")
+        lines.append(f"server=/www.site{i}.cn/114.114.114.114\n")
+        if i % 10 == 0:
+            lines.append(f"server=/SITE{i}.cn/114.114.114.114\n")
+            lines.append(f"server=/cdn.static.site{i}.cn/114.114.114.114\n")
+
+    path = tmp_path / "accelerated-domains.china.conf"
+    path.write_text("".join(lines))
+    return path
+
+
+def legacy_lines(path: Path) -> list[str]:
+    """
+    旧版本的输出：每个上游一个文件，每个条目一行
+    """
+    domains = [domain for domain, _ in parse_server_domains(path.read_text().splitlines())]
+    return [f"server=/{domain}/{upstream}\n" for upstream in UPSTREAMS for domain in domains]
+
+
+def compiled_lines(path: Path) -> list[str]:
+    trie = DomainTrie()
+    for domain, _ in parse_server_domains(path.read_text().splitlines()):
+        trie.add(domain)
+    return list(server_lines(list(trie), UPSTREAMS))
+
+
+def test_compile_reduces_lines(china_list: Path):
+    before = legacy_lines(china_list)
+    after = compiled_lines(china_list)
+    print(f"\nserver lines: {len(before)} -> {len(after)}")
+
+    assert len(after) < len(before)
+    # 每个上游都覆盖全部去重之后的域名
+    for upstream in UPSTREAMS:
+        domains = {domain for domain, line_upstream in parse_server_domains(after) if line_upstream == upstream}
+        assert len(domains) == 2000
+        assert "site0.cn" in domains and "www.site0.cn" not in domains
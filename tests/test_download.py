@@ -0,0 +1,91 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+from xrouter.utils.download import HttpCache, download_many
+
+# 每个请求的处理时间，用于判断多个 url 是否并发下载
+DELAY = 0.3
+
+
+class Handler(BaseHTTPRequestHandler):
+    requests: list[tuple[str, str | None]] = []
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get("If-None-Match")))
+        time.sleep(DELAY)
+
+        if self.path == "/broken":
+            self.send_error(500)
+            return
+
+        etag = f'"{self.path}-v1"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        body = f"content of {self.path}\n".encode()
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    Handler.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_concurrent_with_failure(server: str):
+    urls = [f"{server}/list{i}" for i in range(4)] + [f"{server}/broken"]
+
+    start = time.monotonic()
+    downloads = download_many(urls)
+    elapsed = time.monotonic() - start
+
+    # 串行下载至少需要 5 * DELAY
+    assert elapsed < 2 * DELAY
+    assert downloads[f"{server}/broken"].error is not None
+    for i in range(4):
+        download = downloads[f"{server}/list{i}"]
+        assert download.error is None
+        assert download.content == f"content of /list{i}\n"
+
+
+def test_etag_not_modified(server: str, tmp_path: Path):
+    url = f"{server}/list"
+    output = tmp_path / "list.txt"
+    cache = HttpCache(tmp_path / ".http-cache.json")
+
+    download = download_many([url], cache=cache)[url]
+    assert download.etag == '"/list-v1"'
+    output.write_text(download.content)
+    cache.update(download, [output])
+    cache.save()
+
+    # 重新加载缓存，第二次请求带上 If-None-Match，服务端返回 304
+    cache = HttpCache(tmp_path / ".http-cache.json")
+    download = download_many([url], cache=cache)[url]
+    assert download.not_modified
+    assert download.content is None
+    assert Handler.requests == [("/list", None), ("/list", '"/list-v1"')]
+
+    # 输出文件不存在时不发送条件请求
+    output.unlink()
+    download = download_many([url], cache=cache)[url]
+    assert not download.not_modified
+    assert Handler.requests[-1] == ("/list", None)
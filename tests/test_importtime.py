@@ -0,0 +1,151 @@
+"""
+用 `python -X importtime` 执行 CLI 命令，检查启动路径的导入：
+
+* 不能加载 HEAVY_MODULES 中的任何一个
+* 命令加载的所有模块（不包括解释器启动时就加载的模块）的累计导入时间不超过预算
+
+命令通过 `xrouter.cli:app` 真实执行，函数内的延迟导入也会被统计。配置为空的 xrouter.yml，gw 的所有目录指向临时目录，
+只替换掉会改动系统的部分：下发 netlink 请求（NetlinkBatch.commit）、执行外部命令（GwLib.run_command），
+以及非 root 时的 sudo（run_as_root）。每个命令先执行一次生成配置快照，第二次的结果才计入。
+
+导入时间和机器速度有关，所以不放在 lint.sh 中：Scenario.budget 是预期的上限，断言时再乘以 BUDGET_MARGIN
+（默认 2，可以用环境变量 XROUTER_IMPORTTIME_MARGIN 修改），只用来发现数量级的退化，不是精确的性能测试。
+HEAVY_MODULES 的检查与机器无关，总是严格执行。
+
+    pytest -s tests/test_importtime.py                                # 输出每个命令的导入时间
+    XROUTER_IMPORTTIME_MARGIN=4 pytest tests/test_importtime.py       # 在较慢的机器上放宽预算
+"""
+
+import os
+import subprocess
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+import pytest
+
+HEAVY_MODULES = ("IPython", "jinja2", "httpx", "netaddr")
+
+BUDGET_MARGIN = float(os.environ.get("XROUTER_IMPORTTIME_MARGIN", "2"))
+
+# argv[1] 为临时目录，其余参数为命令行
+DRIVER = """
+import dataclasses
+import sys
+from pathlib import Path
+
+from xrouter.cli import daemon
+from xrouter.gwlib import gw
+from xrouter.gwlib.gwlib import GwLib
+from xrouter.utils import netlink, run_as_root
+
+root = Path(sys.argv[1])
+for field in dataclasses.fields(gw):
+    if isinstance(getattr(gw, field.name), Path):
+        setattr(gw, field.name, root / field.name)
+gw.dispatcher_debounce = 0
+
+daemon.SOCKET_NAME = "\\0xrouterd-importtime-check"
+run_as_root.run_as_root = lambda: None
+netlink.NetlinkBatch.commit = lambda self: []
+GwLib.run_command = lambda self, command, stream=False, reads_files=True: self.print(f"> {command} (skipped)")
+
+sys.argv = ["gw", *sys.argv[2:]]
+
+from xrouter.cli import app
+
+app()
+"""
+
+
+@dataclass
+class Scenario:
+    name: str
+    argv: list[str]
+    # 毫秒
+    budget: float
+
+
+SCENARIOS = [
+    Scenario("dispatcher-routable-hook", ["dispatcher-routable-hook"], 300),
+    Scenario("system-startup", ["system-startup"], 300),
+]
+
+
+def parse_import_times(output: str) -> dict[str, tuple[int, int]]:
+    """
+    解析 -X importtime 的输出，返回 {module: (depth, cumulative_us)}，depth 为 0 的是不被其他模块嵌套导入的模块
+    """
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # import time:   self |  cumulative |   name，name 前的缩进表示嵌套层级
+        _, cumulative, name = line.split("|")
+        indent = len(name) - len(name.lstrip())
+        times[name.strip()] = ((indent - 1) // 2, int(cumulative))
+
+    return times
+
+
+@pytest.fixture(scope="module")
+def startup_modules() -> set[str]:
+    """
+    解释器启动时（site 等）加载的模块，不计入命令的导入时间
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "pass"], capture_output=True, text=True, check=True
+    )
+    return set(parse_import_times(result.stderr))
+
+
+@pytest.fixture(scope="module")
+def root(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    root = tmp_path_factory.mktemp("importtime")
+
+    config_root = root / "config_root"
+    config_root.mkdir()
+    (config_root / "xrouter.yml").write_text("{}\n")
+
+    # 已经生成过防火墙脚本，开机和 hook 只重新执行它，不渲染模板
+    bin_root = root / "bin_root"
+    bin_root.mkdir()
+    (bin_root / "setup-firewall.nft").write_text("#!/usr/sbin/nft -f\n")
+    (bin_root / "setup-firewall.nft").chmod(0o755)
+
+    # `nft list table inet firewall` 成功：规则已经加载，hook 不重新加载防火墙，这是接口 up 时最常见的路径
+    path_root = root / "path"
+    path_root.mkdir()
+    (path_root / "nft").write_text("#!/bin/sh\nexit 0\n")
+    (path_root / "nft").chmod(0o755)
+
+    return root
+
+
+def run_command(root: Path, argv: list[str]) -> dict[str, tuple[int, int]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", DRIVER, str(root), *argv],
+        capture_output=True,
+        text=True,
+        check=False,
+        cwd=Path(__file__).parents[1],
+        env={**os.environ, "PATH": f"{root / 'path'}:{os.environ.get('PATH', '')}"},
+    )
+    if result.returncode != 0:
+        stderr = "".join(line for line in result.stderr.splitlines(True) if not line.startswith("import time:"))
+        raise RuntimeError(f"gw {' '.join(argv)} exited with {result.returncode}:\n{result.stdout}{stderr}")
+
+    return parse_import_times(result.stderr)
+
+
+@pytest.mark.parametrize("scenario", SCENARIOS, ids=lambda scenario: scenario.name)
+def test_import_time(scenario: Scenario, root: Path, startup_modules: set[str]):
+    run_command(root, scenario.argv)
+    times = run_command(root, scenario.argv)
+
+    total = sum(us for name, (depth, us) in times.items() if depth == 0 and name not in startup_modules) / 1000
+    budget = scenario.budget * BUDGET_MARGIN
+    print(f"\n{scenario.name}: {total:.1f}ms (budget {budget:g}ms)")
+
+    assert not sorted({name.split(".")[0] for name in times} & set(HEAVY_MODULES))
+    assert total <= budget
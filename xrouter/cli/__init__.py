@@ -1,10 +1,11 @@
 from typing import Annotated
 
-import sh
 import typer
-from rich import print
 
+from .backups import app as app_backups
+from .dhcp import app as app_dhcp
 from .fetch import app as app_fetch
+from .gateways import app as app_gateways
 from .reload import app as app_reload
 from .setup import app as app_setup
 
@@ -14,19 +15,31 @@ app = typer.Typer(no_args_is_help=True)
 @app.callback()
 def global_options(
     verbose: Annotated[bool | None, typer.Option("--verbose/--silent")] = None,
+    max_diff_lines: Annotated[
+        int | None, typer.Option(help="Summarize file diffs longer than this many lines, 0 for no limit")
+    ] = None,
 ):
     from xrouter.gwlib import gw
     from xrouter.utils.run_as_root import run_as_root
 
+    from . import daemon
+
     run_as_root()
 
-    if verbose is not None:
+    # xrouterd 中日志由 daemon 统一配置
+    if verbose is not None and not daemon.serving:
         gw.setup(verbose=verbose)
 
+    if max_diff_lines is not None:
+        gw.max_diff_lines = max_diff_lines
+
 
 app.add_typer(app_setup, name="setup")
 app.add_typer(app_reload, name="reload")
 app.add_typer(app_fetch, name="fetch")
+app.add_typer(app_backups, name="backups")
+app.add_typer(app_gateways, name="gateways")
+app.add_typer(app_dhcp, name="dhcp-hosts")
 
 
 @app.command("shell")
@@ -42,6 +55,8 @@ def start_shell():
 
 @app.command("print-config")
 def print_config():
+    from rich import print
+
     from xrouter.gwlib import gw
 
     print(gw.config)
@@ -51,6 +66,9 @@ def print_config():
 def fix_perms():
     import os
 
+    import sh
+    from rich import print
+
     from xrouter.gwlib import gw
 
     sudo_user = os.environ.get("SUDO_USER")
@@ -62,37 +80,113 @@ def fix_perms():
     gw.run_command(sh.chown.bake("-R", f"{sudo_user}", gw.config_root))
 
 
+def apply_firewall():
+    """
+    开机和接口 up 时只需要重新执行已经生成的 nft 脚本，不需要重新渲染模板（避免加载 jinja2），
+    脚本不存在时（还没有运行过 `gw setup firewall`）才完整 setup 一次
+    """
+    from xrouter.gwlib import gw
+
+    from .reload import reload_firewall
+    from .setup import setup_firewall
+
+    if (gw.bin_root / "setup-firewall.nft").exists():
+        reload_firewall()
+    else:
+        setup_firewall()
+
+
 @app.command("system-startup")
 def system_startup_script():
+    """
+    开机时由 startup-xrouter.service 调用，依次执行路由、防火墙。网关接口之后才 up 的路由由 dispatcher hook 处理。
+
+    容器由 systemd 启动：unit 中排在这个服务（防火墙脚本会 flush ruleset，清掉 podman 添加的规则）和所在的 bridge 之后，
+    互不依赖的容器并发启动，见 container/podman-container.service。
+    开机的关键路径用 `systemd-analyze critical-chain container-NAME.service` 查看
+    """
     from xrouter.gwlib import gw
 
-    from .setup import setup_firewall, setup_route
+    from .setup import setup_route
 
     gw.print("==== invoked by system startup script ====")
 
     setup_route()
-    setup_firewall()
+    apply_firewall()
+
+
+@app.command("daemon")
+def run_daemon():
+    """
+    运行 xrouterd，部分命令（dispatcher-routable-hook、setup/reload route、reload firewall）会转发给它执行
+    """
+    from .daemon import serve
+
+    serve()
+
+
+DISPATCHER_ENV_NAMES = ("IFACE", "STATE", "ADDR", "IP_ADDRS", "IP6_ADDRS", "AdministrativeState", "OperationalState")
 
 
 @app.command("dispatcher-routable-hook")
 def dispatcher_routable_hook():
+    """
+    networkd-dispatcher 的 routable hook，每个接口变为 routable 时调用一次。
+
+    开机或者链路抖动时会短时间内连续调用多次，这里先把事件写入队列，由拿到锁的进程等待
+    gw.dispatcher_debounce 秒内没有新事件之后，一次性处理队列中的所有事件，其他进程写入事件后直接退出。
+    """
     import os
 
     from xrouter.gwlib import gw
+    from xrouter.utils.single_instance import try_lock
 
-    from .setup import setup_firewall, setup_route
+    from . import daemon
 
-    gw.print("==== invoked by networkd-dispatcher routable hook ====")
-    gw.print("==== BEGIN INFO ====")
-    for env in ["IFACE", "STATE", "ADDR", "IP_ADDRS", "IP6_ADDRS", "AdministrativeState", "OperationalState"]:
-        gw.print(f"{env}: {os.environ.get(env)}")
-    gw.print("==== END INFO ====")
+    # 转发给 xrouterd 之前写入事件，daemon 串行处理请求，排队中的请求的事件也能在同一批中处理
+    if not daemon.serving:
+        gw.dispatcher_queue.put({env: os.environ.get(env) for env in DISPATCHER_ENV_NAMES})
+        daemon.forward_to_daemon("dispatcher-routable-hook", env_names=DISPATCHER_ENV_NAMES)
 
-    iface_name = os.environ.get("IFACE")
-    iface = gw.config.all_interfaces.get(iface_name)
-    if iface:
-        gw.print("Calling iface up hook...")
-        iface.up_hook()
+    # 释放锁之后再检查一次队列，处理期间写入、但写入者没有拿到锁的事件
+    while gw.dispatcher_queue.pending():
+        lock = try_lock("xrouter-dispatcher-routable-hook")
+        if lock is None:
+            gw.print("Another hook is running, event queued")
+            return
 
-    setup_route()
-    setup_firewall()
+        with lock:
+            gw.dispatcher_queue.wait_quiet(gw.dispatcher_debounce, gw.dispatcher_max_wait)
+            handle_dispatcher_events(gw.dispatcher_queue.drain())
+
+
+def handle_dispatcher_events(events: list[dict]):
+    """
+    一批 routable 事件只处理一次：每个接口的 up hook 执行一次，
+    只同步依赖变化的接口的路由，防火墙在最后重新加载一次。
+    """
+    from xrouter.gwlib import gw
+
+    from .setup import setup_route
+
+    gw.print(f"==== invoked by networkd-dispatcher routable hook, {len(events)} events ====")
+    for event in events:
+        gw.print("==== BEGIN INFO ====")
+        for env in DISPATCHER_ENV_NAMES:
+            gw.print(f"{env}: {event.get(env)}")
+        gw.print("==== END INFO ====")
+
+    # 去重，保持顺序
+    iface_names = list(dict.fromkeys(event.get("IFACE") for event in events))
+
+    for iface_name in iface_names:
+        iface = gw.config.all_interfaces.get(iface_name) if iface_name else None
+        if iface:
+            gw.print(f"Calling iface up hook: {iface_name}")
+            iface.up_hook()
+
+    # 只同步依赖这些接口的路由和规则，没有 IFACE（例如手动执行）时完整同步
+    names = [name for name in iface_names if name]
+    setup_route(interfaces=names if len(names) == len(iface_names) else None)
+
+    apply_firewall()
@@ -0,0 +1,105 @@
+from typing import Annotated
+
+import typer
+
+app = typer.Typer(
+    no_args_is_help=True,
+    help="Manage backups of overwritten files",
+)
+
+
+def load_run(run_id: str):
+    from xrouter.gwlib import gw
+
+    run = gw.backup_store.load(run_id)
+    if run is None:
+        gw.print(f"Backup run not found: {run_id}")
+        raise typer.Exit(1)
+
+    return run
+
+
+def select_files(run, files: list[str] | None) -> list[str]:
+    from xrouter.gwlib import gw
+
+    if not files:
+        return list(run.files)
+
+    missing = [file for file in files if file not in run.files]
+    if missing:
+        gw.print(f"Not in backup run {run.run_id}: {', '.join(missing)}")
+        raise typer.Exit(1)
+
+    return files
+
+
+@app.command("list")
+def list_backups(run_id: Annotated[str | None, typer.Argument(help="Show files of this run")] = None):
+    from rich import print
+
+    from xrouter.gwlib import gw
+
+    if run_id:
+        run = load_run(run_id)
+        for path, entry in sorted(run.files.items()):
+            print(f"{entry['mode']} {entry['sha256'][:12]} {path}")
+        return
+
+    for run in gw.backup_store.runs():
+        print(f"{run.run_id}  {len(run.files):4d} files  {' '.join(run.argv[1:])}")
+
+
+@app.command("diff")
+def diff_backup(run_id: str, files: Annotated[list[str] | None, typer.Argument()] = None):
+    """
+    对比备份的文件和当前的文件
+    """
+    from pathlib import Path
+
+    from xrouter.gwlib import gw
+    from xrouter.gwlib.gwlib import format_text_diff
+
+    run = load_run(run_id)
+    for file in select_files(run, files):
+        path = Path(file)
+        backup = gw.backup_store.blob_path(run.files[file]["sha256"]).read_bytes()
+        current = path.read_bytes() if path.exists() else b""
+        if backup == current:
+            continue
+
+        try:
+            diff = format_text_diff(path, backup.decode(), current.decode(), gw.max_diff_lines, ("backup", "current"))
+        except UnicodeDecodeError:
+            diff = f"Binary files {path} differ\n"
+        gw.print(diff)
+
+
+@app.command("restore")
+def restore_backup(run_id: str, files: Annotated[list[str] | None, typer.Argument()] = None):
+    """
+    恢复备份的文件（内容和权限），被覆盖的当前文件同样会被备份，可以再次恢复
+    """
+    from pathlib import Path
+
+    from xrouter.gwlib import gw
+
+    run = load_run(run_id)
+    with gw.install_transaction():
+        for file in select_files(run, files):
+            entry = run.files[file]
+            content = gw.backup_store.blob_path(entry["sha256"]).read_bytes()
+            try:
+                gw.install_text_file(Path(file), content.decode(), entry["mode"])
+            except UnicodeDecodeError:
+                gw.install_binary_file(Path(file), content, entry["mode"])
+
+
+@app.command("gc")
+def gc_backups(
+    keep: Annotated[int | None, typer.Option(help="Keep this many most recent runs, 0 for no limit")] = None,
+    days: Annotated[int, typer.Option(help="Also remove runs older than this many days, 0 to disable")] = 0,
+):
+    from xrouter.gwlib import gw
+
+    runs, blobs = gw.backup_store.gc(keep, days)
+    gw.print(f"Removed {runs} runs, {blobs} blobs")
@@ -0,0 +1,266 @@
+import json
+import logging
+import socket
+
+import typer
+
+# abstract unix socket，与 utils/single_instance.py 相同，不需要在文件系统中创建 socket 文件，进程退出后自动释放
+SOCKET_NAME = "\0xrouterd"
+
+# 只有这些命令会转发给 daemon，daemon 也只执行这些命令（见 forward_to_daemon 的调用方）
+FORWARDED_COMMANDS = (
+    ("dispatcher-routable-hook",),
+    ("setup", "route"),
+    ("reload", "route"),
+    ("reload", "firewall"),
+)
+
+# 客户端连接后必须在这个时间内发送请求，每次向客户端写日志也不能阻塞超过这个时间
+REQUEST_TIMEOUT = 5.0
+MAX_REQUEST_SIZE = 64 * 1024
+
+# 需要额外取值的全局选项，解析命令行时跳过它们的值
+GLOBAL_OPTIONS_WITH_VALUE = ("--max-diff-lines",)
+
+# 在 daemon 进程中执行命令时为 True，此时不再转发
+serving = False
+
+
+def command_words(argv: list[str]) -> list[str]:
+    """
+    命令行中的子命令部分，如 `gw --silent setup route --full` 返回 ["setup", "route"]
+    """
+    words = []
+    args = iter(argv)
+    for arg in args:
+        if arg in GLOBAL_OPTIONS_WITH_VALUE:
+            next(args, None)
+        elif not arg.startswith("-"):
+            words.append(arg)
+    return words
+
+
+def forward_to_daemon(*command: str, env_names: tuple[str, ...] = ()):
+    """
+    xrouterd 在运行时，将当前命令行转发给 daemon 执行，输出 daemon 返回的日志，并以 daemon 返回的状态码退出。
+    daemon 没有运行时直接返回，由调用方在本进程中执行。
+
+    command 为调用方自己的子命令，只有命令行调用的正是这个命令时才转发，
+    被其他命令在进程内调用时（如 `gw setup network` 调用 setup_route）不转发。
+
+    env_names 为命令需要的环境变量（如 networkd-dispatcher 设置的 IFACE），一并转发。
+    """
+    import os
+    import sys
+
+    if serving or command_words(sys.argv[1:])[: len(command)] != list(command):
+        return
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(SOCKET_NAME)
+    except OSError:
+        sock.close()
+        return
+
+    request = {"argv": sys.argv[1:], "env": {name: os.environ[name] for name in env_names if name in os.environ}}
+    code = 1
+    with sock, sock.makefile("rwb") as fp:
+        fp.write(json.dumps(request).encode() + b"\n")
+        fp.flush()
+
+        for line in fp:
+            message = json.loads(line)
+            if "exit" in message:
+                code = message["exit"]
+                break
+            print(message["log"], file=sys.stderr if message["level"] >= logging.WARNING else sys.stdout, flush=True)
+
+    raise typer.Exit(code)
+
+
+class ClientLogHandler(logging.Handler):
+    """
+    将 gw.logger 的日志转发给当前客户端，客户端断开时忽略
+    """
+
+    def __init__(self, fp):
+        super().__init__()
+        self.fp = fp
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            message = {"log": self.format(record), "level": record.levelno}
+            self.fp.write(json.dumps(message, ensure_ascii=False).encode() + b"\n")
+            self.fp.flush()
+        except OSError:
+            pass
+
+
+def serve():
+    """
+    xrouterd 主循环。
+
+    gw 对象的 config、jinja2 环境、zone 解析结果都保存在内存中，配置文件变化时重新加载 config。
+    请求逐个执行，同时到达的请求（例如链路抖动时 networkd-dispatcher 的一串事件）排队，不会并发修改系统状态。
+
+    协议：客户端发送一行 JSON {"argv": [...], "env": {...}}，daemon 返回若干行 {"log": ..., "level": ...}，
+    最后一行为 {"exit": code}。
+
+    xrouterd 以 root 运行，只接受 root 的连接（SO_PEERCRED），只执行 FORWARDED_COMMANDS，
+    env 中只接受 DISPATCHER_ENV_NAMES，见 handle_connection。
+    """
+    from typer.main import get_command
+
+    from xrouter.gwlib import gw
+
+    from . import app
+
+    global serving
+    serving = True
+
+    command = get_command(app)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        server.bind(SOCKET_NAME)
+    except OSError as e:
+        gw.logger.error(f"Failed to listen on @{SOCKET_NAME[1:]}: {e}, is xrouterd already running?")
+        raise typer.Exit(1)
+    server.listen(64)
+
+    # 预先加载，第一个请求不需要再等待
+    config_stat = stat_config()
+    gw.config
+    gw.jinja2_env
+
+    gw.print(f"xrouterd listening on @{SOCKET_NAME[1:]}")
+
+    while True:
+        conn, _ = server.accept()
+
+        # 配置文件变化后，下次访问 gw.config 时重新加载
+        if stat_config() != config_stat:
+            config_stat = stat_config()
+            try:
+                del gw.config
+            except AttributeError:
+                pass
+
+        with conn:
+            try:
+                handle_connection(command, conn)
+            except OSError as e:
+                # 关闭连接时 flush 剩余的输出失败（客户端已经断开或者不再读取）
+                gw.logger.warning(f"Client connection error: {e}")
+
+
+def handle_connection(command, conn: socket.socket):
+    """
+    处理一个客户端连接，客户端的任何错误（超时、断开、格式错误、不允许的命令）都只拒绝这个请求，不影响 daemon
+    """
+    from xrouter.gwlib import gw
+
+    conn.settimeout(REQUEST_TIMEOUT)
+    with conn.makefile("rwb") as fp:
+        try:
+            uid = peer_uid(conn)
+            if uid != 0:
+                raise PermissionError(f"uid {uid} is not allowed, xrouterd only accepts requests from root")
+            argv, env = parse_request(fp.readline(MAX_REQUEST_SIZE))
+        except (OSError, ValueError) as e:
+            gw.logger.warning(f"Rejected request: {e}")
+            reply(fp, {"log": f"xrouterd rejected the request: {e}", "level": logging.ERROR})
+            reply(fp, {"exit": 1})
+            return
+
+        reply(fp, {"exit": run_request(command, argv, env, fp)})
+
+
+def peer_uid(conn: socket.socket) -> int:
+    """
+    abstract socket 没有文件权限，任何本地用户都可以连接，用 SO_PEERCRED 取得对端进程的 uid
+    """
+    import struct
+
+    creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    _pid, uid, _gid = struct.unpack("3i", creds)
+    return uid
+
+
+def parse_request(line: bytes) -> tuple[list[str], dict[str, str]]:
+    """
+    校验请求，返回 (argv, env)：命令必须是 FORWARDED_COMMANDS 之一，env 中只保留 DISPATCHER_ENV_NAMES
+    """
+    from . import DISPATCHER_ENV_NAMES
+
+    if not line.endswith(b"\n"):
+        raise ValueError("incomplete or oversized request")
+
+    request = json.loads(line)
+    if not isinstance(request, dict):
+        raise ValueError("request must be a JSON object")
+
+    argv = request.get("argv")
+    if not isinstance(argv, list) or not all(isinstance(arg, str) for arg in argv):
+        raise ValueError("argv must be a list of strings")
+
+    env = request.get("env", {})
+    if not isinstance(env, dict) or not all(isinstance(value, str) for value in env.values()):
+        raise ValueError("env must be an object of strings")
+
+    words = command_words(argv)
+    if not any(words[: len(forwarded)] == list(forwarded) for forwarded in FORWARDED_COMMANDS):
+        raise ValueError(f"command not allowed: {' '.join(words) or '(none)'}")
+
+    return argv, {name: value for name, value in env.items() if name in DISPATCHER_ENV_NAMES}
+
+
+def reply(fp, message: dict):
+    try:
+        fp.write(json.dumps(message, ensure_ascii=False).encode() + b"\n")
+        fp.flush()
+    except OSError:
+        pass
+
+
+def run_request(command, argv: list[str], env: dict[str, str], fp) -> int:
+    import os
+    import traceback
+
+    from xrouter.gwlib import gw
+
+    handler = ClientLogHandler(fp)
+    gw.logger.addHandler(handler)
+    saved_env = {name: os.environ.get(name) for name in env}
+    os.environ.update(env)
+    # 全局选项（如 --max-diff-lines）会修改 gw，只对这个请求生效
+    saved_max_diff_lines = gw.max_diff_lines
+    try:
+        code = command.main(args=argv, prog_name="gw", standalone_mode=False)
+        return code if isinstance(code, int) else 0
+    except typer.Exit as e:
+        return e.exit_code
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else 1
+    except Exception:
+        gw.logger.error(traceback.format_exc())
+        return 1
+    finally:
+        gw.logger.removeHandler(handler)
+        gw.max_diff_lines = saved_max_diff_lines
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def stat_config() -> tuple[int, int] | None:
+    from xrouter.gwlib import gw
+
+    try:
+        stat = gw.xrouter_config_file.stat()
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
@@ -0,0 +1,140 @@
+from enum import Enum
+from pathlib import Path
+from typing import Annotated
+
+import typer
+
+app = typer.Typer(
+    no_args_is_help=True,
+    help="Manage DHCP reservations",
+)
+
+
+class ImportFormat(str, Enum):
+    csv = "csv"
+    leases = "leases"
+
+
+class ExportFormat(str, Enum):
+    csv = "csv"
+    hostsfile = "hostsfile"
+
+
+def report_errors(index) -> bool:
+    """
+    输出冲突和警告，没有冲突时返回 True
+    """
+    from xrouter.gwlib import gw
+
+    for error in index.errors:
+        gw.logger.error(error)
+    for warning in index.warnings:
+        gw.logger.warning(warning)
+
+    return not index.errors
+
+
+@app.command("check")
+def check_hosts():
+    """
+    检查所有预留：重复的 MAC、重复的地址为冲突，不在任何 dhcp range 网段中的地址为警告
+    """
+    from xrouter.gwlib import gw
+
+    index = gw.config.dnsmasq.dhcp.reservations()
+    gw.print(f"{len(index.hosts)} DHCP reservations, {len(index.errors)} conflicts, {len(index.warnings)} warnings")
+    if not report_errors(index):
+        raise typer.Exit(1)
+
+
+@app.command("import")
+def import_hosts(
+    file: Path,
+    format: Annotated[ImportFormat | None, typer.Option(help="Default: leases for *.leases, otherwise csv")] = None,
+    replace: Annotated[bool, typer.Option(help="Replace all imported reservations instead of merging")] = False,
+    reload: Annotated[bool, typer.Option(help="Apply to dnsmasq after importing")] = True,
+):
+    """
+    从 CSV（mac,ip,hostname）或 dnsmasq lease 文件批量导入预留，保存到 gw.dhcp_reservations_file。
+
+    默认合并：与导入条目 MAC 或地址相同的旧条目被替换。合并后有冲突时不保存。
+    """
+    from xrouter.gwlib import gw
+    from xrouter.gwlib.config.dnsmasq import hosts_from_rows
+    from xrouter.utils.dhcp_hosts import csv_lines, normalize_mac, read_csv, read_leases
+
+    if format is None:
+        format = ImportFormat.leases if file.suffix == ".leases" else ImportFormat.csv
+
+    rows = read_leases(file) if format == ImportFormat.leases else read_csv(file)
+    imported = hosts_from_rows(rows, str(file))
+
+    dhcp = gw.config.dnsmasq.dhcp
+    bulk_hosts = []
+    if not replace:
+        macs = {normalize_mac(host.mac) for host in imported if host.mac}
+        ips = {host.ip for host in imported}
+        bulk_hosts = [
+            host
+            for host in dhcp.bulk_hosts()
+            if not (host.mac and normalize_mac(host.mac) in macs) and host.ip not in ips
+        ]
+    bulk_hosts.extend(imported)
+
+    index = dhcp.reservations(bulk_hosts)
+    if not report_errors(index):
+        gw.print(f"{len(index.errors)} conflicts, nothing imported")
+        raise typer.Exit(1)
+
+    gw.print(f"Imported {len(imported)} reservations, {len(bulk_hosts)} in {gw.dhcp_reservations_file}")
+    gw.install_stream_file(gw.dhcp_reservations_file, csv_lines(bulk_hosts))
+
+    if reload:
+        reload_hosts()
+
+
+@app.command("export")
+def export_hosts(
+    output: Annotated[Path | None, typer.Option("--output", "-o", help="Default: stdout")] = None,
+    format: ExportFormat = ExportFormat.csv,
+):
+    """
+    导出所有预留（包括 xrouter.yml 中的 hosts）
+    """
+    import sys
+
+    from xrouter.gwlib import gw
+    from xrouter.utils.dhcp_hosts import csv_lines
+
+    index = gw.config.dnsmasq.dhcp.reservations()
+    report_errors(index)
+
+    if format == ExportFormat.csv:
+        lines = csv_lines(index.hosts)
+    else:
+        lines = (f"{host.hostsfile_line}\n" for host in index.hosts)
+
+    if output is None:
+        sys.stdout.writelines(lines)
+    else:
+        with output.open("w", encoding="utf8") as fp:
+            fp.writelines(lines)
+
+
+@app.command("reload")
+def reload_hosts():
+    """
+    重新生成 dhcp-hostsfile，有变化时向 dnsmasq 发送 SIGHUP，不需要重启 dnsmasq
+    """
+    import sh
+
+    from xrouter.gwlib import gw
+
+    try:
+        changed = gw.config.dnsmasq.dhcp.install_hostsfile()
+    except ValueError as e:
+        gw.logger.error(e)
+        raise typer.Exit(1)
+
+    if changed:
+        gw.run_command(sh.systemctl.bake("kill", "--kill-whom=main", "--signal=HUP", "dnsmasq"))
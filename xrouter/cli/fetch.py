@@ -8,226 +8,89 @@ app = typer.Typer(
 )
 
 
-@app.command("china-ips")
-def fetch_china_ips():
-    from xrouter.gwlib import gw
-    from xrouter.utils.download import download_text
-
-    for file in [
-        "china",
-        "china6",
-        # 电信
-        "chinanet",
-        "chinanet6",
-        # 移动
-        "cmcc",
-        "cmcc6",
-        # 科技网
-        "cstnet",
-        "cstnet6",
-        # 鹏博士
-        "drpeng",
-        "drpeng6",
-        # 谷歌中国
-        "googlecn",
-        "googlecn6",
-        # 教育网
-        "cernet",
-        "cernet6",
-        # 联通
-        "unicom",
-        "unicom6",
-    ]:
-        url = f"https://raw.githubusercontent.com/gaoyifan/china-operator-ip/refs/heads/ip-lists/{file}.txt"
-        path = gw.zones_root / f"{file}.txt"
-
-        gw.print(f"Downloading {url} ...")
-        content = download_text(url, "text")
-
-        gw.print(f"Saving to {path} ...")
-        gw.install_text_file(path, content, show_diff=False)
-
-
-@app.command("github-ips")
-def fetch_github_ips():
-    from xrouter.gwlib import gw
-    from xrouter.utils.cidr import merge_cidr_list_split_version, safe_parse_cidr
-    from xrouter.utils.download import download_text
-
-    content = download_text(
-        "https://api.github.com/meta",
-        "json",
-    )
+def fetch_group(group: str, show_diff: bool = False) -> set[str]:
+    from xrouter.utils.sources import SOURCES, fetch_sources
 
-    # extract all ipv4 and ipv6 addresses from json
-    cidrs_all = []
+    return fetch_sources([source for source in SOURCES if source.group == group], show_diff=show_diff)
 
-    # Process each service in the JSON
-    for service_name, networks in content.items():
-        if isinstance(networks, list):
-            for network in networks:
-                cidr = safe_parse_cidr(network)
-                if cidr:
-                    cidrs_all.append(cidr)
 
-    cidrs_v4, cidrs_v6 = merge_cidr_list_split_version(cidrs_all)
+@app.command("all")
+def fetch_all(
+    show_diff: Annotated[bool, typer.Option("--show-diff", help="Show diff")] = False,
+    reload: Annotated[bool, typer.Option(help="Reload route/dnsmasq if any output changed")] = True,
+):
+    """
+    并发拉取所有列表，只在输出文件有变化时重新加载路由/dnsmasq，适合放在 cron 中定期执行
+    """
+    from xrouter.gwlib import gw
+    from xrouter.utils.sources import SOURCES, fetch_sources
 
-    # Save IPv4 networks
-    ipv4_path = gw.zones_root / "github-ipv4.txt"
-    ipv4_content = "\n".join(cidrs_v4) + "\n"
-    gw.print(f"Saving {len(cidrs_v4)} IPv4 networks to {ipv4_path} ...")
-    gw.install_text_file(ipv4_path, ipv4_content, show_diff=False)
+    reloads = fetch_sources(SOURCES, show_diff=show_diff)
+    if not reloads:
+        gw.print("Nothing changed")
+        return
 
-    # Save IPv6 networks
-    ipv6_path = gw.zones_root / "github-ipv6.txt"
-    ipv6_content = "\n".join(cidrs_v6) + "\n"
-    gw.print(f"Saving {len(cidrs_v6)} IPv6 networks to {ipv6_path} ...")
-    gw.install_text_file(ipv6_path, ipv6_content, show_diff=False)
+    if not reload:
+        gw.print(f"Changed: {', '.join(sorted(reloads))}, skip reload")
+        return
 
+    from .reload import reload_dnsmasq, reload_route
 
-@app.command("google-ips")
-def fetch_google_ips():
-    from xrouter.gwlib import gw
-    from xrouter.utils.cidr import merge_cidr_list_split_version
-    from xrouter.utils.download import download_text
+    if "route" in reloads:
+        reload_route()
+    if "dnsmasq" in reloads:
+        reload_dnsmasq()
 
-    content = download_text(
-        "https://www.gstatic.com/ipranges/goog.json",
-        "json",
-    )
 
-    cidrs_all = []
+@app.command("china-ips")
+def fetch_china_ips():
+    fetch_group("china-ips")
 
-    for prefixes in content.get("prefixes", []):
-        if "ipv4Prefix" in prefixes:
-            cidrs_all.append(prefixes["ipv4Prefix"])
-        elif "ipv6Prefix" in prefixes:
-            cidrs_all.append(prefixes["ipv6Prefix"])
 
-    cidrs_v4, cidrs_v6 = merge_cidr_list_split_version(cidrs_all)
+@app.command("github-ips")
+def fetch_github_ips():
+    fetch_group("github-ips")
 
-    ipv4_path = gw.zones_root / "google-ipv4.txt"
-    ipv4_content = "\n".join(cidrs_v4) + "\n"
-    gw.print(f"Saving {len(cidrs_v4)} IPv4 networks to {ipv4_path} ...")
-    gw.install_text_file(ipv4_path, ipv4_content, show_diff=False)
 
-    ipv6_path = gw.zones_root / "google-ipv6.txt"
-    ipv6_content = "\n".join(cidrs_v6) + "\n"
-    gw.print(f"Saving {len(cidrs_v6)} IPv6 networks to {ipv6_path} ...")
-    gw.install_text_file(ipv6_path, ipv6_content, show_diff=False)
+@app.command("google-ips")
+def fetch_google_ips():
+    fetch_group("google-ips")
 
 
 @app.command("cloudflare-ips")
 def fetch_cloudflare_ips():
-    from xrouter.gwlib import gw
-    from xrouter.utils.cidr import merge_cidr_list_split_version
-    from xrouter.utils.download import download_text
-
-    content = download_text(
-        "https://api.cloudflare.com/client/v4/ips",
-        "json",
-    )
-
-    cidrs_all = []
-
-    for cidr in content.get("result", {}).get("ipv4_cidrs", []):
-        cidrs_all.append(cidr)
-
-    for cidr in content.get("result", {}).get("ipv6_cidrs", []):
-        cidrs_all.append(cidr)
-
-    cidrs_v4, cidrs_v6 = merge_cidr_list_split_version(cidrs_all)
-
-    ipv4_path = gw.zones_root / "cloudflare-ipv4.txt"
-    ipv4_content = "\n".join(cidrs_v4) + "\n"
-    gw.print(f"Saving {len(cidrs_v4)} IPv4 networks to {ipv4_path} ...")
-    gw.install_text_file(ipv4_path, ipv4_content, show_diff=False)
-
-    ipv6_path = gw.zones_root / "cloudflare-ipv6.txt"
-    ipv6_content = "\n".join(cidrs_v6) + "\n"
-    gw.print(f"Saving {len(cidrs_v6)} IPv6 networks to {ipv6_path} ...")
-    gw.install_text_file(ipv6_path, ipv6_content, show_diff=False)
+    fetch_group("cloudflare-ips")
 
 
 @app.command("fastly-ips")
 def fetch_fastly_ips():
-    from xrouter.gwlib import gw
-    from xrouter.utils.cidr import merge_cidr_list_split_version
-    from xrouter.utils.download import download_text
-
-    content = download_text(
-        "https://api.fastly.com/public-ip-list",
-        "json",
-    )
-
-    cidrs_all = []
-
-    for cidr in content.get("addresses", []):
-        cidrs_all.append(cidr)
+    fetch_group("fastly-ips")
 
-    for cidr in content.get("ipv6_addresses", []):
-        cidrs_all.append(cidr)
 
-    cidrs_v4, cidrs_v6 = merge_cidr_list_split_version(cidrs_all)
+@app.command("china-names")
+def fetch_china_names(
+    show_diff: Annotated[bool, typer.Option("--show-diff", help="Show diff")] = False,
+    reload: Annotated[bool, typer.Option(help="Restart dnsmasq if any list changed")] = True,
+):
+    """
+    拉取域名列表，有变化时重新编译 domain sets 并重启 dnsmasq（与 `gw fetch all` 相同）。
+    --no-reload 时只编译，不重启 dnsmasq
+    """
+    from xrouter.gwlib import gw
 
-    ipv4_path = gw.zones_root / "fastly-ipv4.txt"
-    ipv4_content = "\n".join(cidrs_v4) + "\n"
-    gw.print(f"Saving {len(cidrs_v4)} IPv4 networks to {ipv4_path} ...")
-    gw.install_text_file(ipv4_path, ipv4_content, show_diff=False)
+    if "dnsmasq" not in fetch_group("china-names", show_diff=show_diff):
+        gw.print("Nothing changed")
+        return
 
-    ipv6_path = gw.zones_root / "fastly-ipv6.txt"
-    ipv6_content = "\n".join(cidrs_v6) + "\n"
-    gw.print(f"Saving {len(cidrs_v6)} IPv6 networks to {ipv6_path} ...")
-    gw.install_text_file(ipv6_path, ipv6_content, show_diff=False)
+    if not reload:
+        with gw.install_transaction():
+            gw.config.dnsmasq.install_domain_sets()
+        gw.print("Domain sets compiled, skip dnsmasq restart")
+        return
 
+    from .reload import reload_dnsmasq
 
-@app.command("china-names")
-def fetch_china_names(show_diff: Annotated[bool, typer.Option("--show-diff", help="Show diff")] = False):
-    from xrouter.gwlib import gw
-    from xrouter.utils.download import download_text
-
-    gw.print("Downloading accelerated-domains.china.conf ...")
-    content = download_text(
-        "https://raw.githubusercontent.com/felixonmars/dnsmasq-china-list/refs/heads/master/accelerated-domains.china.conf",
-        "text",
-    )
-    gw.install_text_file(
-        gw.dnsmasq_config_root / "china-114.conf",
-        content,
-        show_diff=show_diff,
-    )
-    gw.install_text_file(
-        gw.dnsmasq_config_root / "china-223.conf",
-        content.replace("114.114.114.114", "223.5.5.5"),
-        show_diff=show_diff,
-    )
-
-    gw.print("Downloading apple.china.conf ...")
-    content = download_text(
-        "https://raw.githubusercontent.com/felixonmars/dnsmasq-china-list/refs/heads/master/apple.china.conf",
-        "text",
-    )
-    gw.install_text_file(
-        gw.dnsmasq_config_root / "apple-114.conf",
-        content,
-        show_diff=show_diff,
-    )
-    gw.install_text_file(
-        gw.dnsmasq_config_root / "apple-223.conf",
-        content.replace("114.114.114.114", "223.5.5.5"),
-        show_diff=show_diff,
-    )
-
-    gw.print("Downloading bogus-nxdomain.china.conf ...")
-    content = download_text(
-        "https://raw.githubusercontent.com/felixonmars/dnsmasq-china-list/refs/heads/master/bogus-nxdomain.china.conf",
-        "text",
-    )
-    gw.install_text_file(
-        gw.dnsmasq_config_root / "bogus-nxdomain-china.conf",
-        content,
-        show_diff=show_diff,
-    )
+    reload_dnsmasq()
 
 
 @app.command("wgsd-client")
@@ -0,0 +1,30 @@
+from typing import Annotated
+
+import typer
+
+app = typer.Typer(
+    no_args_is_help=True,
+    help="Gateway health checks and route failover",
+)
+
+
+@app.command("status")
+def gateways_status():
+    from xrouter.gwlib import gw
+
+    route = gw.config.route
+    healthy = route.check_gateways()
+    for name, nexthop in route.gateways.items():
+        gw.print(f"{name}: {'up' if name in healthy else 'down'} ({nexthop})")
+
+
+@app.command("watch")
+def gateways_watch(
+    interval: Annotated[float, typer.Option(help="Seconds between probes, link changes are handled immediately")] = 5.0,
+):
+    """
+    持续检查网关状态，网关不可用时将相关条目切换到备用网关，恢复后切换回来
+    """
+    from xrouter.gwlib import gw
+
+    gw.config.route.watch(interval)
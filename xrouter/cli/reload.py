@@ -1,6 +1,5 @@
 from typing import Annotated
 
-import sh
 import typer
 
 app = typer.Typer(
@@ -11,6 +10,8 @@ app = typer.Typer(
 
 @app.command("ifaces")
 def reload_ifaces():
+    import sh
+
     from xrouter.gwlib import gw
 
     gw.run_command(sh.networkctl.bake("reload"))
@@ -20,14 +21,88 @@ def reload_ifaces():
 def reload_route():
     from xrouter.gwlib import gw
 
-    gw.run_command(sh.Command(gw.bin_root / "setup-route.sh"))
+    from .daemon import forward_to_daemon
+
+    forward_to_daemon("reload", "route")
+
+    gw.config.route.sync()
 
 
 @app.command("firewall")
-def reload_firewall():
+def reload_firewall(
+    full: Annotated[
+        bool, typer.Option("--full", help="Reload the whole ruleset even if the rules are unchanged")
+    ] = False,
+):
+    """
+    规则（setup-firewall.nft 以及自定义的 nft 文件）与上次加载时相同时，不重新加载整个 ruleset，
+    计数器、动态 set 等状态不受影响。
+
+    route.marks 的 set 只由完整的路由同步（Route.sync，`gw reload route`）更新，这里不再更新一次，
+    否则 dispatcher hook、开机时同步路由之后每个 set 都会写两遍
+    """
+    from xrouter.gwlib import gw
+
+    from .daemon import forward_to_daemon
+
+    forward_to_daemon("reload", "firewall")
+
+    if not full and firewall_loaded():
+        gw.print("Firewall rules unchanged, skip reloading")
+        return
+
+    run_firewall_script()
+
+
+def firewall_digest() -> str:
+    """
+    防火墙规则的摘要：setup-firewall.nft 以及它 include 的自定义 nft 文件，不包括 route.marks 的 set 文件
+    """
+    import hashlib
+
     from xrouter.gwlib import gw
+    from xrouter.gwlib.gwlib import file_digest
 
-    gw.run_command(sh.Command(gw.bin_root / "setup-firewall.nft"))
+    digest = hashlib.sha256()
+    for file in [gw.bin_root / "setup-firewall.nft", *sorted(gw.config_root.glob("*.nft"))]:
+        digest.update(str(file).encode())
+        digest.update(file_digest(file) or b"")
+
+    return digest.hexdigest()
+
+
+def firewall_loaded() -> bool:
+    """
+    当前的规则是否已经加载：与上次加载时的摘要相同，并且 ruleset 没有被清空（例如手动 `nft flush ruleset`）。
+    摘要保存在 run_root 中，重启后总是完整加载一次。
+    """
+    import sh
+
+    from xrouter.gwlib import gw
+
+    try:
+        applied = (gw.run_root / "firewall.sha256").read_text().strip()
+    except FileNotFoundError:
+        return False
+
+    if applied != firewall_digest():
+        return False
+
+    return sh.nft("list", "table", "inet", "firewall", _ok_code=list(range(256)), _return_cmd=True).exit_code == 0
+
+
+def run_firewall_script():
+    """
+    执行 setup-firewall.nft，完整加载 ruleset，并记录规则的摘要
+    """
+    import sh
+
+    from xrouter.gwlib import gw
+
+    gw.run_command(sh.Command(str(gw.bin_root / "setup-firewall.nft")))
+
+    gw.run_root.mkdir(parents=True, exist_ok=True)
+    (gw.run_root / "firewall.sha256").write_text(firewall_digest() + "\n")
 
 
 @app.command("network")
@@ -38,18 +113,32 @@ def reload_network():
 
 
 @app.command("containers")
-def reload_containers(names: Annotated[list[str] | None, typer.Argument()] = None):
+def reload_containers(
+    names: Annotated[list[str] | None, typer.Argument()] = None,
+    timeout: Annotated[float, typer.Option(help="Seconds to wait for all containers to become active")] = 300,
+):
     from xrouter.gwlib import gw
+    from xrouter.utils.systemd import report_unit_jobs, run_unit_jobs
 
     if not names:
         names = gw.config.containers.container_names
 
-    for name in names:
-        gw.run_command(sh.systemctl.bake("restart", f"container-{name}.service"))
+    # 同时重启所有容器，总耗时约等于最慢的一个
+    units = [f"container-{name}.service" for name in names]
+    if not report_unit_jobs(run_unit_jobs("restart", units, timeout)):
+        raise typer.Exit(1)
 
 
 @app.command("dnsmasq")
 def reload_dnsmasq():
+    """
+    重新编译 domain sets，然后重启 dnsmasq。`gw fetch china-names`、`gw fetch all` 在列表有变化时调用
+    """
+    import sh
+
     from xrouter.gwlib import gw
 
+    with gw.install_transaction():
+        gw.config.dnsmasq.install_domain_sets()
+
     gw.run_command(sh.systemctl.bake("restart", "dnsmasq"))
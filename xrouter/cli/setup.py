@@ -1,6 +1,5 @@
 from typing import Annotated
 
-import sh
 import typer
 
 app = typer.Typer(
@@ -11,6 +10,8 @@ app = typer.Typer(
 
 @app.command("system")
 def setup_system():
+    import sh
+
     from xrouter.gwlib import gw
 
     gw.print("[setup system]")
@@ -46,13 +47,36 @@ def setup_system():
         mode="755",
     )
 
-    gw.run_command(sh.mkdir.bake("-p", gw.config_root, gw.dnsmasq_config_root, gw.zones_root))
+    gw.run_command(sh.mkdir.bake("-p", gw.config_root, gw.dnsmasq_config_root, gw.names_root, gw.zones_root))
 
     gw.run_command(sh.gw.bake("fix-perms"), stream=True)
 
 
+@app.command("daemon")
+def setup_daemon():
+    """
+    安装并启动可选的 xrouterd
+    """
+    import sh
+
+    from xrouter.gwlib import gw
+
+    gw.print("[setup daemon]")
+
+    gw.install_template_file(
+        "/etc/systemd/system/xrouterd.service",
+        "xrouterd.service",
+        {},
+    )
+    gw.run_command(sh.systemctl.bake("daemon-reload"))
+    gw.run_command(sh.systemctl.bake("enable", "xrouterd.service"))
+    gw.run_command(sh.systemctl.bake("restart", "xrouterd.service"))
+
+
 @app.command("avahi")
 def setup_avahi():
+    import sh
+
     from xrouter.gwlib import gw
 
     gw.run_command(sh.sed.bake("-i", "s/#enable-reflector=no/enable-reflector=yes/g", "/etc/avahi/avahi-daemon.conf"))
@@ -61,36 +85,57 @@ def setup_avahi():
 
 @app.command("ifaces")
 def setup_ifaces():
+    import sh
+
     from xrouter.gwlib import gw
 
     gw.print("[setup interfaces]")
 
-    # ensure devgroups are configured
-    gw.config.apply_devgroups()
+    with gw.install_transaction():
+        # 先收集所有 interface 要安装的文件，再统一并发比较、写入，按顺序输出报告
+        with gw.install_plan() as changed:
+            # ensure devgroups are configured
+            gw.config.apply_devgroups()
 
-    for iface in gw.config.interfaces:
-        iface.apply()
+            for iface in gw.config.interfaces:
+                iface.apply()
 
-    for iface in gw.config.interfaces:
-        iface.pre_reload()
+        for iface in gw.config.interfaces:
+            iface.pre_reload()
 
-    gw.run_command(sh.networkctl.bake("reload"))
+        # 文件都没有变化时不需要 networkd 重新加载，需要时可以手动执行 `gw reload ifaces`
+        if changed:
+            gw.run_command(sh.networkctl.bake("reload"))
+        else:
+            gw.print("Interface files unchanged, skip networkctl reload")
 
-    for iface in gw.config.interfaces:
-        iface.post_reload()
+        for iface in gw.config.interfaces:
+            iface.post_reload()
 
 
 @app.command("route")
-def setup_route():
-    from sh import Command
-
+def setup_route(
+    full: Annotated[bool, typer.Option("--full", help="Replace all routes even if they are unchanged")] = False,
+    export_script: Annotated[
+        bool, typer.Option("--export-script", help="Also export an equivalent `ip -batch` script to bin root")
+    ] = False,
+    interfaces: Annotated[
+        list[str] | None,
+        typer.Option("--interface", "-i", help="Only sync routes and rules that depend on these interfaces"),
+    ] = None,
+):
     from xrouter.gwlib import gw
 
+    from .daemon import forward_to_daemon
+
+    forward_to_daemon("setup", "route")
+
     gw.print("[setup route]")
 
-    gw.config.route.apply(gw.bin_root / "setup-route.sh")
+    if export_script:
+        gw.config.route.export_script(gw.bin_root / "setup-route.sh")
 
-    gw.run_command(Command(gw.bin_root / "setup-route.sh"))
+    gw.config.route.sync(full=full, interfaces=interfaces)
 
 
 @app.command("firewall")
@@ -98,18 +143,19 @@ def setup_firewall():
     """
     生成 nft 文件，输出到 /etc/nftables.conf
     """
-    from sh import Command
-
     from xrouter.gwlib import gw
 
+    from .reload import run_firewall_script
+
     gw.print("[setup firewall]")
 
-    # ensure devgroups are configured
-    gw.config.apply_devgroups()
+    with gw.install_transaction():
+        # ensure devgroups are configured
+        gw.config.apply_devgroups()
 
-    gw.config.firewall.apply()
+        gw.config.firewall.apply()
 
-    gw.run_command(Command(gw.bin_root / "setup-firewall.nft"))
+        run_firewall_script()
 
 
 @app.command("network")
@@ -120,63 +166,89 @@ def setup_net():
 
 
 @app.command("containers")
-def setup_pods(names: Annotated[list[str] | None, typer.Argument()] = None):
+def setup_pods(
+    names: Annotated[list[str] | None, typer.Argument()] = None,
+    timeout: Annotated[float, typer.Option(help="Seconds to wait for all containers to become active")] = 300,
+):
+    import sh
+
     from xrouter.gwlib import gw
+    from xrouter.utils.systemd import report_unit_jobs, run_unit_jobs
 
     gw.print("[setup containers]")
 
     if not names:
         names = gw.config.containers.container_names
 
-    for name in names:
-        container = gw.config.containers.containers[name]
+    with gw.install_transaction(), gw.install_plan() as changed:
+        for name in names:
+            container = gw.config.containers.containers[name]
 
-        container.create_mount_sources()
-        gw.install_template_file(
-            f"/etc/systemd/system/container-{container.name}.service",
-            "container/podman-container.service",
-            dict(container=container),
-        )
-        gw.run_command(sh.systemctl.bake("enable", f"container-{name}.service"))
-        gw.run_command(sh.systemctl.bake("start", f"container-{name}.service"))
+            container.create_mount_sources()
+            gw.install_template_file(
+                f"/etc/systemd/system/container-{container.name}.service",
+                "container/podman-container.service",
+                dict(container=container),
+            )
+
+    # 所有 unit 文件安装完成后只 daemon-reload 一次（都没有变化时不执行），enable、start 也各用一次 systemctl。
+    # 开机时的顺序（startup-xrouter.service、容器使用的 bridge 之后）写在 unit 文件中
+    units = [f"container-{name}.service" for name in names]
+    if changed:
+        gw.run_command(sh.systemctl.bake("daemon-reload"))
+    gw.run_command(sh.systemctl.bake("enable", *units))
+    if not report_unit_jobs(run_unit_jobs("start", units, timeout)):
+        raise typer.Exit(1)
 
 
 @app.command("dnsmasq")
 def setup_dnsmasq():
+    import sh
+
     from xrouter.gwlib import gw
 
     gw.print("[setup dnsmasq]")
 
-    gw.run_command(sh.mkdir.bake("-p", "/opt/xrouter/configs/dnsmasq"))
-    gw.run_command(sh.mkdir.bake("-p", "/opt/xrouter/configs/dnsmasq/manual"))
+    with gw.install_transaction():
+        gw.run_command(sh.mkdir.bake("-p", "/opt/xrouter/configs/dnsmasq"), reads_files=False)
+        gw.run_command(sh.mkdir.bake("-p", "/opt/xrouter/configs/dnsmasq/manual"), reads_files=False)
 
-    gw.install_template_file(
-        "/etc/dnsmasq.conf",
-        "dnsmasq/dnsmasq.conf",
-        {},
-    )
+        gw.install_template_file(
+            "/etc/dnsmasq.conf",
+            "dnsmasq/dnsmasq.conf",
+            {},
+        )
 
-    gw.install_template_file(
-        "/opt/xrouter/configs/dnsmasq/dns.conf",
-        "dnsmasq/dns.conf",
-        {
-            "conf": gw.config.dnsmasq,
-        },
-    )
+        gw.install_template_file(
+            "/opt/xrouter/configs/dnsmasq/dns.conf",
+            "dnsmasq/dns.conf",
+            {
+                "conf": gw.config.dnsmasq,
+            },
+        )
 
-    gw.install_template_file(
-        "/opt/xrouter/configs/dnsmasq/dhcp.conf",
-        "dnsmasq/dhcp.conf",
-        {
-            "conf": gw.config.dnsmasq,
-        },
-    )
+        # 预留有冲突时退出，事务中已经暂存的文件被丢弃，dnsmasq 继续使用现有的配置
+        try:
+            gw.config.dnsmasq.dhcp.install_hostsfile()
+        except ValueError as e:
+            gw.logger.error(e)
+            raise typer.Exit(1)
+        gw.install_template_file(
+            "/opt/xrouter/configs/dnsmasq/dhcp.conf",
+            "dnsmasq/dhcp.conf",
+            {
+                "conf": gw.config.dnsmasq,
+                "hostsfile": gw.dhcp_hostsfile,
+            },
+        )
 
-    gw.run_command(sh.mkdir.bake("-p", "/var/log/dnsmasq"))
-    gw.install_template_file(
-        "/etc/logrotate.d/dnsmasq",
-        "dnsmasq/logrotate",
-        {},
-    )
+        gw.config.dnsmasq.install_domain_sets()
+
+        gw.run_command(sh.mkdir.bake("-p", "/var/log/dnsmasq"), reads_files=False)
+        gw.install_template_file(
+            "/etc/logrotate.d/dnsmasq",
+            "dnsmasq/logrotate",
+            {},
+        )
 
-    gw.run_command(sh.systemctl.bake("restart", "dnsmasq"))
+        gw.run_command(sh.systemctl.bake("restart", "dnsmasq"))
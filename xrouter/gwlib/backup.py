@@ -0,0 +1,239 @@
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+
+
+@dataclass
+class BackupRun:
+    run_id: str
+    created: str
+    # 产生备份的命令行，如 ["gw", "setup", "dnsmasq"]
+    argv: list[str] = field(default_factory=list)
+    # {path: {"sha256": ..., "mode": "644"}}
+    files: dict[str, dict[str, str]] = field(default_factory=dict)
+
+
+@dataclass
+class BackupStore:
+    """
+    按内容寻址的文件备份。
+
+    * blobs/{sha256[:2]}/{sha256}: 文件内容，只读，相同内容只保存一份
+    * runs/{run_id}.jsonl: 每次运行的 manifest，第一行为运行的信息，之后每个被覆盖的文件追加一行（路径、sha256、权限）
+    * files/{run_id}/{path}: 指向 blob 的硬链接，保持原来的目录结构，方便直接浏览
+
+    一次运行中同一个文件被覆盖多次时只记录第一次，即运行之前的状态。
+    本次运行的 manifest 保存在内存中，每备份一个文件只追加一行，不重新读取、重写整个 manifest。
+
+    旧版本只有 files/{run_id}/ 中的完整副本，gc 时先为它们生成 manifest（见 _migrate_legacy_runs）。
+
+    backup 和 gc 持有同一个锁，同时运行的 gw 不会在 gc 时删除另一个进程刚保存、还没有写入 manifest 的 blob。
+    """
+
+    root: Path
+    # 保留最近的多少次运行，0 表示不限制
+    keep_runs: int = 100
+    # 本进程中已经加载或创建的运行
+    _runs: dict[str, BackupRun] = field(default_factory=dict, init=False, repr=False)
+
+    @property
+    def blobs_root(self):
+        return self.root / "blobs"
+
+    @property
+    def runs_root(self):
+        return self.root / "runs"
+
+    @property
+    def files_root(self):
+        return self.root / "files"
+
+    def blob_path(self, digest: str) -> Path:
+        return self.blobs_root / digest[:2] / digest
+
+    def manifest_path(self, run_id: str) -> Path:
+        return self.runs_root / f"{run_id}.jsonl"
+
+    def lock(self):
+        from xrouter.utils.single_instance import wait_lock
+
+        return wait_lock(f"xrouter-backups:{self.root}")
+
+    def backup(self, run_id: str, file: Path):
+        from .gwlib import file_digest
+
+        with self.lock():
+            run = self._runs.get(run_id) or self.load(run_id)
+            if run is None:
+                import sys
+                from datetime import datetime
+
+                run = BackupRun(run_id, datetime.now().isoformat(timespec="seconds"), sys.argv)
+                self._gc(self.keep_runs, 0, exclude=run_id)
+                self._append_manifest(run_id, {"run_id": run.run_id, "created": run.created, "argv": run.argv})
+            self._runs[run_id] = run
+
+            if str(file) in run.files:
+                return
+
+            digest = file_digest(file)
+            if digest is None:
+                return
+
+            blob = self._save_blob(file, digest.hex())
+            self._link_run_file(run_id, file, blob)
+
+            entry = {"sha256": digest.hex(), "mode": oct(file.stat().st_mode)[-3:]}
+            run.files[str(file)] = entry
+            self._append_manifest(run_id, {"path": str(file), **entry})
+
+    def _save_blob(self, file: Path, digest: str) -> Path:
+        import shutil
+
+        blob = self.blob_path(digest)
+        if blob.exists():
+            return blob
+
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        tmp_blob = blob.with_name(f".{digest}.tmp")
+        shutil.copyfile(file, tmp_blob)
+        tmp_blob.chmod(0o444)
+        tmp_blob.replace(blob)
+        return blob
+
+    def _link_run_file(self, run_id: str, file: Path, blob: Path):
+        import shutil
+
+        path = self.files_root / run_id / file.relative_to(file.anchor)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(blob, path)
+        except FileExistsError:
+            pass
+        except OSError:
+            # 文件系统不支持硬链接
+            shutil.copyfile(blob, path)
+
+    def _append_manifest(self, run_id: str, record: dict):
+        manifest = self.manifest_path(run_id)
+        manifest.parent.mkdir(parents=True, exist_ok=True)
+        with manifest.open("a", encoding="utf8") as fp:
+            fp.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def load(self, run_id: str) -> BackupRun | None:
+        try:
+            lines = self.manifest_path(run_id).read_text(encoding="utf8").splitlines()
+        except FileNotFoundError:
+            return None
+
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # 写入一半时中断的最后一行
+                continue
+        if not records:
+            return None
+
+        run = BackupRun(**records[0])
+        for record in records[1:]:
+            path = record.pop("path")
+            run.files.setdefault(path, record)
+        return run
+
+    def run_ids(self) -> list[str]:
+        """
+        所有有 manifest 的运行，按时间从旧到新排序（run_id 本身就是时间戳）
+        """
+        if not self.runs_root.exists():
+            return []
+
+        return sorted(path.stem for path in self.runs_root.glob("*.jsonl"))
+
+    def runs(self) -> list[BackupRun]:
+        return [run for run in map(self.load, self.run_ids()) if run is not None]
+
+    def gc(self, keep_runs: int | None = None, max_age_days: int = 0, exclude: str | None = None) -> tuple[int, int]:
+        """
+        删除超出保留策略的运行（只保留最近 keep_runs 次、以及 max_age_days 天之内的），
+        然后删除不再被任何 manifest 引用的 blob。返回 (删除的运行数, 删除的 blob 数)。
+        """
+        with self.lock():
+            return self._gc(self.keep_runs if keep_runs is None else keep_runs, max_age_days, exclude)
+
+    def _gc(self, keep_runs: int, max_age_days: int, exclude: str | None) -> tuple[int, int]:
+        import shutil
+        from datetime import datetime, timedelta
+
+        self._migrate_legacy_runs(exclude)
+
+        run_ids = [run_id for run_id in self.run_ids() if run_id != exclude]
+        expired = set(run_ids[:-keep_runs] if keep_runs > 0 and len(run_ids) > keep_runs else [])
+        if max_age_days > 0:
+            threshold = (datetime.now() - timedelta(days=max_age_days)).strftime("%Y%m%d-%H%M%S-%f")
+            expired.update(run_id for run_id in run_ids if run_id < threshold)
+
+        if not expired:
+            return 0, 0
+
+        for run_id in expired:
+            self.manifest_path(run_id).unlink(missing_ok=True)
+            shutil.rmtree(self.files_root / run_id, ignore_errors=True)
+
+        referenced = {entry["sha256"] for run in self.runs() for entry in run.files.values()}
+        removed_blobs = 0
+        for blob in self.blobs_root.glob("*/*"):
+            if blob.name not in referenced and not blob.name.startswith("."):
+                blob.unlink()
+                removed_blobs += 1
+
+        return len(expired), removed_blobs
+
+    def _migrate_legacy_runs(self, exclude: str | None):
+        """
+        旧版本的备份只有 files/{run_id}/{path} 中的完整副本，没有 manifest，gc 不会处理它们。
+        为这些运行生成 manifest，内容保存为 blob，副本替换为指向 blob 的硬链接，之后和其他运行一样参与 gc。
+
+        manifest 在所有文件处理完之后才写入，中断之后下次会重新处理，已经处理过的文件不受影响。
+        """
+        from datetime import datetime
+
+        from .gwlib import file_digest
+
+        if not self.files_root.exists():
+            return
+
+        for run_root in sorted(self.files_root.iterdir()):
+            run_id = run_root.name
+            if run_id == exclude or not run_root.is_dir() or self.manifest_path(run_id).exists():
+                continue
+
+            try:
+                created = datetime.strptime(run_id, "%Y%m%d-%H%M%S-%f")
+            except ValueError:
+                created = datetime.fromtimestamp(run_root.stat().st_mtime)
+
+            records: list[dict] = [{"run_id": run_id, "created": created.isoformat(timespec="seconds"), "argv": []}]
+            for path in sorted(run_root.rglob("*")):
+                if path.is_symlink() or not path.is_file():
+                    continue
+
+                digest = file_digest(path)
+                if digest is None:
+                    continue
+
+                file = Path("/") / path.relative_to(run_root)
+                mode = oct(path.stat().st_mode)[-3:]
+                blob = self._save_blob(path, digest.hex())
+                if not path.samefile(blob):
+                    path.unlink()
+                    self._link_run_file(run_id, file, blob)
+                records.append({"path": str(file), "sha256": digest.hex(), "mode": mode})
+
+            manifest = self.manifest_path(run_id)
+            manifest.parent.mkdir(parents=True, exist_ok=True)
+            tmp_manifest = manifest.with_name(f".{manifest.name}.tmp")
+            tmp_manifest.write_text("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+            tmp_manifest.replace(manifest)
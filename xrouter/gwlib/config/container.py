@@ -1,6 +1,5 @@
 from pathlib import Path
 
-import sh
 from pydantic import BaseModel
 
 
@@ -30,6 +29,8 @@ class Container(BaseModel):
         self.mounts = [normalize_mount_path(gw.container_data_root / self.name, mount) for mount in self.mounts]
 
     def create_mount_sources(self):
+        import sh
+
         from xrouter.gwlib import gw
 
         for mount in self.mounts:
@@ -37,7 +38,41 @@ class Container(BaseModel):
 
             source_path = Path(source)
             if not source_path.exists():
-                gw.run_command(sh.mkdir.bake("-p", source_path))
+                gw.run_command(sh.mkdir.bake("-p", source_path), reads_files=False)
+
+    @property
+    def bridge(self) -> str | None:
+        """
+        容器使用的 PodmanBridge：network 为某个 bridge 的名字，或者 ipv4_address 在某个 bridge 的地址段中。
+        使用 podman 自己管理的网络（如默认的 podman）时返回 None
+        """
+        import ipaddress
+
+        from xrouter.gwlib import gw
+        from xrouter.gwlib.config.interface import PodmanBridge
+
+        bridges = [iface for iface in gw.config.interfaces if isinstance(iface, PodmanBridge)]
+        for bridge in bridges:
+            if bridge.name == self.network:
+                return bridge.name
+
+        if self.ipv4_address:
+            address = ipaddress.ip_address(self.ipv4_address)
+            for bridge in bridges:
+                if any(address in range.subnet for range in bridge.ranges):
+                    return bridge.name
+
+        return None
+
+    @property
+    def systemd_bridge_unit(self) -> str | None:
+        """
+        bridge 对应的 device unit，容器 unit 排在它之后，等待 networkd 创建 bridge
+        """
+        from xrouter.utils.systemd import device_unit
+
+        bridge = self.bridge
+        return device_unit(bridge) if bridge else None
 
     @property
     def systemd_exec_start(self) -> str:
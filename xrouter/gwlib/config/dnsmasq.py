@@ -1,6 +1,6 @@
-from typing import Annotated, Sequence
+from typing import Annotated, Iterable, Sequence
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from pydantic.networks import IPv4Address, IPv4Network, IPv6Address, IPvAnyAddress
 
 
@@ -8,6 +8,8 @@ class DHCPRange(BaseModel):
     tag: str | None = None
     start: IPv4Address
     end: IPv4Address
+    # dnsmasq dhcp-range 的 netmask，不设置时按 /24 推算网段
+    netmask: IPv4Address | None = None
     router: IPv4Address | None = None
     lease: str | None = "24h"
     # per range dns servers if configured
@@ -15,13 +17,30 @@ class DHCPRange(BaseModel):
 
     def model_post_init(self, _context):
         if self.router is None:
-            net = IPv4Network(f"{self.start}/24", strict=False)
-            self.router = net.network_address + 1
+            self.router = self.subnet.network_address + 1
+
+    @property
+    def subnet(self) -> IPv4Network:
+        """
+        range 所在的网段：设置了 netmask 时按 netmask 计算，否则与默认 router 一样按 /24 推算
+        """
+        return IPv4Network(f"{self.start}/{self.netmask or 24}", strict=False)
+
+    @property
+    def interval(self) -> tuple[int, int]:
+        """
+        可以预留的地址区间 (first, last)：没有 netmask 时 /24 只是推算，range 跨过多个 /24 时延伸到 end
+        """
+        first, last = int(self.subnet.network_address), int(self.subnet.broadcast_address)
+        if self.netmask is None:
+            last = max(last, int(self.end))
+        return first, last
 
     @property
     def dhcp_range_line(self) -> str:
         tag = f"{self.tag}," if self.tag else ""
-        return f"dhcp-range = {tag} {self.start}, {self.end}, {self.lease}"
+        netmask = f" {self.netmask}," if self.netmask else ""
+        return f"dhcp-range = {tag} {self.start}, {self.end},{netmask} {self.lease}"
 
     @property
     def dhcp_route_line(self) -> str:
@@ -58,6 +77,13 @@ class DHCPHost(BaseModel):
 
         raise ValueError("Invalid DHCP host")
 
+    @property
+    def hostsfile_line(self) -> str:
+        """
+        dhcp-hostsfile 中的一行，与 dhcp-host 的值相同，不带 `dhcp-host=`
+        """
+        return self.host_line.removeprefix("dhcp-host = ").replace(", ", ",")
+
 
 class DHCP(BaseModel):
     # global dns servers
@@ -75,6 +101,61 @@ class DHCP(BaseModel):
     def dns_v6_list(self) -> str:
         return ",".join([f"[{s}]" for s in self.dns_v6])
 
+    def bulk_hosts(self) -> list[DHCPHost]:
+        """
+        `gw dhcp-hosts import` 导入的预留，保存在 gw.dhcp_reservations_file 中，不在 xrouter.yml 中
+        """
+        from xrouter.gwlib import gw
+        from xrouter.utils.dhcp_hosts import read_csv
+
+        if not gw.dhcp_reservations_file.exists():
+            return []
+
+        return hosts_from_rows(read_csv(gw.dhcp_reservations_file), str(gw.dhcp_reservations_file))
+
+    def reservations(self, bulk_hosts: list[DHCPHost] | None = None):
+        """
+        xrouter.yml 中的 hosts 和批量导入的预留（bulk_hosts 为 None 时读取 gw.dhcp_reservations_file），
+        建立索引并检查冲突，返回 ReservationIndex
+        """
+        from xrouter.utils.dhcp_hosts import ReservationIndex
+
+        if bulk_hosts is None:
+            bulk_hosts = self.bulk_hosts()
+
+        return ReservationIndex.build((range.interval for range in self.ranges), [*self.hosts, *bulk_hosts])
+
+    def install_hostsfile(self) -> bool:
+        """
+        所有预留写入 gw.dhcp_hostsfile（dnsmasq 的 dhcp-hostsfile），dnsmasq 收到 SIGHUP 时重新读取，不需要重启。
+        有冲突时抛出 ValueError，不修改文件；不在任何 range 网段中的预留只输出警告
+        """
+        from xrouter.gwlib import gw
+
+        index = self.reservations()
+        index.check()
+        for warning in index.warnings:
+            gw.logger.warning(warning)
+
+        gw.print(f"{len(index.hosts)} DHCP reservations")
+        return gw.install_stream_file(gw.dhcp_hostsfile, (f"{host.hostsfile_line}\n" for host in index.hosts))
+
+
+def hosts_from_rows(rows: Iterable[dict[str, str | None]], source: str) -> list[DHCPHost]:
+    """
+    将 CSV、lease 文件中读取的行转换为 DHCPHost，出错时抛出带行号的 ValueError
+    """
+    from pydantic import ValidationError
+
+    hosts = []
+    for number, row in enumerate(rows, 1):
+        try:
+            hosts.append(DHCPHost.model_validate(row))
+        except ValidationError as e:
+            raise ValueError(f"{source}: entry {number} is invalid: {row}\n{e}") from None
+
+    return hosts
+
 
 class DNS(BaseModel):
     # servers: ip
@@ -124,6 +205,99 @@ class DNS(BaseModel):
         return lines
 
 
+class DomainSet(BaseModel):
+    """
+    一组使用相同上游的域名，编译为 dnsmasq_config_root/{name}.conf，见 DnsmasqConfig.install_domain_sets
+    """
+
+    name: str
+    # gw.names_root 中的列表文件（dnsmasq-china-list 格式的 server= 行），可以使用通配符
+    lists: list[str] = []
+    # 直接列出的域名
+    domains: list[str] = []
+    # 上游 ip 或 ip#port。dnsmasq 的一行 server= 只能有一个上游，每个上游都要列一遍域名，
+    # 上游较多时可以指向一个本地转发（如 127.0.0.1#5353），由它再分发给多个上游，域名只需要加载一次
+    upstreams: list[str]
+
+    @field_validator("domains")
+    @classmethod
+    def validate_domains(cls, domains: list[str]) -> list[str]:
+        from xrouter.utils.domains import domain_labels
+
+        for domain in domains:
+            domain_labels(domain)
+        return domains
+
+    @field_validator("upstreams")
+    @classmethod
+    def validate_upstreams(cls, upstreams: list[str]) -> list[str]:
+        import ipaddress
+
+        if not upstreams:
+            raise ValueError("at least one upstream is required")
+        for upstream in upstreams:
+            address, _, port = upstream.partition("#")
+            ipaddress.ip_address(address)
+            if port and not port.isdigit():
+                raise ValueError(f"invalid upstream port: {upstream}")
+        return upstreams
+
+
+def default_domain_sets() -> list[DomainSet]:
+    # `gw fetch china-names` 下载的所有列表
+    return [DomainSet(name="china-names", lists=["*.conf"], upstreams=["114.114.114.114", "223.5.5.5"])]
+
+
+# 旧版本安装的 china-names 文件，已经由 domain set 的输出代替
+LEGACY_CHINA_NAMES_FILES = ["china-114.conf", "china-223.conf", "apple-114.conf", "apple-223.conf"]
+
+
 class DnsmasqConfig(BaseModel):
     dns: Annotated[DNS, Field(default_factory=DNS)]
     dhcp: Annotated[DHCP, Field(default_factory=DHCP)]
+    domain_sets: Annotated[list[DomainSet], Field(default_factory=default_domain_sets)]
+
+    def install_domain_sets(self):
+        """
+        编译所有 domain set：合并列表文件和 domains 中的域名，去掉重复和已经被上级域名覆盖的条目，
+        每个 set 只生成一个配置文件。域名按行长分组，每组拼接一次，再为每个上游各输出一行。
+        """
+        from xrouter.gwlib import gw
+        from xrouter.utils.domains import DomainTrie, parse_server_domains, server_lines
+        from xrouter.utils.sources import read_lines
+
+        outputs = set()
+        for domain_set in self.domain_sets:
+            trie = DomainTrie()
+            entries = 0
+            for pattern in domain_set.lists:
+                for path in sorted(gw.names_root.glob(pattern)):
+                    for domain, _ in parse_server_domains(read_lines(path)):
+                        trie.add(domain)
+                        entries += 1
+            for domain in domain_set.domains:
+                trie.add(domain)
+                entries += 1
+
+            output = gw.dnsmasq_config_root / f"{domain_set.name}.conf"
+            outputs.add(output)
+            if entries == 0:
+                gw.print(f"{domain_set.name}: no domains found, run `gw fetch china-names` first?")
+                continue
+
+            domains = list(trie)
+            gw.print(
+                f"{domain_set.name}: {entries} entries -> {len(domains)} domains "
+                f"({trie.duplicates} duplicates, {trie.covered} covered by parent domains, {trie.invalid} invalid), "
+                f"{len(domain_set.upstreams)} upstreams"
+            )
+            gw.install_stream_file(output, server_lines(domains, domain_set.upstreams), show_diff=False)
+
+        # 旧版本的输出：每个文件只有一个上游的 china-names
+        stale = [gw.dnsmasq_config_root / name for name in LEGACY_CHINA_NAMES_FILES]
+        stale.extend(gw.dnsmasq_config_root.glob("china-names-*.conf"))
+        for stale_file in stale:
+            if stale_file.exists() and stale_file not in outputs:
+                gw.print(f"Removing {stale_file}")
+                gw.backup_file(stale_file)
+                stale_file.unlink()
@@ -5,12 +5,20 @@ class Firewall(BaseModel):
     def apply(self):
         from ..gwlib import gw
 
+        route = gw.config.route
+        if route.marks:
+            gw.print(f"route sets file: {gw.route_sets_file}")
+            route.export_mark_sets(gw.route_sets_file)
+
         setup_file = gw.bin_root / "setup-firewall.nft"
         gw.print(f"setup file: {setup_file}")
         gw.install_template_file(
             setup_file,
             "firewall.nft",
-            dict(),
+            dict(
+                route_sets_file=gw.route_sets_file if route.marks else None,
+                mark_sets=route.nft_mark_sets(),
+            ),
             mode="755",
         )
 
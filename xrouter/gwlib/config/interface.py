@@ -1,6 +1,5 @@
 from typing import Annotated, Literal
 
-import sh
 from pydantic import BaseModel, Field, IPvAnyAddress, IPvAnyInterface, IPvAnyNetwork, PrivateAttr
 
 
@@ -149,6 +148,8 @@ class PPPoE(InterfaceCommon):
         )
 
     def pre_reload(self):
+        import sh
+
         from ..gwlib import gw
 
         gw.run_command(sh.systemctl.bake("daemon-reload"))
@@ -184,6 +185,8 @@ class Wireguard(InterfaceCommon):
         return f"{gw.wireguard_config_root}/{self.name}.conf"
 
     def apply(self):
+        import sh
+
         from ..gwlib import gw
 
         gw.install_template_file(
@@ -217,6 +220,8 @@ class Wireguard(InterfaceCommon):
             gw.run_command(sh.systemctl.bake("enable", f"wgsd-client-{self.name}.timer"))
 
     def up_hook(self):
+        import sh
+
         from xrouter.gwlib import gw
 
         gw.print("sync wireguard conf ...")
@@ -1,41 +1,592 @@
 from pathlib import Path
-from typing import cast
+from typing import Iterable, Iterator, cast
 
-from pydantic import BaseModel, IPvAnyNetwork
+from pydantic import BaseModel, PrivateAttr, field_validator
+
+# `ip rule flush` 之后需要重新添加的默认规则
+BASE_RULES = [
+    "from all lookup main pref 1",
+    "from all lookup main pref 32766",
+    "from all lookup local pref 32767",
+]
+
+
+class GatewayCheck(BaseModel):
+    """
+    网关的健康检查。指定了 dev 的网关总是检查接口状态（UP 且有载波），probe 为额外的主动探测。
+    """
+
+    # 探测目标，如 `icmp 223.5.5.5`、`tcp 223.5.5.5:443`，从网关的 dev 发出，为空时只检查接口状态
+    probe: str | None = None
+    # 探测超时（秒）
+    timeout: float = 1.0
+
+    @field_validator("probe")
+    @classmethod
+    def validate_probe(cls, probe: str | None) -> str | None:
+        from xrouter.utils.probe import parse_probe
+
+        if probe:
+            parse_probe(probe)
+        return probe
+
+
+class MarkRoute(BaseModel):
+    """
+    fwmark 模式的路由：目标地址属于 targets 的包在 nftables 中打上 mark，
+    再通过 `fwmark {mark} lookup {table}` 规则查询 table，table 中只有一条经过 gateway 的默认路由。
+
+    targets 编译为 nftables 的 interval set，zone 变化时只需要 `nft -f` 原子地替换 set 的内容，
+    不需要逐条下发成千上万条路由。
+    """
+
+    mark: int
+    table: int
+    # 网关名，与 tables 中的条目一样，可以是逗号分隔的多个网关
+    gateway: str
+    # cidr 或 zone
+    targets: list[str] = []
+    # ip rule 的 pref
+    priority: int
 
 
 class Route(BaseModel):
     # gateway: {name: nexthop}
     gateways: dict[str, str] = {}
+    # gateway: check，没有配置的网关只检查接口状态
+    checks: dict[str, GatewayCheck] = {}
     # table: [number, entries]
     # entries: (cidr|zone, gateway_name)
+    # gateway_name 可以是逗号分隔的多个网关，如 `wg,wan`，使用第一个可用的网关
     tables: dict[int, list[tuple[str, str]]] = {}
     # rules: rule
     rules: list[str] = []
+    # 下发前合并同一网关的路由（合并相邻的 cidr，删除被同网关更短前缀覆盖的 cidr）
+    aggregate: bool = True
+    # name: MarkRoute，fwmark 模式的路由，name 用于 nft set 的名字
+    marks: dict[str, MarkRoute] = {}
+
+    # 以下私有属性在 model_post_init 中设置，不是配置项，不出现在 model_dump 中
+    # {interface: {gateway_name}}，网关 nexthop 中 `dev` 指定的接口
+    _interface_gateways: dict[str, set[str]] = PrivateAttr(default_factory=dict)
+    # {gateway_name: interface}
+    _gateway_devs: dict[str, str] = PrivateAttr(default_factory=dict)
+    # 没有指定 dev 的网关，出接口由内核决定，任何接口变化都可能影响
+    _unbound_gateways: set[str] = PrivateAttr(default_factory=set)
+    # {gateway_name: {table}}
+    _gateway_tables: dict[str, set[int]] = PrivateAttr(default_factory=dict)
+    # {gateway_name: {gateway_name}}，在同一个条目中互为主备的网关（包括自己）
+    _gateway_peers: dict[str, set[str]] = PrivateAttr(default_factory=dict)
+
+    def model_post_init(self, _context):
+        self._interface_gateways = {}
+        self._gateway_devs = {}
+        self._unbound_gateways = set()
+        for name, nexthop in self.gateways.items():
+            words = nexthop.split()
+            if "dev" in words and words.index("dev") + 1 < len(words):
+                iface = words[words.index("dev") + 1]
+                self._interface_gateways.setdefault(iface, set()).add(name)
+                self._gateway_devs[name] = iface
+            else:
+                self._unbound_gateways.add(name)
+
+        self._gateway_tables = {}
+        self._gateway_peers = {name: {name} for name in self.gateways}
+        for table, entries in self.route_tables().items():
+            for _, gateway_name in entries:
+                chain = self.gateway_chain(gateway_name)
+                for name in chain:
+                    self._gateway_tables.setdefault(name, set()).add(table)
+                    self._gateway_peers.setdefault(name, {name}).update(chain)
+
+    def route_tables(self) -> dict[int, list[tuple[str, str]]]:
+        """
+        需要同步的所有路由表：tables，以及 fwmark 模式使用的表（只有默认路由）
+        """
+        tables = dict(self.tables)
+        for mark in self.marks.values():
+            nexthop = self.gateways.get(self.gateway_chain(mark.gateway)[0], "").split()
+            via = nexthop[nexthop.index("via") + 1] if "via" in nexthop[:-1] else None
+            defaults = []
+            if via is None or ":" not in via:
+                defaults.append(("0.0.0.0/0", mark.gateway))
+            if via is None or ":" in via:
+                defaults.append(("::/0", mark.gateway))
+            tables[mark.table] = defaults
+        return tables
+
+    def mark_rules(self) -> list[str]:
+        return [f"fwmark {mark.mark:#x} lookup {mark.table} pref {mark.priority}" for mark in self.marks.values()]
+
+    @staticmethod
+    def mark_set_name(name: str, version: int) -> str:
+        return f"mark_{name.replace('-', '_')}_v{version}"
+
+    def nft_mark_sets(self) -> list[dict]:
+        """
+        firewall.nft 模板中使用的 set 和 mark
+        """
+        return [
+            dict(mark=f"{mark.mark:#x}", v4=self.mark_set_name(name, 4), v6=self.mark_set_name(name, 6))
+            for name, mark in self.marks.items()
+        ]
+
+    def export_mark_sets(self, file: Path) -> bool:
+        """
+        生成 nft 脚本，创建（如果不存在）并替换 marks 对应的 interval set，返回文件是否有变化。
+
+        `nft -f` 在一个事务中执行整个文件，set 的内容原子地切换。firewall.nft 也 include 这个文件。
+        """
+        from xrouter.gwlib import gw
+
+        return gw.install_stream_file(file, self.iter_mark_set_lines(), mode="755", show_diff=False)
+
+    def iter_mark_set_lines(self) -> Iterator[str]:
+        from xrouter.utils.nftables import element_lines
 
-    def apply(self, bin_file: Path):
+        yield "#!/usr/sbin/nft -f\n"
+        yield "\n"
+        yield "# generated by xrouter from route.marks\n"
+        yield "add table inet route\n"
+
+        for set_name, intervals in self.mark_set_elements().items():
+            addr_type = "ipv4_addr" if set_name.endswith("_v4") else "ipv6_addr"
+            yield "\n"
+            yield f"add set inet route {set_name} {{ type {addr_type}; flags interval; auto-merge; }}\n"
+            yield f"flush set inet route {set_name}\n"
+            yield from element_lines("add", "inet", "route", set_name, intervals)
+
+    def mark_set_elements(self) -> dict[str, list[tuple[int, int, int]]]:
+        """
+        每个 set 的内容，{set_name: [(version, first, last), ...]}，相邻的区间已经合并，与 nft 中保存的形式一致
+        """
+        from xrouter.utils.cidr import cidrs_to_intervals
+
+        sets = {}
+        for name, mark in self.marks.items():
+            intervals = cidrs_to_intervals(self.expand_targets(mark.targets))
+            for version in (4, 6):
+                sets[self.mark_set_name(name, version)] = [interval for interval in intervals if interval[0] == version]
+        return sets
+
+    def expand_targets(self, targets: list[str]) -> list[tuple[int, int, int]]:
         from xrouter.gwlib import gw
 
-        ip_batch_lines = []
+        cidrs: list[tuple[int, int, int]] = []
+        for target in targets:
+            type, val = self.parse_route_target(target)
+            if type == "cidr":
+                cidrs.append(cast(tuple[int, int, int], val))
+            elif type == "zone":
+                cidrs.extend(self.read_zone(cast(Path, val)))
+            else:
+                gw.logger.error(f"Bad mark target: {target}, skipped")
+        return cidrs
+
+    def apply_mark_sets(self):
+        """
+        更新 marks 对应的 nft set。
+
+        set 文件没有变化时也要对比 nft 中的内容：上一次安装文件之后 nft 可能执行失败了，文件和 nft 中的 set 不一致。
+        优先只增删有变化的元素（见 update_mark_sets），内容一致时不执行 nft，set 还不存在或者失败时完整加载 set 文件。
+        """
+        import sh
+
+        from xrouter.gwlib import gw
+
+        sets_file = gw.route_sets_file
+        if not self.export_mark_sets(sets_file):
+            gw.print(f"Mark sets file unchanged: {sets_file}")
+
+        if not self.update_mark_sets():
+            gw.run_command(sh.nft.bake("-f", sets_file))
+
+    def update_mark_sets(self) -> bool:
+        """
+        对比 nft 中 set 的当前内容（`nft -j list set`），在一个事务中只删除、添加有变化的元素，
+        不会重新加载规则，计数器等状态不受影响。
+
+        set 不存在（防火墙还没有加载）或者 nft 执行失败时返回 False。
+        """
+        import sh
+
+        from xrouter.gwlib import gw
+        from xrouter.utils.nftables import element_lines, list_set_intervals
+
+        lines = []
+        for set_name, desired in self.mark_set_elements().items():
+            live = list_set_intervals("inet", "route", set_name)
+            if live is None:
+                gw.print(f"Set {set_name} not found, loading all sets")
+                return False
+
+            to_delete = sorted(set(live) - set(desired))
+            to_add = sorted(set(desired) - set(live))
+            gw.print(f"set {set_name}: {len(desired)} elements, +{len(to_add)} -{len(to_delete)}")
+
+            lines.extend(element_lines("delete", "inet", "route", set_name, to_delete))
+            lines.extend(element_lines("add", "inet", "route", set_name, to_add))
+
+        if not lines:
+            return True
+
+        try:
+            gw.run_command(sh.nft.bake("-f", "-", _in="".join(lines)))
+        except sh.ErrorReturnCode as e:
+            gw.logger.error(f"Failed to update sets incrementally: {e}")
+            return False
+
+        return True
+
+    @staticmethod
+    def gateway_chain(gateway_name: str) -> list[str]:
+        """
+        条目中的网关，按优先级排序
+        """
+        return [name.strip() for name in gateway_name.split(",")]
+
+    def affected_gateways(self, interfaces: Iterable[str]) -> set[str]:
+        """
+        接口变化可能影响的网关：指定了 `dev {interface}` 的网关，以及没有指定 dev 的网关
+        """
+        gateways = set(self._unbound_gateways)
+        for name in interfaces:
+            gateways.update(self._interface_gateways.get(name, ()))
+        return gateways
+
+    def affected_tables(self, gateways: Iterable[str]) -> set[int]:
+        """
+        有条目使用了这些网关的路由表
+        """
+        tables: set[int] = set()
+        for name in gateways:
+            tables.update(self._gateway_tables.get(name, ()))
+        return tables
+
+    def check_gateways(self, names: Iterable[str] | None = None) -> set[str]:
+        """
+        检查网关是否可用，返回可用的网关。
+
+        指定了 dev 的网关要求接口 UP 且有载波，配置了 probe 的网关在接口可用时再并发探测一次。
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        from xrouter.gwlib import gw
+        from xrouter.utils.netlink import dump_links
+        from xrouter.utils.probe import probe
+
+        names = list(self.gateways if names is None else names)
+        links = dump_links()
+
+        healthy = set()
+        probes = []
+        for name in names:
+            dev = self._gateway_devs.get(name)
+            if dev is not None and not (dev in links and links[dev].up):
+                continue
+
+            check = self.checks.get(name)
+            if check is not None and check.probe:
+                probes.append((name, check.probe, dev, check.timeout))
+            else:
+                healthy.add(name)
+
+        def run_probe(name: str, spec: str, dev: str | None, timeout: float) -> bool:
+            # 探测本身出错（如找不到 ping）时视为不可用，不能中断路由同步或者 `gateways watch`
+            try:
+                return probe(spec, dev, timeout)
+            except Exception as e:
+                gw.logger.warning(f"Probe {spec!r} for gateway {name} failed: {type(e).__name__}: {e}")
+                return False
+
+        if probes:
+            with ThreadPoolExecutor(len(probes)) as executor:
+                results = executor.map(lambda args: run_probe(*args), probes)
+                healthy.update(name for (name, *_), ok in zip(probes, results) if ok)
+
+        return healthy
+
+    def sync(
+        self,
+        full: bool = False,
+        interfaces: list[str] | None = None,
+        gateways: Iterable[str] | None = None,
+        healthy: set[str] | None = None,
+    ):
+        """
+        通过 netlink 将规则和路由表同步到内核。
+
+        读取内核中各个路由表的当前内容，与配置对比，只下发有变化的路由，没有变化时不会改动任何路由。
+        full 为 True 时，所有路由都重新 replace 一遍（仍然不会 flush 路由表）。
+
+        interfaces、gateways 不为 None 时只同步这些接口、网关相关的部分（例如某个 wg 接口 up 之后，
+        或者健康检查发现网关状态变化），见 sync_table、sync_rules。与它们互为主备的网关也在同步范围内。
+
+        每个条目使用第一个可用的网关（healthy 为 None 时通过 check_gateways 检查），都不可用时不下发。
+
+        所有请求在同一个 netlink socket 上批量发送，每一条失败的请求都会单独报告。
+        """
+        import socket
+
+        from xrouter.gwlib import gw
+        from xrouter.utils.netlink import NLM_F_REQUEST, RTM_DELROUTE, NetlinkBatch, dump_routes, encode_route
+
+        batch = NetlinkBatch()
+
+        scope = None
+        if interfaces is not None or gateways is not None:
+            scope = self.affected_gateways(interfaces or [])
+            scope.update(gateways or [])
+            for name in list(scope):
+                scope.update(self._gateway_peers.get(name, ()))
+
+        if healthy is None:
+            unhealthy = set(scope if scope is not None else self.gateways) - self.check_gateways(scope)
+            healthy = set(self.gateways) - unhealthy
+        if unhealthy_names := ", ".join(sorted(set(self.gateways) - healthy)):
+            gw.print(f"Unavailable gateways: {unhealthy_names}")
+
+        tables = self.route_tables()
+        if scope is not None:
+            affected = self.affected_tables(scope)
+            tables = {table: entries for table, entries in tables.items() if table in affected}
+            reason = ", ".join([*(interfaces or []), *(gateways or [])])
+            gateway_names = ", ".join(sorted(scope)) or "none"
+            table_names = ", ".join(map(str, tables)) or "none"
+            gw.print(f"Route scoped to {reason}: gateways {gateway_names}, tables {table_names}")
+            self.sync_rules(batch, (set(interfaces or []), set(tables)))
+        else:
+            self.sync_rules(batch)
+
+        for table, entries in tables.items():
+            self.sync_table(batch, table, entries, full, scope, healthy)
+
+        # delete default route in table main if exists
+        for route in dump_routes(254, socket.AF_INET):
+            if route.dst[2] == 0:
+                data = encode_route(RTM_DELROUTE, NLM_F_REQUEST, batch.next_seq(), 254, route.dst)
+                batch.add(data, "route del default table main")
+
+        # set 的内容与接口、网关无关，只在完整同步时更新
+        if self.marks and scope is None:
+            self.apply_mark_sets()
 
-        # flush rules
-        ip_batch_lines.extend(
-            [
-                "rule flush",
-                "rule add from all lookup main pref 1",
-                "rule add from all lookup main pref 32766",
-                "rule add from all lookup local pref 32767",
+        total = len(batch)
+        errors = batch.commit()
+        for description, error in errors:
+            gw.logger.error(f"{description}: {error.strerror}")
+
+        gw.print(f"Route synced: {total} requests, {len(errors)} failed")
+
+    def watch(self, interval: float = 5.0):
+        """
+        持续检查网关状态，状态变化时只同步相关的路由。
+
+        接口变化（netlink 事件）时立即检查，此外每 interval 秒检查一次（执行 probe）。
+        """
+        import select
+        import socket
+
+        from xrouter.gwlib import gw
+        from xrouter.utils.netlink import open_link_monitor
+
+        monitor = open_link_monitor()
+
+        healthy = self.check_gateways()
+        self.sync(healthy=healthy)
+
+        while True:
+            readable, _, _ = select.select([monitor], [], [], interval)
+            if readable:
+                # 只需要知道接口有变化，读掉所有排队的事件
+                try:
+                    while monitor.recv(1 << 20, socket.MSG_DONTWAIT):
+                        pass
+                except BlockingIOError:
+                    pass
+
+            current = self.check_gateways()
+            changed = healthy ^ current
+            if not changed:
+                continue
+
+            for name in sorted(changed):
+                gw.print(f"Gateway {name} is {'up' if name in current else 'down'}")
+
+            healthy = current
+            self.sync(gateways=changed, healthy=healthy)
+
+    def sync_rules(self, batch, scope: tuple[set[str], set[int]] | None = None):
+        """
+        对比内核中的规则，删除多余的，添加缺少的。
+
+        与之前的 `ip rule flush` 一致，只删除 IPv4 规则，pref 0 的 local 规则不动。
+
+        scope 为 (接口, 路由表) 时只检查 iif/oif 为这些接口、或者 lookup 这些表的规则，只添加缺少的，不删除。
+        """
+        import socket
+
+        from xrouter.gwlib import gw
+        from xrouter.utils.netlink import (
+            NLM_F_CREATE,
+            NLM_F_EXCL,
+            NLM_F_REQUEST,
+            RTM_DELRULE,
+            RTM_NEWRULE,
+            dump_rules,
+            parse_rule,
+        )
+
+        desired = []
+        for spec in [*BASE_RULES, *self.rules, *self.mark_rules()]:
+            try:
+                desired.append((spec, parse_rule(spec)))
+            except ValueError as e:
+                gw.logger.error(f"Bad rule: {spec}, {e}, skipped")
+
+        if scope is not None:
+            interfaces, tables = scope
+            desired = [
+                (spec, rule)
+                for spec, rule in desired
+                if rule.table in tables or rule.iifname in interfaces or rule.oifname in interfaces
             ]
+
+        live = dump_rules(socket.AF_INET)
+        if any(rule.family == socket.AF_INET6 for _, rule in desired):
+            live.extend(dump_rules(socket.AF_INET6))
+
+        missing = []
+        for spec, rule in desired:
+            for index, live_rule in enumerate(live):
+                if rule.match(live_rule):
+                    del live[index]
+                    break
+            else:
+                missing.append((spec, rule))
+
+        stale = [rule for rule in live if rule.family == socket.AF_INET and rule.priority != 0]
+        if scope is not None:
+            stale = []
+        for live_rule in stale:
+            data = live_rule.encode(RTM_DELRULE, NLM_F_REQUEST, batch.next_seq())
+            batch.add(data, f"rule del pref {live_rule.priority} lookup {live_rule.table}")
+
+        for spec, rule in missing:
+            data = rule.encode(RTM_NEWRULE, NLM_F_REQUEST | NLM_F_CREATE | NLM_F_EXCL, batch.next_seq())
+            batch.add(data, f"rule add {spec}")
+
+        gw.print(f"rules: {len(desired)} rules, +{len(missing)} -{len(stale)}")
+
+    def sync_table(
+        self,
+        batch,
+        table: int,
+        entries: list[tuple[str, str]],
+        full: bool = False,
+        gateways: set[str] | None = None,
+        healthy: set[str] | None = None,
+    ):
+        """
+        对比内核中的路由表，只将需要变更的路由加入 batch
+
+        gateways 不为 None 时只下发使用这些网关的路由，只删除经过这些网关、且不在配置中的路由
+        （例如切换到备用网关后被合并掉的 cidr）。
+        仍然需要展开整个表：同一个 cidr 以最后一个条目为准，合并路由也依赖其他网关的路由。
+        """
+        import socket
+
+        from xrouter.gwlib import gw
+        from xrouter.utils.cidr import format_cidr
+        from xrouter.utils.netlink import (
+            NLM_F_CREATE,
+            NLM_F_REPLACE,
+            NLM_F_REQUEST,
+            RTM_DELROUTE,
+            RTM_NEWROUTE,
+            Nexthop,
+            dump_routes,
+            encode_route,
+            parse_nexthop,
         )
-        for rule in self.rules:
-            ip_batch_lines.append(f"rule add {rule}")
+
+        all_desired = desired = self.build_table_routes(table, entries, healthy)
+        if gateways is not None:
+            nexthops_in_scope = {self.gateways[name] for name in gateways if name in self.gateways}
+            desired = {cidr: gateway for cidr, gateway in desired.items() if gateway in nexthops_in_scope}
+
+        live = {
+            route.dst: route for family in (socket.AF_INET, socket.AF_INET6) for route in dump_routes(table, family)
+        }
+
+        nexthops: dict[tuple[str, int], Nexthop | None] = {}
+
+        added = changed = skipped = 0
+        for cidr, gateway in desired.items():
+            family = socket.AF_INET if cidr[0] == 4 else socket.AF_INET6
+            if (gateway, family) not in nexthops:
+                try:
+                    nexthops[(gateway, family)] = parse_nexthop(gateway, family)
+                except ValueError as e:
+                    gw.logger.error(f"Bad gateway in table {table}: {gateway}, {e}, skipped")
+                    nexthops[(gateway, family)] = None
+
+            nexthop = nexthops[(gateway, family)]
+            if nexthop is None:
+                skipped += 1
+                continue
+
+            route = live.get(cidr)
+            if route is None:
+                added += 1
+            elif nexthop.match(route) and not full:
+                continue
+            else:
+                changed += 1
+
+            data = encode_route(
+                RTM_NEWROUTE, NLM_F_REQUEST | NLM_F_CREATE | NLM_F_REPLACE, batch.next_seq(), table, cidr, nexthop
+            )
+            batch.add(data, f"route replace table {table} {format_cidr(cidr)} {gateway}")
+
+        stale = live.keys() - all_desired.keys()
+        if gateways is not None:
+            scope_nexthops = []
+            for gateway in nexthops_in_scope:
+                for family in (socket.AF_INET, socket.AF_INET6):
+                    try:
+                        scope_nexthops.append(parse_nexthop(gateway, family))
+                    except ValueError:
+                        pass
+            stale = {
+                cidr
+                for cidr in stale
+                for nexthop in scope_nexthops
+                if nexthop.family == (socket.AF_INET if cidr[0] == 4 else socket.AF_INET6) and nexthop.match(live[cidr])
+            }
+
+        removed = 0
+        for cidr in stale:
+            removed += 1
+            data = encode_route(RTM_DELROUTE, NLM_F_REQUEST, batch.next_seq(), table, cidr)
+            batch.add(data, f"route del table {table} {format_cidr(cidr)}")
+
+        scoped = "" if gateways is None else " (scoped)"
+        gw.print(f"table {table}{scoped}: {len(desired)} routes, +{added} ~{changed} -{removed}, {skipped} skipped")
+
+    def export_script(self, bin_file: Path):
+        """
+        导出等价的 `ip -batch` 脚本（flush 后全部重建），仅用于手动执行或排查问题，正常流程使用 sync。
+        """
+        from xrouter.gwlib import gw
+
+        ip_batch_lines = self.create_rule_batch_lines()
 
         # flush tables
-        for table, entries in self.tables.items():
+        for table, entries in self.route_tables().items():
             ip_batch_lines.extend(self.create_table_batch_lines(table, entries))
 
-        # TODO：这里应当 per-entry 执行 `ip batch -`，在执行前检查对应的网关是否可用，例如接口是否 up
-
         content_lines = [
             "#!/bin/bash",
             "#set -e",
@@ -57,55 +608,158 @@ class Route(BaseModel):
         gw.install_text_file(bin_file, content, "755", show_diff=False)
         gw.print(f"Route file updated: {bin_file}")
 
+    def create_rule_batch_lines(self):
+        """
+        返回重建规则的 `ip -batch` 输入内容
+        """
+        lines = ["rule flush"]
+        for rule in [*BASE_RULES, *self.rules, *self.mark_rules()]:
+            lines.append(f"rule add {rule}")
+
+        return lines
+
     def create_table_batch_lines(self, table: int, entries: list[tuple[str, str]]):
         """
         创建表
 
         返回 `ip -batch` 的输入内容
         """
-        from xrouter.gwlib import gw
+        from xrouter.utils.cidr import format_cidr
 
         lines = []
         lines.append(f"route flush table {table}")
 
+        for cidr, gateway in self.build_table_routes(table, entries).items():
+            lines.append(f"route replace table {table} {format_cidr(cidr)} {gateway}")
+
+        return lines
+
+    def build_table_routes(
+        self, table: int, entries: list[tuple[str, str]], healthy: set[str] | None = None
+    ) -> dict[tuple[int, int, int], str]:
+        """
+        展开表中的所有条目（cidr 或 zone），返回 {(version, network, prefixlen): gateway}
+
+        同一个 cidr 出现多次时，以最后一次为准（与 `route replace` 的效果一致）。
+
+        每个条目使用第一个在 healthy 中的网关，healthy 为 None 时使用第一个网关，都不可用的条目跳过。
+        """
+        from xrouter.gwlib import gw
+
+        routes: dict[tuple[int, int, int], str] = {}
+        unavailable = 0
+
         for target, gateway_name in entries:
             type, val = self.parse_route_target(target)
 
-            gateway = self.gateways.get(gateway_name)
-            if not gateway:
+            chain = self.gateway_chain(gateway_name)
+            if not all(name in self.gateways for name in chain):
                 gw.logger.error(f"Bad gateway name in table {table}: {gateway_name}, skipped")
                 continue
 
+            name = next((name for name in chain if healthy is None or name in healthy), None)
+            if name is None:
+                unavailable += 1
+                continue
+            gateway = self.gateways[name]
+
             if type == "cidr":
-                lines.append(f"route replace table {table} {val} {gateway}")
+                routes[cast(tuple[int, int, int], val)] = gateway
                 continue
 
             elif type == "zone":
                 zone_file = cast(Path, val)
-                for zone_line in self.read_zone_lines(zone_file):
-                    lines.append(f"route replace table {table} {zone_line} {gateway}")
+                for cidr in self.read_zone(zone_file):
+                    routes[cidr] = gateway
                 continue
 
             elif type == "error":
                 gw.logger.error(f"Bad route target in table {table}: {target}, skipped")
                 continue
 
-        return lines
+        if unavailable:
+            gw.print(f"table {table}: {unavailable} entries skipped, no available gateway")
+
+        if self.aggregate:
+            aggregated = self.aggregate_table_routes(routes)
+            saved = len(routes) - len(aggregated)
+            gw.print(f"table {table}: aggregated {len(routes)} -> {len(aggregated)} routes, {saved} saved")
+            return aggregated
+
+        return routes
+
+    def aggregate_table_routes(self, routes: dict[tuple[int, int, int], str]) -> dict[tuple[int, int, int], str]:
+        """
+        按网关分组，分别用 aggregate_cidrs 合并，返回合并后的路由。
+
+        不同网关的路由相互重叠时，单独按网关合并可能改变最长前缀匹配的结果，例如：
+
+            10.0.0.0/8 A, 10.1.0.0/16 B, 10.1.1.0/24 A
+
+        10.1.1.0/24 被同网关的 10.0.0.0/8 覆盖，但删掉后会匹配到 10.1.0.0/16 B。
+        因此合并后对每条被删除/合并的原始路由做一次最长前缀匹配，结果不一致的原样保留，直到全部一致。
+        """
+        from xrouter.utils.cidr import aggregate_cidrs
+
+        by_gateway: dict[str, list[tuple[int, int, int]]] = {}
+        for cidr, gateway in routes.items():
+            by_gateway.setdefault(gateway, []).append(cidr)
+
+        aggregated = {}
+        for gateway, cidrs in by_gateway.items():
+            for cidr in aggregate_cidrs(cidrs):
+                aggregated[cidr] = gateway
+
+        pinned: dict[tuple[int, int, int], str] = {}
+        while True:
+            result = {**aggregated, **pinned}
+            prefixlens = {
+                version: sorted({cidr[2] for cidr in result if cidr[0] == version}, reverse=True) for version in (4, 6)
+            }
+
+            mismatched = {
+                cidr: gateway
+                for cidr, gateway in routes.items()
+                if result.get(cidr) != gateway and self.lookup_route(result, prefixlens[cidr[0]], cidr) != gateway
+            }
+            if not mismatched:
+                return result
+
+            pinned.update(mismatched)
+
+    @staticmethod
+    def lookup_route(
+        routes: dict[tuple[int, int, int], str], prefixlens: list[int], cidr: tuple[int, int, int]
+    ) -> str | None:
+        """
+        最长前缀匹配：返回 routes 中覆盖 cidr 的最长前缀对应的网关，prefixlens 为 routes 中出现过的前缀长度（降序）
+        """
+        version, network, prefixlen = cidr
+        bits = 32 if version == 4 else 128
+
+        for length in prefixlens:
+            if length > prefixlen:
+                continue
+            shift = bits - length
+            gateway = routes.get((version, network >> shift << shift, length))
+            if gateway is not None:
+                return gateway
+
+        return None
 
     def parse_route_target(self, target: str):
         """
         return:
-        * ('cidr', '{cidr}')
+        * ('cidr', (version, network, prefixlen))
         * ('zone', '{zone_file}')
         * ('error', None)
         """
         from xrouter.gwlib import gw
+        from xrouter.utils.cidr import parse_cidr
 
-        try:
-            ipv = IPvAnyNetwork(target)  # type: ignore[operator]
-            return ("cidr", ipv.with_prefixlen)
-        except ValueError:
-            pass
+        cidr = parse_cidr(target)
+        if cidr is not None:
+            return ("cidr", cidr)
 
         zone_file = gw.zones_root / f"manual-{target}.txt"
         if zone_file.exists():
@@ -117,18 +771,14 @@ class Route(BaseModel):
 
         return ("error", None)
 
-    def read_zone_lines(self, zone_file: Path):
-        text = zone_file.read_text()
-        for line in text.splitlines():
-            line = line.split("#", 1)[0]
-            line = line.split(" ", 1)[0]
-            line = line.strip()
+    def read_zone(self, zone_file: Path) -> list[tuple[int, int, int]]:
+        """
+        读取 zone 文件，返回 [(version, network, prefixlen), ...]
 
-            if not line:
-                continue
+        解析结果缓存在 gw.zone_cache_path 中，文件没有变化时不会重新解析。
+        """
+        from xrouter.gwlib import gw
+        from xrouter.utils.cidr import parse_cidr_lines
+        from xrouter.utils.zone_cache import load_zone
 
-            try:
-                ipv = IPvAnyNetwork(line)  # type: ignore[operator]
-                yield ipv.with_prefixlen
-            except ValueError:
-                pass
+        return load_zone(zone_file, parse_cidr_lines, gw.zone_cache_path)
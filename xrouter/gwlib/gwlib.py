@@ -1,6 +1,13 @@
+from contextlib import contextmanager
 from dataclasses import dataclass, field
 from functools import cached_property
 from pathlib import Path
+from typing import Iterable
+
+from .transaction import InstallTransaction, PlannedFile, staging_file
+
+# install_stream_file 只在新旧文件都不超过这个大小（字节）时读入内存生成 diff
+STREAM_DIFF_MAX_SIZE = 1 << 20
 
 
 @dataclass
@@ -10,11 +17,28 @@ class GwLib:
     config_root: Path = field(default_factory=lambda: Path("/opt/xrouter/configs"))
     zones_root: Path = field(default_factory=lambda: Path("/opt/xrouter/configs/zones"))
     dnsmasq_config_root: Path = field(default_factory=lambda: Path("/opt/xrouter/configs/dnsmasq"))
+    # china-names 等域名列表，由 DnsmasqConfig.install_domain_sets 编译到 dnsmasq_config_root
+    names_root: Path = field(default_factory=lambda: Path("/opt/xrouter/configs/names"))
     wireguard_config_root: Path = field(default_factory=lambda: Path("/opt/xrouter/configs/wireguard"))
     log_root: Path = field(default_factory=lambda: Path("/opt/xrouter/logs"))
     backup_root: Path = field(default_factory=lambda: Path("/opt/xrouter/backups"))
     bin_root: Path = field(default_factory=lambda: Path("/opt/xrouter/bin"))
     container_data_root: Path = field(default_factory=lambda: Path("/opt/xrouter/containers"))
+    cache_root: Path = field(default_factory=lambda: Path("/opt/xrouter/cache"))
+    # 运行时状态，重启后清空
+    run_root: Path = field(default_factory=lambda: Path("/run/xrouter"))
+    # 安装文件时显示的 diff 超过这么多行时只显示 +x/-y 的统计，0 表示不限制
+    max_diff_lines: int = 200
+    # networkd-dispatcher 事件在这么多秒内没有新事件时才开始处理，最多等待 dispatcher_max_wait 秒
+    dispatcher_debounce: float = 1.0
+    dispatcher_max_wait: float = 10.0
+    # install_plan 中并发比较、写入文件的线程数
+    install_workers: int = 8
+
+    _transaction: InstallTransaction | None = field(default=None, init=False, repr=False)
+    _plan: list[PlannedFile] | None = field(default=None, init=False, repr=False)
+    # 最外层 install_plan 中已经执行的、有变化的文件
+    _plan_changed: set[Path] = field(default_factory=set, init=False, repr=False)
 
     @cached_property
     def run_id(self):
@@ -23,8 +47,33 @@ class GwLib:
         return datetime.now().strftime("%Y%m%d-%H%M%S-%f")
 
     @cached_property
-    def file_backup_path(self):
-        return self.backup_root / "files"
+    def backup_store(self):
+        from .backup import BackupStore
+
+        return BackupStore(self.backup_root)
+
+    @cached_property
+    def dispatcher_queue(self):
+        from xrouter.utils.event_queue import EventQueue
+
+        return EventQueue(self.run_root / "dispatcher-events")
+
+    @cached_property
+    def route_sets_file(self):
+        return self.bin_root / "route-sets.nft"
+
+    @cached_property
+    def dhcp_reservations_file(self):
+        return self.config_root / "dhcp-hosts.csv"
+
+    @cached_property
+    def dhcp_hostsfile(self):
+        # 不以 .conf 结尾，不会被 dnsmasq 的 conf-dir 当作配置文件加载
+        return self.dnsmasq_config_root / "dhcp-hosts"
+
+    @cached_property
+    def zone_cache_path(self):
+        return self.zones_root / ".cache"
 
     @cached_property
     def xrouter_config_file(self):
@@ -64,15 +113,16 @@ class GwLib:
 
     @cached_property
     def config(self):
-        import yaml
-
-        from .config import XrouterConfig
+        from .snapshot import load_config
 
-        config_file_path = Path(self.config_root) / "xrouter.yml"
+        return load_config(self.xrouter_config_file, self.config_snapshot_file, (str(self.container_data_root),))
 
-        with config_file_path.open(encoding="utf8") as fp:
-            data = yaml.safe_load(fp)
-            return XrouterConfig.model_validate(data)
+    @cached_property
+    def config_snapshot_file(self):
+        """
+        校验后的配置快照（pickle），config_root 可能属于普通用户（见 `gw fix-perms`），因此不放在配置文件旁边
+        """
+        return self.cache_root / "xrouter.yml.pickle"
 
     @cached_property
     def jinja2_env(self):
@@ -91,7 +141,13 @@ class GwLib:
     def print(self, msg: str):
         self.logger.info(msg)
 
-    def run_command(self, command, stream: bool = False):
+    def run_command(self, command, stream: bool = False, reads_files: bool = True):
+        """
+        执行外部命令。命令可能会读取刚安装的文件（如 systemctl enable、networkctl reload），先执行 plan 并提交事务。
+
+        不读取安装的文件的命令（如 mkdir）传入 reads_files=False，不打断 plan 的批量执行，也不提前提交事务，
+        一个事务只在第一个需要这些文件的命令之前（或者退出时）fsync、rename 一次。
+        """
         import sys
 
         from sh import Command
@@ -99,6 +155,11 @@ class GwLib:
         if not isinstance(command, Command):
             raise Exception("Invalid command, must be constructed by sh.COMMAND.bake()")
 
+        if reads_files:
+            self._flush_plan()
+            if self._transaction is not None:
+                self._transaction.commit()
+
         self.logger.info(f"> {command}")
         if stream:
             command(_out=sys.stdout, _err=sys.stderr)
@@ -116,24 +177,31 @@ class GwLib:
         content: str,
         mode: str = "644",
         show_diff: bool = True,
-    ):
+    ) -> bool:
+        """
+        安装文件，内容和权限都没有变化时不做任何操作，返回是否有变化。
+
+        在 install_plan 中只记录，总是返回 False，不能用来判断是否有变化：
+        有变化的文件在 plan 执行时加入 install_plan 返回的集合。
+        """
         if isinstance(file, str):
             file = Path(file)
 
-        has_diff, diff = check_diff(file, content, mode)
+        if self._plan is not None:
+            self._plan.append(PlannedFile(file, content, mode, show_diff))
+            return False
+
+        has_diff, diff = check_diff(file, content, mode, show_diff, self.max_diff_lines)
         if not has_diff:
             self.print(f"{file} is up to date")
-            return
+            return False
 
         if show_diff:
             self.print(diff)
 
         self.backup_file(file)
-
-        file.parent.mkdir(parents=True, exist_ok=True)
-
-        file.write_text(content)
-        file.chmod(int(mode, 8))
+        self._write_file(file, content.encode(), mode)
+        return True
 
     def install_template_file(
         self,
@@ -142,7 +210,7 @@ class GwLib:
         context: dict,
         mode: str = "644",
         show_diff: bool = True,
-    ):
+    ) -> bool:
         content = self.render_template(template_name, context)
         return self.install_text_file(file, content, mode, show_diff)
 
@@ -152,47 +220,216 @@ class GwLib:
         content: Path | bytes,
         mode: str = "644",
         show_diff: bool = True,
-    ):
+    ) -> bool:
         if isinstance(file, str):
             file = Path(file)
 
         if isinstance(content, Path):
             content = content.read_bytes()
 
-        has_diff, diff = check_diff(file, content, mode)
+        self._flush_plan()
+
+        has_diff, diff = check_diff(file, content, mode, show_diff, self.max_diff_lines)
         if not has_diff:
             self.print(f"{file} is up to date")
-            return
+            return False
 
         if show_diff:
             self.print(diff)
 
         self.backup_file(file)
+        self._write_file(file, content, mode)
+        return True
 
-        file.parent.mkdir(parents=True, exist_ok=True)
+    def install_stream_file(
+        self,
+        file: str | Path,
+        lines: Iterable[str],
+        mode: str = "644",
+        show_diff: bool = True,
+    ) -> bool:
+        """
+        逐行写入同目录下的临时文件，同时计算 sha256，和现有文件的 sha256 比较，
+        内存占用和文件大小无关，适合较大的文件（如 dnsmasq china list）。返回是否有变化。
 
-        file.write_bytes(content)
-        file.chmod(int(mode, 8))
+        新旧文件都不超过 STREAM_DIFF_MAX_SIZE 时才输出 diff，否则只输出大小和 sha256 的变化
+        """
+        import hashlib
 
-    def _get_backup_fullpath(self, backup_dir: Path, path: Path):
-        if path.is_absolute():
-            path = path.relative_to(path.anchor)
+        if isinstance(file, str):
+            file = Path(file)
 
-        return backup_dir / path
+        self._flush_plan()
 
-    def backup_file(self, file: Path):
+        tmp_file = staging_file(file)
+
+        digest = hashlib.sha256()
+        try:
+            with tmp_file.open("wb") as fp:
+                for line in lines:
+                    data = line.encode()
+                    digest.update(data)
+                    fp.write(data)
+        except BaseException:
+            tmp_file.unlink(missing_ok=True)
+            raise
+
+        stat = file.stat() if file.exists() else None
+        current_mode = oct(stat.st_mode)[-3:] if stat else None
+        current_digest = file_digest(file)
+        if current_mode == mode and current_digest == digest.digest():
+            tmp_file.unlink()
+            self.print(f"{file} is up to date")
+            return False
+
+        if show_diff:
+            current_size = stat.st_size if stat else 0
+            new_size = tmp_file.stat().st_size
+            if max(current_size, new_size) <= STREAM_DIFF_MAX_SIZE:
+                self.print(check_diff(file, tmp_file.read_text(), mode, max_diff_lines=self.max_diff_lines)[1])
+            else:
+                current_hex = current_digest.hex()[:12] if current_digest else "none"
+                summary = f"mode change {current_mode} -> {mode}\n" if current_mode not in (None, mode) else ""
+                summary += (
+                    f"{file}: {current_size} -> {new_size} bytes, sha256 {current_hex} -> {digest.hexdigest()[:12]} "
+                    "(file too large, diff not shown)\n"
+                )
+                self.print(summary)
+
+        self.backup_file(file)
+        self._install_staged_file(file, tmp_file, mode)
+        return True
+
+    def _write_file(self, file: Path, content: bytes, mode: str):
+        self._install_staged_file(file, self._stage_content(file, content), mode)
+
+    def _stage_content(self, file: Path, content: bytes) -> Path:
+        tmp_file = staging_file(file)
+        try:
+            tmp_file.write_bytes(content)
+        except BaseException:
+            tmp_file.unlink(missing_ok=True)
+            raise
+        return tmp_file
+
+    def _install_staged_file(self, file: Path, tmp_file: Path, mode: str):
         """
-        备份系统文件，备份至 /opt/xrouter/backups/files/{run_id}/ 中
+        不在 install_transaction 中时，立即 fsync 并 rename
         """
-        import shutil
+        if self._transaction is not None:
+            self._transaction.stage(file, tmp_file, mode)
+            return
+
+        transaction = InstallTransaction()
+        transaction.stage(file, tmp_file, mode)
+        transaction.commit()
+
+    @contextmanager
+    def install_transaction(self):
+        """
+        with 块中安装的文件先写入目标目录中的临时文件，退出时统一 fsync 再 rename，出现异常时丢弃未提交的文件。
+
+        执行外部命令（run_command，reads_files=False 的除外）之前会先提交已经暂存的文件，保证命令看到的是最新的文件。
+        可以嵌套，只有最外层负责提交。
+        """
+        if self._transaction is not None:
+            yield self._transaction
+            return
+
+        self._transaction = InstallTransaction()
+        try:
+            yield self._transaction
+        except BaseException:
+            self._transaction.abort()
+            raise
+        else:
+            self._transaction.commit()
+        finally:
+            self._transaction = None
+
+    @contextmanager
+    def install_plan(self):
+        """
+        with 块中 install_text_file / install_template_file 只记录要安装的文件（路径、内容、权限），退出时统一执行：
+
+        1. 用线程池并发比较所有文件，并发写入有变化的文件的临时文件
+        2. 按记录的顺序输出 diff、备份、暂存（或者安装）有变化的文件，没有变化的文件只输出一行统计
 
+        输出的顺序和串行安装时相同，不受线程调度影响。同一个文件被记录多次时以最后一次为准。
+        执行外部命令（run_command，reads_files=False 的除外）、安装二进制文件和 stream 文件之前会先执行已经记录的部分，
+        保证顺序不变。
+        可以嵌套，只有最外层负责执行，出现异常时丢弃记录。
+
+        返回一个集合，执行之后包含有变化的文件，调用方用它决定是否需要 reload、restart。
+        """
+        if self._plan is not None:
+            yield self._plan_changed
+            return
+
+        self._plan = []
+        changed: set[Path] = set()
+        self._plan_changed = changed
+        try:
+            yield changed
+            self._flush_plan()
+        finally:
+            self._plan = None
+
+    def _flush_plan(self):
+        if not self._plan:
+            return
+
+        planned: dict[Path, PlannedFile] = {}
+        for item in self._plan:
+            planned.pop(item.file, None)
+            planned[item.file] = item
+        self._plan.clear()
+
+        self._plan_changed.update(self._execute_plan(list(planned.values())))
+
+    def _execute_plan(self, plan: list[PlannedFile]) -> list[Path]:
+        """
+        执行记录的安装，返回有变化的文件
+        """
+        from concurrent.futures import ThreadPoolExecutor, wait
+
+        with ThreadPoolExecutor(max_workers=self.install_workers) as executor:
+            diffs = list(
+                executor.map(
+                    lambda item: check_diff(item.file, item.content, item.mode, item.show_diff, self.max_diff_lines),
+                    plan,
+                )
+            )
+            changed = [(item, diff) for item, (has_diff, diff) in zip(plan, diffs) if has_diff]
+            futures = [executor.submit(self._stage_content, item.file, item.content.encode()) for item, _ in changed]
+            wait(futures)
+
+        # 某个临时文件写入失败时，删除其他已经写入的临时文件
+        errors = [error for error in (future.exception() for future in futures) if error is not None]
+        if errors:
+            for future in futures:
+                if future.exception() is None:
+                    future.result().unlink(missing_ok=True)
+            raise errors[0]
+
+        for (item, diff), future in zip(changed, futures):
+            if item.show_diff:
+                self.print(diff)
+            self.backup_file(item.file)
+            self._install_staged_file(item.file, future.result(), item.mode)
+
+        self.print(f"{len(changed)} files changed, {len(plan) - len(changed)} files up to date")
+        return [item.file for item, _ in changed]
+
+    def backup_file(self, file: Path):
+        """
+        备份即将被覆盖的系统文件，记录到 /opt/xrouter/backups/ 中本次运行（run_id）的 manifest，
+        并在 /opt/xrouter/backups/files/{run_id}/ 中保留一份硬链接，见 BackupStore
+        """
         if not file.exists():
             return
 
-        backup_full_path = self._get_backup_fullpath(self.file_backup_path / self.run_id, file)
-        backup_full_dir = backup_full_path.parent
-        backup_full_dir.mkdir(parents=True, exist_ok=True)
-        shutil.copy2(file, backup_full_path)
+        self.backup_store.backup(self.run_id, file)
 
     def setup(self, verbose: bool):
         """
@@ -211,11 +448,32 @@ class GwLib:
         # 如果其他 cached_property 需要重置，也用同样的方法
 
 
-def check_diff(path: Path, content: str | bytes, mode: str) -> tuple[bool, str]:
+def file_digest(path: Path) -> bytes | None:
+    """
+    分块读取文件计算 sha256，文件不存在时返回 None
+    """
+    import hashlib
+
+    try:
+        with path.open("rb") as fp:
+            return hashlib.file_digest(fp, "sha256").digest()
+    except FileNotFoundError:
+        return None
+
+
+def check_diff(
+    path: Path,
+    content: str | bytes,
+    mode: str,
+    show_diff: bool = True,
+    max_diff_lines: int = 0,
+) -> tuple[bool, str]:
     """
     Check difference between current content/mode and filesystem.
 
-    * Generates content diff for text files, binary status for binary files
+    * Compares file size first and only reads the file when sizes match
+    * Generates content diff for text files, binary status for binary files, only if show_diff is True
+    * Summarizes text diffs longer than max_diff_lines as "+x/-y lines" (0 means no limit)
     * Includes file mode changes
     * Appends (current)/(new) suffixes to filenames
     * Returns empty diff if content and mode are identical
@@ -225,10 +483,9 @@ def check_diff(path: Path, content: str | bytes, mode: str) -> tuple[bool, str]:
             - bool: True if there are any changes, False otherwise
             - str: The formatted diff text, empty string if no changes
     """
-    import difflib
-
-    # Get current mode
-    current_mode = oct(path.stat().st_mode)[-3:] if path.exists() else None
+    # Get current mode and size
+    stat = path.stat() if path.exists() else None
+    current_mode = oct(stat.st_mode)[-3:] if stat else None
 
     # Show mode changes if different
     has_diff = False
@@ -237,30 +494,52 @@ def check_diff(path: Path, content: str | bytes, mode: str) -> tuple[bool, str]:
         has_diff = True
         diff = f"mode change {current_mode} -> {mode}\n"
 
+    # 大小不同时内容一定不同，不需要读取现有文件
+    data = content.encode() if isinstance(content, str) else content
+    if stat and stat.st_size == len(data) and path.read_bytes() == data:
+        return has_diff, diff
+
+    has_diff = True
+    if not show_diff:
+        return has_diff, diff
+
     # Handle binary vs text content
     if isinstance(content, bytes):
-        current_binary_content = path.read_bytes() if path.exists() else b""
-        if current_binary_content == content:
-            return has_diff, diff
-
-        has_diff = True
         diff += "Binary files differ\n"
     else:
-        current_text_content = path.read_text() if path.exists() else ""
-        if current_text_content == content:
-            return has_diff, diff
-
-        has_diff = True
-        diff += "".join(
-            difflib.unified_diff(
-                current_text_content.splitlines(keepends=True),
-                content.splitlines(keepends=True),
-                f"{path} (current)",
-                f"{path} (new)",
-            )
-        )
+        current_text_content = path.read_text() if stat else ""
+        diff += format_text_diff(path, current_text_content, content, max_diff_lines)
 
     return has_diff, diff
 
 
+def format_text_diff(
+    path: Path,
+    current: str,
+    new: str,
+    max_diff_lines: int = 0,
+    labels: tuple[str, str] = ("current", "new"),
+) -> str:
+    """
+    生成 unified diff，变化的行数超过 max_diff_lines 时只返回 "+x/-y lines" 统计。
+
+    统计按行的多重集合差计算（线性复杂度），不考虑行的移动，足够用来判断变化规模，
+    避免对几万行的 zone 文件跑 difflib。
+    """
+    import difflib
+    from collections import Counter
+
+    current_lines = current.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+
+    if max_diff_lines > 0:
+        current_counter, new_counter = Counter(current_lines), Counter(new_lines)
+        added = (new_counter - current_counter).total()
+        removed = (current_counter - new_counter).total()
+        if added + removed > max_diff_lines:
+            return f"{path}: +{added}/-{removed} lines (diff too large, not shown)\n"
+
+    return "".join(difflib.unified_diff(current_lines, new_lines, f"{path} ({labels[0]})", f"{path} ({labels[1]})"))
+
+
 gw = GwLib()
@@ -0,0 +1,122 @@
+import hashlib
+import io
+import os
+import pickle
+import sys
+from pathlib import Path
+from typing import Any, Iterator
+
+# 快照格式变化时修改
+FORMAT_VERSION = 1
+
+
+def source_key() -> tuple:
+    """
+    配置模型的“版本”：xrouter 直接以源码方式部署，模型定义变化不一定伴随版本号变化，
+    这里用整个 xrouter 包中源文件的 size + mtime 代替，再加上 python、pydantic 的版本。
+
+    不只是 config 包：校验器和 model_post_init 会延迟导入 xrouter.utils 中的函数（如 parse_probe、domain_labels），
+    它们变得更严格时，旧的快照也必须失效。几十个文件的 stat 不到 1ms。
+    """
+    import pydantic
+
+    package_dir = Path(__file__).parent.parent
+    return (
+        FORMAT_VERSION,
+        sys.version,
+        pydantic.VERSION,
+        tuple(sorted(_source_stats(str(package_dir), len(str(package_dir)) + 1))),
+    )
+
+
+def _source_stats(directory: str, prefix_length: int) -> Iterator[tuple[str, int, int]]:
+    # os.scandir 比 Path.rglob 快一个数量级，跳过 __pycache__
+    for entry in os.scandir(directory):
+        if entry.is_dir():
+            if entry.name != "__pycache__":
+                yield from _source_stats(entry.path, prefix_length)
+        elif entry.name.endswith(".py"):
+            stat = entry.stat()
+            yield entry.path[prefix_length:], stat.st_size, stat.st_mtime_ns
+
+
+def load_config(config_file: Path, snapshot_file: Path, extra_key: tuple = ()) -> Any:
+    """
+    读取并校验 xrouter.yml，返回 XrouterConfig。
+
+    校验后的模型以 pickle 保存在 snapshot_file 中，以配置文件的 size + mtime、内容 sha256、
+    配置模型源码（见 source_key）以及 extra_key 判断是否失效。命中时只需要 unpickle，不需要解析 yaml 和校验。
+
+    pickle 可以执行任意代码，只读取当前用户所有、其他用户不可写的快照文件。
+    """
+    stat = config_file.stat()
+    key = (source_key(), extra_key)
+
+    snapshot = _open_snapshot(snapshot_file)
+    header = _load(snapshot) if snapshot else None
+    if header is None or header[0] != key:
+        snapshot = None
+
+    if snapshot and header and (header[1], header[2]) == (stat.st_size, stat.st_mtime_ns):
+        config = _load(snapshot)
+        if config is not None:
+            return config
+        snapshot = None
+
+    content = config_file.read_bytes()
+    digest = hashlib.sha256(content).digest()
+
+    # 文件被重写，但内容没有变化
+    config = _load(snapshot) if snapshot and header and header[3] == digest else None
+    if config is None:
+        config = parse_config(content)
+
+    _write_snapshot(snapshot_file, (key, stat.st_size, stat.st_mtime_ns, digest), config)
+    return config
+
+
+def parse_config(content: bytes) -> Any:
+    import yaml
+
+    from .config import XrouterConfig
+
+    # 优先使用 libyaml 的 C 实现
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    data = yaml.load(content, Loader=loader)
+    return XrouterConfig.model_validate(data)
+
+
+def _open_snapshot(snapshot_file: Path) -> io.BytesIO | None:
+    try:
+        with snapshot_file.open("rb") as fp:
+            stat = os.fstat(fp.fileno())
+            if stat.st_uid != os.getuid() or stat.st_mode & 0o022:
+                return None
+            return io.BytesIO(fp.read())
+    except OSError:
+        return None
+
+
+def _load(snapshot: io.BytesIO) -> Any:
+    try:
+        return pickle.load(snapshot)
+    except Exception:
+        return None
+
+
+def _write_snapshot(snapshot_file: Path, header: tuple, config: Any):
+    """
+    写入失败（例如没有权限）时忽略，不影响正常流程
+    """
+    from xrouter.gwlib import gw
+
+    try:
+        snapshot_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = snapshot_file.with_name(f".{snapshot_file.name}.tmp")
+        with tmp_file.open("wb") as fp:
+            os.fchmod(fp.fileno(), 0o600)
+            pickle.dump(header, fp, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(config, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp_file.replace(snapshot_file)
+    except (OSError, pickle.PicklingError) as e:
+        gw.logger.warning(f"Failed to write config snapshot {snapshot_file}: {e}")
@@ -0,0 +1,86 @@
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+
+
+def staging_file(file: Path) -> Path:
+    """
+    在目标文件所在目录创建一个临时文件，保证之后可以原子地 rename 到目标文件
+    """
+    import tempfile
+
+    file.parent.mkdir(parents=True, exist_ok=True)
+    fd, name = tempfile.mkstemp(prefix=f".{file.name}.", suffix=".tmp", dir=file.parent)
+    os.close(fd)
+    return Path(name)
+
+
+@dataclass
+class PlannedFile:
+    """
+    install_plan 中记录的一个待安装文件
+    """
+
+    file: Path
+    content: str
+    mode: str
+    show_diff: bool
+
+
+@dataclass
+class InstallTransaction:
+    """
+    一组待安装的文件，每个文件已经完整写入目标目录中的临时文件，并设置好了权限。
+
+    commit 时先统一 fsync 所有临时文件，再逐个 rename 到目标文件，最后 fsync 涉及的目录。
+    其他进程（dnsmasq、networkd、nft 等）在任何时刻看到的要么是旧文件，要么是完整的新文件。
+    """
+
+    # {file: tmp_file}
+    staged: dict[Path, Path] = field(default_factory=dict)
+
+    def stage(self, file: Path, tmp_file: Path, mode: str):
+        tmp_file.chmod(int(mode, 8))
+        # 临时文件属于当前用户（root），rename 之后保留目标文件原来的属主（如 dnsmasq、systemd-network）
+        try:
+            st = file.stat()
+        except FileNotFoundError:
+            pass
+        else:
+            os.chown(tmp_file, st.st_uid, st.st_gid)
+
+        # 同一个文件在一次事务中被安装多次时，以最后一次为准
+        previous = self.staged.pop(file, None)
+        if previous is not None:
+            previous.unlink(missing_ok=True)
+
+        self.staged[file] = tmp_file
+
+    def commit(self):
+        if not self.staged:
+            return
+
+        for tmp_file in self.staged.values():
+            fd = os.open(tmp_file, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+        for file, tmp_file in self.staged.items():
+            tmp_file.replace(file)
+
+        for directory in {file.parent for file in self.staged}:
+            fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+        self.staged.clear()
+
+    def abort(self):
+        for tmp_file in self.staged.values():
+            tmp_file.unlink(missing_ok=True)
+
+        self.staged.clear()
@@ -1,3 +1,17 @@
+import operator
+import re
+import socket
+import struct
+from functools import partial
+from itertools import repeat
+from typing import Iterable
+
+# (version, network, prefixlen)
+Cidr = tuple[int, int, int]
+# (version, first, last)，闭区间
+Interval = tuple[int, int, int]
+
+
 def merge_cidr_list(cidrs: list[str]) -> list[str]:
     from netaddr import IPNetwork, cidr_merge
 
@@ -24,3 +38,202 @@ def safe_parse_cidr(v: str) -> str | None:
         return str(IPNetwork(v))
     except Exception:
         return None
+
+
+def parse_cidr(value: str) -> Cidr | None:
+    """
+    将 `1.2.3.0/24`、`2001:db8::/32` 形式的字符串解析为 (version, network, prefixlen)，无效时返回 None。
+
+    与 `ipaddress.ip_network(value)`（strict=True）一致：主机位不为 0 的视为无效，省略 prefixlen 时为单个地址。
+    不依赖 pydantic/ipaddress，直接用 inet_pton 转换为整数，解析大量 zone 文件时快一个数量级以上。
+    """
+    address, sep, prefixlen_str = value.partition("/")
+
+    if ":" in address:
+        family, version, bits = socket.AF_INET6, 6, 128
+    else:
+        family, version, bits = socket.AF_INET, 4, 32
+
+    try:
+        network = int.from_bytes(socket.inet_pton(family, address), "big")
+    except OSError:
+        return None
+
+    if sep:
+        if not (prefixlen_str.isascii() and prefixlen_str.isdigit()):
+            return None
+        prefixlen = int(prefixlen_str)
+        if prefixlen > bits:
+            return None
+    else:
+        prefixlen = bits
+
+    if network & ((1 << (bits - prefixlen)) - 1):
+        return None
+
+    return (version, network, prefixlen)
+
+
+def parse_cidr_lines(text: str) -> list[Cidr]:
+    """
+    解析 zone 文件内容，每行一个 cidr，`#` 之后为注释，每行只取第一个字段，空行和无效行忽略。
+
+    zone 文件通常每行都是同一地址族、带 prefixlen 的 cidr，这种情况下整个文件一次性转换（split/inet_pton/unpack
+    都在 C 中批量完成），否则退回逐行 parse_cidr。
+    """
+    if "#" in text:
+        text = _COMMENT.sub("", text)
+
+    if " " in text or "\t" in text:
+        fields = [line_fields[0] for line_fields in map(str.split, text.splitlines()) if line_fields]
+    else:
+        fields = text.split()
+
+    try:
+        return _parse_cidr_fields_bulk(fields)
+    except ValueError:
+        return [cidr for cidr in map(parse_cidr, fields) if cidr is not None]
+
+
+_COMMENT = re.compile(r"#[^\n]*")
+_DOUBLE_SLASH = re.compile(r"/[^\n/]*/")
+
+_HOST_MASKS = {
+    4: [(1 << (32 - prefixlen)) - 1 for prefixlen in range(33)],
+    6: [(1 << (128 - prefixlen)) - 1 for prefixlen in range(129)],
+}
+
+
+def _parse_cidr_fields_bulk(fields: list[str]) -> list[Cidr]:
+    """
+    批量转换同一地址族、全部带 prefixlen 的 cidr 列表，遇到任何不满足条件的情况抛出 ValueError。
+    """
+    joined = "\n".join(fields)
+    # 总数相等且没有一行有两个 `/`，才能保证每个字段恰好一个 `/`，否则 `a/8/b` 和 `8` 两行也能拼出交替的结果
+    if joined.count("/") != len(fields) or _DOUBLE_SLASH.search(joined):
+        raise ValueError("prefixlen missing")
+
+    parts = joined.replace("/", "\n").split("\n")
+    addresses = parts[0::2]
+    prefixlen_strs = parts[1::2]
+
+    prefixlens_str = "".join(prefixlen_strs)
+    if not (prefixlens_str.isascii() and prefixlens_str.isdigit()):
+        raise ValueError("invalid prefixlen")
+    prefixlens = list(map(int, prefixlen_strs))
+
+    try:
+        if ":" in joined:
+            version = 6
+            packed = b"".join(map(partial(socket.inet_pton, socket.AF_INET6), addresses))
+            halves = struct.unpack(f">{len(addresses) * 2}Q", packed)
+            networks = [hi << 64 | lo for hi, lo in zip(halves[0::2], halves[1::2])]
+        else:
+            version = 4
+            packed = b"".join(map(partial(socket.inet_pton, socket.AF_INET), addresses))
+            networks = list(struct.unpack(f">{len(addresses)}I", packed))
+    except OSError:
+        raise ValueError("invalid address") from None
+
+    try:
+        host_bits = any(map(operator.and_, networks, map(_HOST_MASKS[version].__getitem__, prefixlens)))
+    except IndexError:
+        raise ValueError("invalid prefixlen") from None
+    if host_bits:
+        raise ValueError("host bits set")
+
+    return list(zip(repeat(version), networks, prefixlens))
+
+
+def aggregate_cidrs(cidrs: Iterable[Cidr]) -> list[Cidr]:
+    """
+    合并 cidr 列表（与 netaddr.cidr_merge 相同的效果，但直接在整数上计算）：
+
+    * 删除被其他 cidr 完全覆盖的 cidr
+    * 相邻且可以合并的两个 cidr 合并为上一级（如 1.2.2.0/24 + 1.2.3.0/24 -> 1.2.2.0/23），直到不能再合并
+
+    返回按 (version, network, prefixlen) 排序的结果。cidrs 可以是生成器，只遍历一次。
+    """
+    # 每个地址族各遍历一次
+    cidrs = list(cidrs)
+    result: list[Cidr] = []
+
+    for version, bits in ((4, 32), (6, 128)):
+        stack: list[tuple[int, int]] = []
+
+        for network, prefixlen in sorted((cidr[1], cidr[2]) for cidr in cidrs if cidr[0] == version):
+            # 排序后，能覆盖当前 cidr 的只可能是栈顶
+            if stack:
+                top_network, top_prefixlen = stack[-1]
+                shift = bits - top_prefixlen
+                if top_prefixlen <= prefixlen and network >> shift == top_network >> shift:
+                    continue
+
+            stack.append((network, prefixlen))
+
+            while len(stack) >= 2:
+                (network1, prefixlen1), (network2, prefixlen2) = stack[-2], stack[-1]
+                size = 1 << (bits - prefixlen1)
+                if prefixlen1 != prefixlen2 or prefixlen1 == 0 or network1 & size or network2 != network1 + size:
+                    break
+                stack[-2:] = [(network1, prefixlen1 - 1)]
+
+        result.extend((version, network, prefixlen) for network, prefixlen in stack)
+
+    return result
+
+
+def format_cidr(cidr: Cidr) -> str:
+    """
+    将 (version, network, prefixlen) 转换为字符串形式，如 `1.2.3.0/24`。
+    """
+    version, network, prefixlen = cidr
+    if version == 4:
+        return f"{socket.inet_ntop(socket.AF_INET, network.to_bytes(4, 'big'))}/{prefixlen}"
+    else:
+        return f"{socket.inet_ntop(socket.AF_INET6, network.to_bytes(16, 'big'))}/{prefixlen}"
+
+
+def cidrs_to_intervals(cidrs: Iterable[Cidr]) -> list[Interval]:
+    """
+    将 cidr 列表转换为地址区间，重叠和相邻的区间合并为一个（与 nftables interval set 的 auto-merge 一致）。
+
+    返回按 (version, first) 排序的结果。cidrs 可以是生成器，只遍历一次。
+    """
+    # 每个地址族各遍历一次
+    cidrs = list(cidrs)
+    result: list[Interval] = []
+
+    for version, bits in ((4, 32), (6, 128)):
+        ranges = sorted(
+            (network, network + (1 << (bits - prefixlen)) - 1) for v, network, prefixlen in cidrs if v == version
+        )
+
+        merged: list[list[int]] = []
+        for first, last in ranges:
+            if merged and first <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], last)
+            else:
+                merged.append([first, last])
+
+        result.extend((version, first, last) for first, last in merged)
+
+    return result
+
+
+def format_interval(interval: Interval) -> str:
+    """
+    将 (version, first, last) 转换为 nftables 的元素，能表示为 cidr 时输出 cidr，否则输出 `first-last`
+    """
+    version, first, last = interval
+    bits = 32 if version == 4 else 128
+    family = socket.AF_INET if version == 4 else socket.AF_INET6
+
+    size = last - first + 1
+    if size & (size - 1) == 0 and first % size == 0:
+        return format_cidr((version, first, bits - size.bit_length() + 1))
+
+    def address(value: int) -> str:
+        return socket.inet_ntop(family, value.to_bytes(bits // 8, "big"))
+
+    return f"{address(first)}-{address(last)}"
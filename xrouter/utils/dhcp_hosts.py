@@ -0,0 +1,127 @@
+import bisect
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+CSV_FIELDS = ("mac", "ip", "hostname")
+
+
+@dataclass
+class ReservationIndex:
+    """
+    DHCP 预留（DHCPHost）的索引：MAC -> host、IP -> host，以及所有 DHCPRange 所在网段的区间索引。
+
+    逐个添加时检查冲突，每个 host 只需要几次字典查询和一次二分查找，几千条预留也是线性时间：
+
+    * 同一个 MAC（不区分大小写，`-` 等同于 `:`）预留了多个地址
+    * 同一个地址预留给了多个 host
+
+    地址不在任何 DHCPRange 所在的网段中时只记录到 warnings：没有配置 netmask 的 range 网段是推算的，
+    不一定准确，dnsmasq 也只是不使用这样的预留。
+    """
+
+    # 合并后的网段区间 (first, last)，按 first 排序
+    intervals: list[tuple[int, int]] = field(default_factory=list)
+    hosts: list[Any] = field(default_factory=list)
+    by_mac: dict[str, Any] = field(default_factory=dict)
+    by_ip: dict[int, Any] = field(default_factory=dict)
+    errors: list[str] = field(default_factory=list)
+    warnings: list[str] = field(default_factory=list)
+
+    def __post_init__(self):
+        self.starts = [first for first, _ in self.intervals]
+
+    @classmethod
+    def build(cls, intervals: Iterable[tuple[int, int]], hosts: Iterable[Any] = ()) -> "ReservationIndex":
+        merged: list[tuple[int, int]] = []
+        for first, last in sorted(intervals):
+            if merged and first <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+            else:
+                merged.append((first, last))
+
+        index = cls(merged)
+        for host in hosts:
+            index.add(host)
+        return index
+
+    def add(self, host: Any) -> bool:
+        """
+        添加一个预留，有冲突时记录到 errors 并返回 False，不加入索引
+        """
+        errors = []
+
+        mac = normalize_mac(host.mac) if host.mac else None
+        if mac and mac in self.by_mac:
+            errors.append(f"duplicate MAC {host.mac}: {describe(self.by_mac[mac])} and {describe(host)}")
+
+        ip = int(host.ip)
+        if ip in self.by_ip:
+            errors.append(f"duplicate IP {host.ip}: {describe(self.by_ip[ip])} and {describe(host)}")
+
+        if errors:
+            self.errors.extend(errors)
+            return False
+
+        if not self.in_ranges(ip):
+            self.warnings.append(f"{describe(host)} is outside every dhcp range, dnsmasq will not use it")
+
+        if mac:
+            self.by_mac[mac] = host
+        self.by_ip[ip] = host
+        self.hosts.append(host)
+        return True
+
+    def in_ranges(self, ip: int) -> bool:
+        i = bisect.bisect_right(self.starts, ip) - 1
+        return i >= 0 and ip <= self.intervals[i][1]
+
+    def check(self):
+        if self.errors:
+            raise ValueError(f"{len(self.errors)} DHCP reservation conflicts:\n" + "\n".join(self.errors))
+
+
+def normalize_mac(mac: str) -> str:
+    return mac.strip().lower().replace("-", ":")
+
+
+def describe(host: Any) -> str:
+    return "/".join(str(value) for value in (host.mac, host.ip, host.hostname) if value)
+
+
+def read_csv(path: Path) -> Iterator[dict[str, str | None]]:
+    """
+    读取 mac,ip,hostname 格式的 CSV，第一行为表头，空的字段为 None
+    """
+    import csv
+
+    with path.open(newline="", encoding="utf8") as fp:
+        for row in csv.DictReader(fp):
+            yield {name: (row.get(name) or "").strip() or None for name in CSV_FIELDS}
+
+
+def read_leases(path: Path) -> Iterator[dict[str, str | None]]:
+    """
+    读取 dnsmasq 的 lease 文件（dnsmasq.leases），每行 `expiry mac ip hostname client-id`，
+    未知的 hostname 为 `*`，忽略 IPv6 的 duid 行和 IPv6 租约
+    """
+    with path.open(encoding="utf8") as fp:
+        for line in fp:
+            fields = line.split()
+            if len(fields) < 4 or fields[0] == "duid" or ":" in fields[2]:
+                continue
+            yield {"mac": fields[1], "ip": fields[2], "hostname": None if fields[3] == "*" else fields[3]}
+
+
+def csv_lines(hosts: Iterable[Any]) -> Iterator[str]:
+    import csv
+    import io
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    yield ",".join(CSV_FIELDS) + "\n"
+    for host in hosts:
+        writer.writerow([host.mac or "", host.ip, host.hostname or ""])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
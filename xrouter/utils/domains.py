@@ -0,0 +1,117 @@
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator
+
+# dnsmasq 以 MAXDNAME（1025）字节的缓冲区逐行读取配置文件，更长的行会被截断
+MAX_SERVER_LINE = 1000
+
+# 后缀树中的终止标记，不是字符串，不会与任何 label 冲突
+END = object()
+
+
+@dataclass
+class DomainTrie:
+    """
+    域名后缀树，按 label 从右到左存储（com -> example -> www）。
+
+    dnsmasq 的 `server=/example.com/...` 同时匹配所有子域名，所以已经被上级域名覆盖的条目是多余的：
+    添加域名时，路径上已有终止节点则忽略；新的终止节点会删除它下面的所有子域名。
+    """
+
+    root: dict = field(default_factory=dict)
+    # 重复、被上级域名覆盖而忽略或删除的条目数
+    duplicates: int = 0
+    covered: int = 0
+    # 有空 label 而忽略的条目数（如 `.`、`a..com`）
+    invalid: int = 0
+
+    def add(self, domain: str):
+        try:
+            labels = domain_labels(domain)
+        except ValueError:
+            self.invalid += 1
+            return
+
+        node = self.root
+        for label in reversed(labels):
+            if END in node:
+                self.covered += 1
+                return
+            node = node.setdefault(label, {})
+
+        if END in node:
+            self.duplicates += 1
+            return
+
+        self.covered += count_domains(node)
+        node.clear()
+        node[END] = True
+
+    def __iter__(self) -> Iterator[str]:
+        """
+        按反转后的 label 排序输出，同一个上级域名下的条目相邻，输出稳定
+        """
+        stack: list[tuple[dict, tuple[str, ...]]] = [(self.root, ())]
+        while stack:
+            node, labels = stack.pop()
+            if END in node:
+                yield ".".join(reversed(labels))
+                continue
+            for label in sorted(node, reverse=True):
+                stack.append((node[label], (*labels, label)))
+
+
+def domain_labels(domain: str) -> list[str]:
+    """
+    转为小写、去掉结尾的 `.`，拆分为 label。有空 label 时抛出 ValueError：
+    `server=//...` 匹配所有域名，`a..com` 会被当作 `com`
+    """
+    labels = domain.strip().lower().removesuffix(".").split(".")
+    if not all(labels):
+        raise ValueError(f"invalid domain {domain!r}: empty label")
+    return labels
+
+
+def count_domains(node: dict) -> int:
+    if END in node:
+        return 1
+    return sum(count_domains(child) for child in node.values())
+
+
+def parse_server_domains(lines: Iterable[str]) -> Iterator[tuple[str, str]]:
+    """
+    解析 `server=/domain1/domain2/.../upstream` 行，返回 (domain, upstream)，忽略注释和其他配置项
+    """
+    for line in lines:
+        line = line.strip()
+        if not line.startswith("server=/"):
+            continue
+
+        *domains, upstream = line[len("server=/") :].split("/")
+        for domain in domains:
+            if domain:
+                yield domain, upstream
+
+
+def server_lines(domains: Iterable[str], upstreams: list[str], max_length: int = MAX_SERVER_LINE) -> Iterator[str]:
+    """
+    域名按行长分组，每组拼接一次，为每个上游输出一行 `server=/d1/d2/.../upstream`，行长不超过 max_length
+    """
+    prefix = "server=/"
+    overhead = len(prefix) + max(len(upstream) for upstream in upstreams) + 2
+
+    def emit(chunk: list[str]) -> Iterator[str]:
+        body = prefix + "/".join(chunk)
+        for upstream in upstreams:
+            yield f"{body}/{upstream}\n"
+
+    chunk: list[str] = []
+    length = overhead
+    for domain in domains:
+        if chunk and length + len(domain) + 1 > max_length:
+            yield from emit(chunk)
+            chunk, length = [], overhead
+        chunk.append(domain)
+        length += len(domain) + 1
+
+    if chunk:
+        yield from emit(chunk)
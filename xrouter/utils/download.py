@@ -1,17 +1,194 @@
-from typing import Literal
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Literal
 
+DownloadType = Literal["json", "text", "stream"]
+
+
+@dataclass
+class Download:
+    url: str
+    # 下载失败或者 not_modified 时为 None，type 为 stream 时是下载到的临时文件路径，由调用方负责删除
+    content: Any = None
+    # 服务端返回 304，本地文件已经是最新
+    not_modified: bool = False
+    etag: str | None = None
+    last_modified: str | None = None
+    # 响应内容的 sha256 (hex)
+    digest: str | None = None
+    error: Exception | None = None
+
+
+@dataclass
+class HttpCache:
+    """
+    记录每个 url 上一次下载时的 ETag/Last-Modified，用于条件请求（If-None-Match/If-Modified-Since）。
+
+    缓存存放在 zones_root/.http-cache.json，每条记录同时保存由该 url 生成的所有输出文件路径，
+    任一文件不存在时不发送条件请求，避免服务端返回 304 而本地没有文件。
+
+    另外记录响应内容的 sha256，服务端不支持条件请求时，可以用 unchanged() 判断内容是否和上次一样。
+    """
+
+    file: Path
+    entries: dict[str, dict[str, Any]] = field(default_factory=dict)
+
+    def __post_init__(self):
+        import json
+
+        if self.file.exists():
+            try:
+                self.entries = json.loads(self.file.read_text())
+            except ValueError:
+                self.entries = {}
+
+    def _entry(self, url: str) -> dict[str, Any] | None:
+        """
+        返回 url 的缓存记录，输出文件有缺失时返回 None
+        """
+        entry = self.entries.get(url)
+        if not entry or not all(Path(path).exists() for path in entry.get("paths", [])):
+            return None
+        return entry
+
+    def forget_outside(self, url: str, root: Path):
+        """
+        输出目录变化后（例如 china-names 改为保存到 names_root），删除输出在 root 之外的旧记录
+        """
+        entry = self.entries.get(url)
+        if entry and not all(Path(path).is_relative_to(root) for path in entry.get("paths", [])):
+            del self.entries[url]
+
+    def headers(self, url: str) -> dict[str, str]:
+        entry = self._entry(url)
+        if not entry:
+            return {}
+
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def unchanged(self, download: Download) -> bool:
+        entry = self._entry(download.url)
+        return bool(entry and download.digest and entry.get("sha256") == download.digest)
+
+    def update(self, download: Download, paths: list[Path]):
+        """
+        在输出文件成功写入之后调用，记录本次下载的 ETag/Last-Modified/sha256
+        """
+        if download.etag or download.last_modified or download.digest:
+            self.entries[download.url] = {
+                "paths": [str(path) for path in paths],
+                "etag": download.etag or "",
+                "last_modified": download.last_modified or "",
+                "sha256": download.digest or "",
+            }
+        else:
+            self.entries.pop(download.url, None)
+
+    def save(self):
+        import json
+
+        self.file.parent.mkdir(parents=True, exist_ok=True)
+        self.file.write_text(json.dumps(self.entries, indent=2, sort_keys=True) + "\n")
+
+
+def download_many(
+    urls: list[str],
+    type: DownloadType = "text",
+    cache: HttpCache | None = None,
+    concurrency: int = 8,
+    timeout: float = 60,
+    types: dict[str, DownloadType] | None = None,
+) -> dict[str, Download]:
+    """
+    并发下载多个 url，所有请求共用一个 httpx.AsyncClient（连接复用），同时进行的请求数不超过 concurrency。
+
+    types 可以为单个 url 指定不同于 type 的内容格式。
+
+    type 为 stream 时，响应内容边下载边写入临时文件，不会整个读入内存，适合较大的列表文件。
+
+    传入 cache 时发送条件请求，服务端返回 304 的 url 结果为 not_modified。
+    下载失败时记录日志，结果中 error 不为 None。
+    """
+    import asyncio
+
+    url_types = {url: (types or {}).get(url, type) for url in urls}
+    return asyncio.run(_download_many(url_types, cache, concurrency, timeout))
+
+
+async def _download_many(
+    url_types: dict[str, DownloadType],
+    cache: HttpCache | None,
+    concurrency: int,
+    timeout: float,
+) -> dict[str, Download]:
+    import asyncio
+    import hashlib
 
-def download_text(url: str, type: Literal["json", "text"] = "json"):
     import httpx
 
     from xrouter.gwlib import gw
 
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def download(client: httpx.AsyncClient, url: str) -> Download:
+        headers = cache.headers(url) if cache else {}
+        async with semaphore:
+            try:
+                async with client.stream("GET", url, headers=headers) as resp:
+                    if resp.status_code == 304:
+                        gw.print(f"Not modified: {url}")
+                        return Download(url, not_modified=True)
+
+                    resp.raise_for_status()
+                    content: Any
+                    if url_types[url] == "stream":
+                        content, digest = await _stream_to_file(resp)
+                    else:
+                        body = await resp.aread()
+                        content = resp.json() if url_types[url] == "json" else resp.text
+                        digest = hashlib.sha256(body).hexdigest()
+
+                gw.print(f"Downloaded {url}")
+                return Download(
+                    url,
+                    content=content,
+                    etag=resp.headers.get("ETag"),
+                    last_modified=resp.headers.get("Last-Modified"),
+                    digest=digest,
+                )
+            except Exception as e:
+                gw.logger.error(f"Failed to download {url}", exc_info=e)
+                return Download(url, error=e)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        downloads = await asyncio.gather(*(download(client, url) for url in url_types))
+
+    return {download.url: download for download in downloads}
+
+
+async def _stream_to_file(resp) -> tuple[Path, str]:
+    """
+    将响应内容写入临时文件，同时计算 sha256，返回 (临时文件路径, sha256)
+    """
+    import hashlib
+    import os
+    import tempfile
+
+    fd, tmp_name = tempfile.mkstemp(prefix="xrouter-download-")
+    digest = hashlib.sha256()
     try:
-        resp = httpx.get(url)
-        resp.raise_for_status()
-        if type == "json":
-            return resp.json()
-        elif type == "text":
-            return resp.text
-    except Exception as e:
-        gw.logger.error(f"Failed to download {url}", exc_info=e)
+        with os.fdopen(fd, "wb") as fp:
+            async for chunk in resp.aiter_bytes():
+                digest.update(chunk)
+                fp.write(chunk)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+    return Path(tmp_name), digest.hexdigest()
@@ -0,0 +1,56 @@
+import json
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+
+@dataclass
+class EventQueue:
+    """
+    基于目录的事件队列，每个事件一个 json 文件，多个进程可以同时写入。
+
+    文件名以写入时间开头，按文件名排序即按写入顺序。
+    """
+
+    root: Path
+
+    def put(self, event: dict):
+        self.root.mkdir(parents=True, exist_ok=True)
+        name = f"{time.time_ns()}-{os.getpid()}"
+        tmp_file = self.root / f".{name}.tmp"
+        tmp_file.write_text(json.dumps(event))
+        tmp_file.replace(self.root / f"{name}.json")
+
+    def pending(self) -> list[Path]:
+        if not self.root.exists():
+            return []
+
+        return sorted(self.root.glob("*.json"))
+
+    def wait_quiet(self, window: float, max_wait: float):
+        """
+        等待直到 window 秒内没有新的事件写入，最多等待 max_wait 秒
+        """
+        deadline = time.monotonic() + max_wait
+        count = len(self.pending())
+        while (remaining := deadline - time.monotonic()) > 0:
+            time.sleep(min(window, remaining))
+            new_count = len(self.pending())
+            if new_count == count:
+                return
+            count = new_count
+
+    def drain(self) -> list[dict]:
+        """
+        取出所有事件，无法解析的事件直接丢弃
+        """
+        events = []
+        for path in self.pending():
+            try:
+                events.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                pass
+            path.unlink(missing_ok=True)
+
+        return events
@@ -0,0 +1,642 @@
+import os
+import socket
+import struct
+from typing import Iterator, NamedTuple
+
+# 这些常量 socket 模块中没有，取自 linux/netlink.h、linux/rtnetlink.h、linux/fib_rules.h。
+# 不使用 pyroute2，它的 import 需要 200ms 左右，networkd-dispatcher hook 每次都要付出这个代价。
+SOL_NETLINK = 270
+NETLINK_CAP_ACK = 10
+NETLINK_GET_STRICT_CHK = 12
+
+NLM_F_REQUEST = 0x1
+NLM_F_ACK = 0x4
+NLM_F_DUMP = 0x300
+NLM_F_REPLACE = 0x100
+NLM_F_EXCL = 0x200
+NLM_F_CREATE = 0x400
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_GETLINK = 18
+RTM_NEWROUTE = 24
+RTM_DELROUTE = 25
+RTM_GETROUTE = 26
+RTM_NEWRULE = 32
+RTM_DELRULE = 33
+RTM_GETRULE = 34
+
+RTA_DST = 1
+RTA_OIF = 4
+RTA_GATEWAY = 5
+RTA_PRIORITY = 6
+RTA_PREFSRC = 7
+RTA_TABLE = 15
+
+IFLA_IFNAME = 3
+
+IFF_UP = 0x1
+IFF_LOWER_UP = 0x10000
+
+RTMGRP_LINK = 0x1
+
+RTPROT_BOOT = 3
+RT_SCOPE_UNIVERSE = 0
+RT_SCOPE_LINK = 253
+RT_SCOPE_NOWHERE = 255
+RTN_UNICAST = 1
+
+RTNH_F_ONLINK = 4
+
+FRA_DST = 1
+FRA_SRC = 2
+FRA_IIFNAME = 3
+FRA_PRIORITY = 6
+FRA_FWMARK = 10
+FRA_SUPPRESS_PREFIXLEN = 14
+FRA_TABLE = 15
+FRA_FWMASK = 16
+FRA_OIFNAME = 17
+
+FR_ACT_TO_TBL = 1
+FR_ACT_BLACKHOLE = 6
+FR_ACT_UNREACHABLE = 7
+FR_ACT_PROHIBIT = 8
+
+FIB_RULE_INVERT = 2
+
+NLMSGHDR = struct.Struct("=IHHII")
+RTMSG = struct.Struct("=BBBBBBBBI")
+# struct fib_rule_hdr 与 rtmsg 布局相同：family, dst_len, src_len, tos, table, res1, res2, action, flags
+FIBMSG = RTMSG
+IFINFOMSG = struct.Struct("=BxHiII")
+RTATTR = struct.Struct("=HH")
+U32 = struct.Struct("=I")
+
+# 路由表名，其他名字从 /etc/iproute2/rt_tables 中查找
+ROUTE_TABLE_NAMES = {"default": 253, "main": 254, "local": 255}
+
+
+class LiveRoute(NamedTuple):
+    # (version, network, prefixlen)，与 xrouter.utils.cidr 中的 cidr tuple 一致
+    dst: tuple[int, int, int]
+    gateway: bytes | None
+    oif: int | None
+    priority: int | None
+    prefsrc: bytes | None = None
+
+
+class LiveLink(NamedTuple):
+    ifindex: int
+    name: str
+    flags: int
+
+    @property
+    def up(self) -> bool:
+        """
+        接口已启用且有载波，与 `ip link` 中的 UP,LOWER_UP 一致
+        """
+        return bool(self.flags & IFF_UP and self.flags & IFF_LOWER_UP)
+
+
+class Nexthop(NamedTuple):
+    """
+    路由的下一跳，由配置中的 gateway 字符串（`ip route` 的参数，如 `via 1.2.3.4 dev eth0`）解析而来。
+
+    为 None 的字段表示配置中没有指定，对比时忽略。
+    """
+
+    family: int
+    gateway: bytes | None = None
+    oif: int | None = None
+    priority: int | None = None
+    prefsrc: bytes | None = None
+    onlink: bool = False
+
+    def match(self, route: LiveRoute) -> bool:
+        if self.gateway is not None and self.gateway != route.gateway:
+            return False
+        if self.oif is not None and self.oif != route.oif:
+            return False
+        if self.priority is not None and self.priority != route.priority:
+            return False
+        if self.prefsrc is not None and self.prefsrc != route.prefsrc:
+            return False
+        return True
+
+    @property
+    def scope(self) -> int:
+        # 与 iproute2 一致：没有 via 的路由为 link scope
+        return RT_SCOPE_UNIVERSE if self.gateway else RT_SCOPE_LINK
+
+    @property
+    def attrs(self) -> bytes:
+        data = b""
+        if self.gateway is not None:
+            data += rtattr(RTA_GATEWAY, self.gateway)
+        if self.oif is not None:
+            data += rtattr(RTA_OIF, U32.pack(self.oif))
+        if self.priority is not None:
+            data += rtattr(RTA_PRIORITY, U32.pack(self.priority))
+        if self.prefsrc is not None:
+            data += rtattr(RTA_PREFSRC, self.prefsrc)
+        return data
+
+
+def parse_nexthop(spec: str, family: int) -> Nexthop:
+    """
+    解析 `ip route` 风格的下一跳参数，支持 `via`、`dev`、`metric`、`src`、`onlink`。
+
+    地址族不一致、接口不存在、无法识别的参数都会抛出 ValueError。
+    """
+    kwargs: dict = {}
+
+    tokens = iter(spec.split())
+    for key in tokens:
+        if key == "onlink":
+            kwargs["onlink"] = True
+            continue
+
+        value = next(tokens, None)
+        if value is None:
+            raise ValueError(f"Missing value for {key}: {spec}")
+
+        if key in ("via", "src"):
+            try:
+                address = socket.inet_pton(family, value)
+            except OSError:
+                raise ValueError(f"Invalid address for {key}: {value}") from None
+            kwargs["gateway" if key == "via" else "prefsrc"] = address
+        elif key == "dev":
+            try:
+                kwargs["oif"] = socket.if_nametoindex(value)
+            except OSError:
+                raise ValueError(f"Cannot find device: {value}") from None
+        elif key in ("metric", "priority", "preference"):
+            kwargs["priority"] = int(value)
+        else:
+            raise ValueError(f"Unsupported nexthop option {key}: {spec}")
+
+    return Nexthop(family, **kwargs)
+
+
+class Rule(NamedTuple):
+    """
+    策略路由规则，由配置中的 rule 字符串（`ip rule add` 的参数）解析而来，或从内核中读取。
+
+    priority 为 None 时由内核自动分配，对比时忽略。
+    """
+
+    family: int = socket.AF_INET
+    priority: int | None = None
+    table: int = 0
+    action: int = FR_ACT_TO_TBL
+    src: str | None = None
+    src_len: int = 0
+    dst: str | None = None
+    dst_len: int = 0
+    tos: int = 0
+    fwmark: int | None = None
+    fwmask: int | None = None
+    iifname: str | None = None
+    oifname: str | None = None
+    invert: bool = False
+    suppress_prefixlen: int | None = None
+
+    def match(self, other: "Rule") -> bool:
+        if self.priority is None:
+            return self._replace(priority=other.priority) == other
+        return self == other
+
+    def encode(self, msg_type: int, flags: int, seq: int) -> bytes:
+        fib = FIBMSG.pack(
+            self.family,
+            self.dst_len,
+            self.src_len,
+            self.tos,
+            self.table if self.table < 256 else 0,
+            0,
+            0,
+            self.action,
+            FIB_RULE_INVERT if self.invert else 0,
+        )
+
+        attrs = rtattr(FRA_TABLE, U32.pack(self.table))
+        if self.priority is not None:
+            attrs += rtattr(FRA_PRIORITY, U32.pack(self.priority))
+        if self.src is not None:
+            attrs += rtattr(FRA_SRC, socket.inet_pton(self.family, self.src))
+        if self.dst is not None:
+            attrs += rtattr(FRA_DST, socket.inet_pton(self.family, self.dst))
+        if self.fwmark is not None:
+            attrs += rtattr(FRA_FWMARK, U32.pack(self.fwmark))
+        if self.fwmask is not None:
+            attrs += rtattr(FRA_FWMASK, U32.pack(self.fwmask))
+        if self.iifname is not None:
+            attrs += rtattr(FRA_IIFNAME, self.iifname.encode() + b"\0")
+        if self.oifname is not None:
+            attrs += rtattr(FRA_OIFNAME, self.oifname.encode() + b"\0")
+        if self.suppress_prefixlen is not None:
+            attrs += rtattr(FRA_SUPPRESS_PREFIXLEN, U32.pack(self.suppress_prefixlen))
+
+        return NLMSGHDR.pack(NLMSGHDR.size + len(fib) + len(attrs), msg_type, flags, seq, 0) + fib + attrs
+
+
+def parse_route_table(value: str) -> int:
+    if value.isdigit():
+        return int(value)
+    if value in ROUTE_TABLE_NAMES:
+        return ROUTE_TABLE_NAMES[value]
+
+    rt_tables = "/etc/iproute2/rt_tables"
+    if os.path.exists(rt_tables):
+        with open(rt_tables) as fp:
+            for line in fp:
+                fields = line.split("#", 1)[0].split()
+                if len(fields) == 2 and fields[1] == value:
+                    return int(fields[0], 0)
+
+    raise ValueError(f"Unknown route table: {value}")
+
+
+def parse_rule(spec: str) -> Rule:
+    """
+    解析 `ip rule add` 风格的参数，支持常用的选项：
+
+    `not`, `from`, `to`, `tos`, `fwmark`, `iif`, `oif`, `lookup`/`table`, `pref`, `suppress_prefixlength`,
+    以及 `blackhole`/`unreachable`/`prohibit`。
+    """
+    actions = {"blackhole": FR_ACT_BLACKHOLE, "unreachable": FR_ACT_UNREACHABLE, "prohibit": FR_ACT_PROHIBIT}
+
+    kwargs: dict = {}
+
+    tokens = iter(spec.split())
+    for key in tokens:
+        if key == "not":
+            kwargs["invert"] = True
+            continue
+        if key in actions:
+            kwargs["action"] = actions[key]
+            continue
+
+        value = next(tokens, None)
+        if value is None:
+            raise ValueError(f"Missing value for {key}: {spec}")
+
+        if key in ("from", "to"):
+            if value == "all":
+                continue
+            address, _, prefixlen = value.partition("/")
+            family = socket.AF_INET6 if ":" in address else socket.AF_INET
+            max_prefixlen = 32 if family == socket.AF_INET else 128
+            try:
+                socket.inet_pton(family, address)
+            except OSError:
+                raise ValueError(f"Invalid address for {key}: {value}") from None
+            kwargs["family"] = family
+            kwargs["src" if key == "from" else "dst"] = address
+            kwargs["src_len" if key == "from" else "dst_len"] = int(prefixlen) if prefixlen else max_prefixlen
+        elif key in ("tos", "dsfield"):
+            kwargs["tos"] = int(value, 0)
+        elif key == "fwmark":
+            mark, _, mask = value.partition("/")
+            kwargs["fwmark"] = int(mark, 0)
+            kwargs["fwmask"] = int(mask, 0) if mask else 0xFFFFFFFF
+        elif key in ("iif", "iifname", "dev"):
+            kwargs["iifname"] = value
+        elif key in ("oif", "oifname"):
+            kwargs["oifname"] = value
+        elif key in ("lookup", "table"):
+            kwargs["table"] = parse_route_table(value)
+        elif key in ("pref", "priority", "preference", "order"):
+            kwargs["priority"] = int(value)
+        elif key == "suppress_prefixlength":
+            kwargs["suppress_prefixlen"] = int(value)
+        else:
+            raise ValueError(f"Unsupported rule option {key}: {spec}")
+
+    return Rule(**kwargs)
+
+
+def rtattr(rta_type: int, payload: bytes) -> bytes:
+    length = RTATTR.size + len(payload)
+    return RTATTR.pack(length, rta_type) + payload + b"\0" * (-length & 3)
+
+
+def encode_route(
+    msg_type: int,
+    flags: int,
+    seq: int,
+    table: int,
+    dst: tuple[int, int, int],
+    nexthop: Nexthop | None = None,
+) -> bytes:
+    """
+    编码一条路由消息（RTM_NEWROUTE / RTM_DELROUTE）。
+    """
+    version, network, prefixlen = dst
+    family = socket.AF_INET if version == 4 else socket.AF_INET6
+
+    attrs = rtattr(RTA_TABLE, U32.pack(table))
+    if prefixlen:
+        attrs += rtattr(RTA_DST, network.to_bytes(4 if version == 4 else 16, "big"))
+
+    if msg_type == RTM_DELROUTE:
+        # 与 iproute2 一致：删除时不限定 protocol/type，scope 为 nowhere
+        rtm = RTMSG.pack(family, prefixlen, 0, 0, table if table < 256 else 0, 0, RT_SCOPE_NOWHERE, 0, 0)
+    else:
+        assert nexthop is not None
+        rtm = RTMSG.pack(
+            family,
+            prefixlen,
+            0,
+            0,
+            table if table < 256 else 0,
+            RTPROT_BOOT,
+            nexthop.scope,
+            RTN_UNICAST,
+            RTNH_F_ONLINK if nexthop.onlink else 0,
+        )
+        attrs += nexthop.attrs
+
+    return NLMSGHDR.pack(NLMSGHDR.size + len(rtm) + len(attrs), msg_type, flags, seq, 0) + rtm + attrs
+
+
+def open_route_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+    try:
+        # 让内核按 table 过滤 dump 结果，旧内核不支持时在用户态过滤
+        sock.setsockopt(SOL_NETLINK, NETLINK_GET_STRICT_CHK, 1)
+    except OSError:
+        pass
+    sock.bind((0, 0))
+    return sock
+
+
+class NetlinkBatch:
+    """
+    在同一个 netlink socket 上批量下发请求。
+
+    请求按 chunk_size 拼接后一次 send，只有每批最后一条请求带 NLM_F_ACK，其他请求成功时内核不回复，
+    失败时内核仍然会返回带 seq 的错误消息，因此可以得到每一条请求的错误，同时避免数万个 ack。
+
+    用法：
+
+        batch = NetlinkBatch()
+        batch.add(data_without_ack, "route replace ...")
+        errors = batch.commit()  # [(description, OSError), ...]
+    """
+
+    def __init__(self, sock: socket.socket | None = None, chunk_size: int = 64 * 1024):
+        self.sock = sock
+        self.chunk_size = chunk_size
+        self.seq = 0x1000
+        self.requests: list[tuple[bytes, str]] = []
+
+    def next_seq(self) -> int:
+        self.seq += 1
+        return self.seq
+
+    def add(self, data: bytes, description: str):
+        self.requests.append((data, description))
+
+    def __len__(self):
+        return len(self.requests)
+
+    def commit(self) -> list[tuple[str, OSError]]:
+        if not self.requests:
+            return []
+
+        own_sock = self.sock is None
+        sock = self.sock or open_route_socket()
+        try:
+            # 不需要内核在错误消息中带回原始请求
+            sock.setsockopt(SOL_NETLINK, NETLINK_CAP_ACK, 1)
+        except OSError:
+            pass
+
+        descriptions = {}
+        errors = []
+
+        try:
+            chunk: list[bytes] = []
+            size = 0
+            for index, (data, description) in enumerate(self.requests):
+                _length, _type, _flags, seq, _pid = NLMSGHDR.unpack_from(data)
+                descriptions[seq] = description
+
+                last = index == len(self.requests) - 1
+                if last or size + len(data) >= self.chunk_size:
+                    # 最后一条请求要求 ack，作为这一批的结束标记
+                    data = data[:6] + struct.pack("=H", _flags | NLM_F_ACK) + data[8:]
+                    chunk.append(data)
+                    sock.send(b"".join(chunk))
+                    errors.extend(self._wait_ack(sock, seq, descriptions))
+                    chunk = []
+                    size = 0
+                else:
+                    chunk.append(data)
+                    size += len(data)
+        finally:
+            if own_sock:
+                sock.close()
+
+        self.requests = []
+        return errors
+
+    def _wait_ack(self, sock: socket.socket, last_seq: int, descriptions: dict[int, str]):
+        errors = []
+        while True:
+            data = sock.recv(1 << 20)
+            for msg_type, seq, body, _end in iter_messages(data):
+                if msg_type != NLMSG_ERROR:
+                    continue
+                (error,) = struct.unpack_from("=i", data, body)
+                if error:
+                    errors.append((descriptions.get(seq, f"seq {seq}"), OSError(-error, os.strerror(-error))))
+                if seq == last_seq:
+                    return errors
+
+
+def iter_messages(data: bytes) -> Iterator[tuple[int, int, int, int]]:
+    """
+    遍历一次 recv 得到的所有 netlink 消息，返回 (type, seq, body_offset, end_offset)
+    """
+    offset = 0
+    while offset + NLMSGHDR.size <= len(data):
+        length, msg_type, _flags, seq, _pid = NLMSGHDR.unpack_from(data, offset)
+        if length < NLMSGHDR.size:
+            break
+        yield msg_type, seq, offset + NLMSGHDR.size, offset + length
+        offset = (offset + length + 3) & ~3
+
+
+def dump(request: bytes, sock: socket.socket | None = None) -> Iterator[tuple[int, bytes, int, int]]:
+    """
+    发送 dump 请求，返回 (type, data, body_offset, end_offset)
+    """
+    own_sock = sock is None
+    if sock is None:
+        sock = open_route_socket()
+
+    try:
+        sock.send(request)
+
+        while True:
+            data = sock.recv(1 << 20)
+            for msg_type, _seq, body, end in iter_messages(data):
+                if msg_type == NLMSG_DONE:
+                    return
+                elif msg_type == NLMSG_ERROR:
+                    (error,) = struct.unpack_from("=i", data, body)
+                    if error:
+                        raise OSError(-error, os.strerror(-error))
+                else:
+                    yield msg_type, data, body, end
+    finally:
+        if own_sock:
+            sock.close()
+
+
+def dump_routes(table: int, family: int, sock: socket.socket | None = None) -> list[LiveRoute]:
+    """
+    读取内核路由表中的全部路由。
+    """
+    rtm = RTMSG.pack(family, 0, 0, 0, table if table < 256 else 252, 0, 0, 0, 0)
+    attrs = rtattr(RTA_TABLE, U32.pack(table))
+    request = NLMSGHDR.pack(NLMSGHDR.size + len(rtm) + len(attrs), RTM_GETROUTE, NLM_F_REQUEST | NLM_F_DUMP, 1, 0)
+
+    version = 4 if family == socket.AF_INET else 6
+    routes = []
+
+    for msg_type, data, body, end in dump(request + rtm + attrs, sock):
+        if msg_type == RTM_NEWROUTE:
+            route = _parse_route(data, body, end, table, version)
+            if route is not None:
+                routes.append(route)
+
+    return routes
+
+
+def _iter_attrs(data: bytes, offset: int, end: int) -> Iterator[tuple[int, bytes]]:
+    while offset + RTATTR.size <= end:
+        rta_len, rta_type = RTATTR.unpack_from(data, offset)
+        if rta_len < RTATTR.size:
+            break
+        yield rta_type, data[offset + RTATTR.size : offset + rta_len]
+        offset += (rta_len + 3) & ~3
+
+
+def _parse_route(data: bytes, offset: int, end: int, table: int, version: int) -> LiveRoute | None:
+    _family, dst_len, _src_len, _tos, rtm_table, _proto, _scope, _type, _flags = RTMSG.unpack_from(data, offset)
+
+    dst = gateway = oif = priority = prefsrc = None
+    route_table = rtm_table
+
+    for rta_type, value in _iter_attrs(data, offset + RTMSG.size, end):
+        if rta_type == RTA_DST:
+            dst = value
+        elif rta_type == RTA_GATEWAY:
+            gateway = value
+        elif rta_type == RTA_OIF:
+            (oif,) = U32.unpack(value)
+        elif rta_type == RTA_PRIORITY:
+            (priority,) = U32.unpack(value)
+        elif rta_type == RTA_PREFSRC:
+            prefsrc = value
+        elif rta_type == RTA_TABLE:
+            (route_table,) = U32.unpack(value)
+
+    if route_table != table:
+        return None
+
+    network = int.from_bytes(dst, "big") if dst else 0
+    return LiveRoute((version, network, dst_len), gateway, oif, priority, prefsrc)
+
+
+def dump_rules(family: int, sock: socket.socket | None = None) -> list[Rule]:
+    """
+    读取内核中的策略路由规则。
+    """
+    fib = FIBMSG.pack(family, 0, 0, 0, 0, 0, 0, 0, 0)
+    request = NLMSGHDR.pack(NLMSGHDR.size + len(fib), RTM_GETRULE, NLM_F_REQUEST | NLM_F_DUMP, 1, 0) + fib
+
+    rules = []
+    for msg_type, data, body, end in dump(request, sock):
+        if msg_type == RTM_NEWRULE:
+            rules.append(_parse_rule(data, body, end))
+
+    return rules
+
+
+def _parse_rule(data: bytes, offset: int, end: int) -> Rule:
+    family, dst_len, src_len, tos, table, _res1, _res2, action, flags = FIBMSG.unpack_from(data, offset)
+
+    attrs: dict = {}
+    for rta_type, value in _iter_attrs(data, offset + FIBMSG.size, end):
+        if rta_type in (FRA_SRC, FRA_DST):
+            attrs[rta_type] = socket.inet_ntop(family, value)
+        elif rta_type in (FRA_IIFNAME, FRA_OIFNAME):
+            attrs[rta_type] = value.rstrip(b"\0").decode()
+        elif rta_type in (FRA_PRIORITY, FRA_TABLE, FRA_FWMARK, FRA_FWMASK, FRA_SUPPRESS_PREFIXLEN):
+            (attrs[rta_type],) = U32.unpack_from(value)
+
+    fwmark = attrs.get(FRA_FWMARK)
+    fwmask = attrs.get(FRA_FWMASK)
+    suppress_prefixlen = attrs.get(FRA_SUPPRESS_PREFIXLEN)
+    return Rule(
+        family=family,
+        priority=attrs.get(FRA_PRIORITY) or 0,
+        table=attrs.get(FRA_TABLE) or table,
+        action=action,
+        src=attrs.get(FRA_SRC),
+        src_len=src_len,
+        dst=attrs.get(FRA_DST),
+        dst_len=dst_len,
+        tos=tos,
+        fwmark=fwmark if fwmark or fwmask else None,
+        fwmask=fwmask if fwmark or fwmask else None,
+        iifname=attrs.get(FRA_IIFNAME),
+        oifname=attrs.get(FRA_OIFNAME),
+        invert=bool(flags & FIB_RULE_INVERT),
+        suppress_prefixlen=suppress_prefixlen if suppress_prefixlen not in (None, 0xFFFFFFFF) else None,
+    )
+
+
+def dump_links(sock: socket.socket | None = None) -> dict[str, LiveLink]:
+    """
+    读取所有网络接口，返回 {name: LiveLink}
+    """
+    ifi = IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+    request = NLMSGHDR.pack(NLMSGHDR.size + len(ifi), RTM_GETLINK, NLM_F_REQUEST | NLM_F_DUMP, 1, 0) + ifi
+
+    links = {}
+    for msg_type, data, body, end in dump(request, sock):
+        if msg_type == RTM_NEWLINK:
+            link = parse_link(data, body, end)
+            links[link.name] = link
+
+    return links
+
+
+def parse_link(data: bytes, offset: int, end: int) -> LiveLink:
+    _family, _type, ifindex, flags, _change = IFINFOMSG.unpack_from(data, offset)
+
+    name = ""
+    for rta_type, value in _iter_attrs(data, offset + IFINFOMSG.size, end):
+        if rta_type == IFLA_IFNAME:
+            name = value.rstrip(b"\0").decode()
+
+    return LiveLink(ifindex, name, flags)
+
+
+def open_link_monitor() -> socket.socket:
+    """
+    订阅接口变化（RTM_NEWLINK / RTM_DELLINK）的 netlink socket，配合 iter_messages、parse_link 使用
+    """
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+    sock.bind((0, RTMGRP_LINK))
+    return sock
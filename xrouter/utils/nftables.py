@@ -0,0 +1,57 @@
+import ipaddress
+from typing import Iterable
+
+from .cidr import Interval, format_interval
+
+
+def list_set_intervals(family: str, table: str, name: str) -> list[Interval] | None:
+    """
+    通过 `nft -j list set` 读取 interval set 的当前内容，set 不存在时返回 None
+    """
+    import json
+
+    import sh
+
+    try:
+        output = sh.nft("-j", "list", "set", family, table, name)
+    except sh.ErrorReturnCode:
+        return None
+
+    intervals = []
+    for item in json.loads(output)["nftables"]:
+        for elem in item.get("set", {}).get("elem", []):
+            intervals.append(parse_element(elem))
+
+    return sorted(intervals)
+
+
+def parse_element(elem) -> Interval:
+    """
+    nft json 中的元素：`"1.2.3.4"`、`{"prefix": {"addr": ..., "len": ...}}`、`{"range": [first, last]}`，
+    带 timeout、counter 等属性时外层还有一个 `{"elem": {"val": ...}}`
+    """
+    if isinstance(elem, dict) and "elem" in elem:
+        elem = elem["elem"]["val"]
+
+    if isinstance(elem, str):
+        address = ipaddress.ip_address(elem)
+        return (address.version, int(address), int(address))
+    elif "prefix" in elem:
+        network = ipaddress.ip_network(f"{elem['prefix']['addr']}/{elem['prefix']['len']}")
+        return (network.version, int(network.network_address), int(network.broadcast_address))
+    elif "range" in elem:
+        first, last = map(ipaddress.ip_address, elem["range"])
+        return (first.version, int(first), int(last))
+
+    raise ValueError(f"Unsupported set element: {elem}")
+
+
+def element_lines(command: str, family: str, table: str, name: str, intervals: Iterable[Interval]) -> list[str]:
+    """
+    `add element` / `delete element` 语句，每个元素一行，没有元素时返回空列表
+    """
+    elements = [f"    {format_interval(interval)},\n" for interval in intervals]
+    if not elements:
+        return []
+
+    return [f"{command} element {family} {table} {name} {{\n", *elements, "}\n"]
@@ -0,0 +1,66 @@
+import socket
+
+PROBE_KINDS = ("icmp", "tcp")
+
+
+def parse_probe(spec: str) -> tuple[str, str, int | None]:
+    """
+    解析探测目标，返回 (kind, host, port)，icmp 的 port 为 None，格式错误时抛出 ValueError
+    """
+    kind, _, target = spec.strip().partition(" ")
+    target = target.strip()
+
+    if kind not in PROBE_KINDS:
+        raise ValueError(f"unsupported probe kind {kind!r} in {spec!r}, expected one of {', '.join(PROBE_KINDS)}")
+    if kind == "icmp":
+        if not target or " " in target:
+            raise ValueError(f"invalid probe {spec!r}, expected `icmp <host>`")
+        return kind, target, None
+
+    host, _, port = target.rpartition(":")
+    if host.startswith("[") and host.endswith("]"):
+        host = host[1:-1]
+    elif ":" in host:
+        raise ValueError(f"invalid probe {spec!r}, write IPv6 addresses as [addr]:port")
+    if not host or " " in host or not port.isdigit() or not 0 < int(port) < 65536:
+        raise ValueError(f"invalid probe {spec!r}, expected `tcp <host>:<port>`")
+
+    return kind, host, int(port)
+
+
+def probe(spec: str, dev: str | None = None, timeout: float = 1.0) -> bool:
+    """
+    探测目标是否可达，dev 不为空时从指定接口发出：
+
+    * `icmp 223.5.5.5`: ping 一次
+    * `tcp 223.5.5.5:443`: 建立一次 tcp 连接，IPv6 地址写成 `[2400:3200::1]:443`
+    """
+    kind, host, port = parse_probe(spec)
+
+    if port is None:
+        return probe_icmp(host, dev, timeout)
+    return probe_tcp(host, port, dev, timeout)
+
+
+def probe_icmp(host: str, dev: str | None, timeout: float) -> bool:
+    import sh
+
+    args = ["-c", "1", "-W", str(timeout), "-q"]
+    if dev:
+        args.extend(["-I", dev])
+
+    return sh.ping(*args, host, _ok_code=list(range(256)), _return_cmd=True).exit_code == 0
+
+
+def probe_tcp(host: str, port: int, dev: str | None, timeout: float) -> bool:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        if dev:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BINDTODEVICE, dev.encode())
+        try:
+            sock.connect((host, port))
+        except OSError:
+            return False
+
+    return True
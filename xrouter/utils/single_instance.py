@@ -1,5 +1,6 @@
 import socket
 import time
+from contextlib import contextmanager
 
 single_instance_lock = None
 
@@ -32,3 +33,33 @@ def single_instance(name=__file__):
                 time.sleep(0.1)
             else:
                 raise e
+
+
+def try_lock(name: str) -> socket.socket | None:
+    """
+    Non-blocking variant of single_instance.
+
+    Returns the bound socket if the lock is acquired, close it to release the lock.
+    Returns None if another process is holding the lock.
+    """
+    lock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        lock.bind("\0%s" % name)
+    except OSError as e:
+        lock.close()
+        if e.errno == 98:  # 98: Address already in use
+            return None
+        raise e
+    return lock
+
+
+@contextmanager
+def wait_lock(name: str, interval: float = 0.05):
+    """
+    Blocking variant of try_lock, released when the with block exits.
+    """
+    while (lock := try_lock(name)) is None:
+        time.sleep(interval)
+
+    with lock:
+        yield
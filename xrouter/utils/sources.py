@@ -0,0 +1,257 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, Literal, Mapping
+
+from .download import DownloadType
+
+
+@dataclass
+class Source:
+    """
+    一个需要定期拉取的外部列表。
+
+    * group: 所属的 fetch 命令，如 `gw fetch china-ips`
+    * url: 下载地址
+    * type: 下载内容的格式，stream 表示下载到临时文件，build 拿到的是文件路径
+    * root: 输出目录，gw 上的属性名，如 zones_root、dnsmasq_config_root
+    * build: 将下载内容转换为输出文件 {filename: content}，content 可以是字符串或者逐行生成内容的迭代器
+    * reload: 输出文件变化后需要重新加载的部分，route 或 dnsmasq（china-names 在 reload dnsmasq 时编译）
+    """
+
+    group: str
+    url: str
+    type: DownloadType
+    root: str
+    build: Callable[[Any], Mapping[str, Iterable[str]]]
+    reload: Literal["route", "dnsmasq"]
+
+
+def cidr_files(name: str, cidrs: list[str]) -> dict[str, str]:
+    """
+    合并 cidr 列表，按 IPv4/IPv6 分别输出到 {name}-ipv4.txt 和 {name}-ipv6.txt
+    """
+    from xrouter.utils.cidr import merge_cidr_list_split_version
+
+    cidrs_v4, cidrs_v6 = merge_cidr_list_split_version(cidrs)
+
+    return {
+        f"{name}-ipv4.txt": "\n".join(cidrs_v4) + "\n",
+        f"{name}-ipv6.txt": "\n".join(cidrs_v6) + "\n",
+    }
+
+
+def build_github_ips(content: dict) -> dict[str, str]:
+    from xrouter.utils.cidr import safe_parse_cidr
+
+    cidrs_all = []
+
+    # Process each service in the JSON
+    for networks in content.values():
+        if isinstance(networks, list):
+            for network in networks:
+                cidr = safe_parse_cidr(network)
+                if cidr:
+                    cidrs_all.append(cidr)
+
+    return cidr_files("github", cidrs_all)
+
+
+def build_google_ips(content: dict) -> dict[str, str]:
+    cidrs_all = []
+
+    for prefixes in content.get("prefixes", []):
+        if "ipv4Prefix" in prefixes:
+            cidrs_all.append(prefixes["ipv4Prefix"])
+        elif "ipv6Prefix" in prefixes:
+            cidrs_all.append(prefixes["ipv6Prefix"])
+
+    return cidr_files("google", cidrs_all)
+
+
+def build_cloudflare_ips(content: dict) -> dict[str, str]:
+    result = content.get("result", {})
+
+    return cidr_files("cloudflare", [*result.get("ipv4_cidrs", []), *result.get("ipv6_cidrs", [])])
+
+
+def build_fastly_ips(content: dict) -> dict[str, str]:
+    return cidr_files("fastly", [*content.get("addresses", []), *content.get("ipv6_addresses", [])])
+
+
+def build_raw(filename: str) -> Callable[[str], dict[str, Iterable[str]]]:
+    """
+    原样保存下载内容
+    """
+
+    def build(content: str) -> dict[str, Iterable[str]]:
+        return {filename: content}
+
+    return build
+
+
+def read_lines(path: Path) -> Iterator[str]:
+    # newline="" 保留原始换行符
+    with path.open(encoding="utf8", newline="") as fp:
+        yield from fp
+
+
+def build_stream(filename: str) -> Callable[[Path], dict[str, Iterable[str]]]:
+    """
+    原样保存 stream 方式下载的内容，逐行处理，适合几 MB 的列表
+    """
+
+    def build(path: Path) -> dict[str, Iterable[str]]:
+        return {filename: read_lines(path)}
+
+    return build
+
+
+CHINA_IPS_URL = "https://raw.githubusercontent.com/gaoyifan/china-operator-ip/refs/heads/ip-lists"
+CHINA_IPS_FILES = [
+    "china",
+    "china6",
+    # 电信
+    "chinanet",
+    "chinanet6",
+    # 移动
+    "cmcc",
+    "cmcc6",
+    # 科技网
+    "cstnet",
+    "cstnet6",
+    # 鹏博士
+    "drpeng",
+    "drpeng6",
+    # 谷歌中国
+    "googlecn",
+    "googlecn6",
+    # 教育网
+    "cernet",
+    "cernet6",
+    # 联通
+    "unicom",
+    "unicom6",
+]
+
+CHINA_NAMES_URL = "https://raw.githubusercontent.com/felixonmars/dnsmasq-china-list/refs/heads/master"
+
+SOURCES = [
+    *[
+        Source(
+            "china-ips",
+            f"{CHINA_IPS_URL}/{file}.txt",
+            "text",
+            "zones_root",
+            build_raw(f"{file}.txt"),
+            "route",
+        )
+        for file in CHINA_IPS_FILES
+    ],
+    Source("github-ips", "https://api.github.com/meta", "json", "zones_root", build_github_ips, "route"),
+    Source("google-ips", "https://www.gstatic.com/ipranges/goog.json", "json", "zones_root", build_google_ips, "route"),
+    Source(
+        "cloudflare-ips",
+        "https://api.cloudflare.com/client/v4/ips",
+        "json",
+        "zones_root",
+        build_cloudflare_ips,
+        "route",
+    ),
+    Source("fastly-ips", "https://api.fastly.com/public-ip-list", "json", "zones_root", build_fastly_ips, "route"),
+    Source(
+        "china-names",
+        f"{CHINA_NAMES_URL}/accelerated-domains.china.conf",
+        "stream",
+        "names_root",
+        build_stream("china.conf"),
+        "dnsmasq",
+    ),
+    Source(
+        "china-names",
+        f"{CHINA_NAMES_URL}/apple.china.conf",
+        "stream",
+        "names_root",
+        build_stream("apple.conf"),
+        "dnsmasq",
+    ),
+    Source(
+        "china-names",
+        f"{CHINA_NAMES_URL}/bogus-nxdomain.china.conf",
+        "text",
+        "dnsmasq_config_root",
+        build_raw("bogus-nxdomain-china.conf"),
+        "dnsmasq",
+    ),
+]
+
+
+def fetch_sources(sources: list[Source], show_diff: bool = False) -> set[str]:
+    """
+    并发下载所有 source，生成并安装输出文件，返回输出有变化的 source 需要 reload 的部分。
+
+    所有下载完成之后才开始写入文件，某个 source 下载或者解析失败时只跳过该 source。
+    """
+    from xrouter.gwlib import gw
+    from xrouter.utils.download import HttpCache, download_many
+
+    cache = HttpCache(gw.zones_root / ".http-cache.json")
+    for source in sources:
+        cache.forget_outside(source.url, getattr(gw, source.root))
+
+    types = {source.url: source.type for source in sources}
+    gw.print(f"Downloading {len(types)} files ...")
+    downloads = download_many(list(types), cache=cache, types=types)
+
+    reloads: set[str] = set()
+    try:
+        with gw.install_transaction():
+            for source in sources:
+                download = downloads[source.url]
+                if download.not_modified or download.content is None:
+                    continue
+
+                if cache.unchanged(download):
+                    gw.print(f"Unchanged: {source.url}")
+                    continue
+
+                result = install_source(source, download.content, show_diff)
+                if result is None:
+                    continue
+
+                changed, paths = result
+                if changed:
+                    reloads.add(source.reload)
+                cache.update(download, paths)
+    finally:
+        for download in downloads.values():
+            if isinstance(download.content, Path):
+                download.content.unlink(missing_ok=True)
+
+    cache.save()
+
+    return reloads
+
+
+def install_source(source: Source, content: Any, show_diff: bool) -> tuple[bool, list[Path]] | None:
+    """
+    安装一个 source 的所有输出文件，返回 (是否有文件变化, 输出文件列表)，解析失败时记录日志并返回 None
+    """
+    from xrouter.gwlib import gw
+
+    root = getattr(gw, source.root)
+    changed = False
+    paths = []
+    try:
+        for filename, output in source.build(content).items():
+            path = root / filename
+            gw.print(f"Saving to {path} ...")
+            if isinstance(output, str):
+                changed |= gw.install_text_file(path, output, show_diff=show_diff)
+            else:
+                changed |= gw.install_stream_file(path, output, show_diff=show_diff)
+            paths.append(path)
+    except Exception as e:
+        gw.logger.error(f"Failed to parse {source.url}", exc_info=e)
+        return None
+
+    return changed, paths
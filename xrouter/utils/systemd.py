@@ -0,0 +1,161 @@
+import time
+from dataclasses import dataclass
+
+# systemctl show 读取的属性
+UNIT_PROPERTIES = (
+    "LoadState",
+    "ActiveState",
+    "SubState",
+    "Result",
+    "ActiveEnterTimestampMonotonic",
+    "InactiveExitTimestampMonotonic",
+)
+
+
+@dataclass
+class UnitState:
+    unit: str
+    load_state: str
+    active_state: str
+    sub_state: str
+    result: str
+    # CLOCK_MONOTONIC，单位微秒，0 表示没有发生过
+    active_enter: int
+    inactive_exit: int
+
+
+@dataclass
+class UnitJob:
+    """
+    一个 unit 的 start/restart 结果，ok 为 None 表示还没有结束
+    """
+
+    unit: str
+    ok: bool | None = None
+    message: str = ""
+    # 从提交 job 到 unit 进入 active 的秒数
+    elapsed: float = 0.0
+
+
+def device_unit(interface: str) -> str:
+    """
+    网络接口对应的 device unit（udev 为每个网络接口生成），接口名按 `systemd-escape --path` 的规则转义，
+    如 br-lan 为 sys-subsystem-net-devices-br\\x2dlan.device
+    """
+    escaped = "".join(c if c.isascii() and (c.isalnum() or c in ":_.") else f"\\x{ord(c):02x}" for c in interface)
+    if escaped.startswith("."):
+        escaped = "\\x2e" + escaped[1:]
+    return f"sys-subsystem-net-devices-{escaped}.device"
+
+
+def show_units(units: list[str]) -> list[UnitState]:
+    """
+    一次 `systemctl show` 读取多个 unit 的状态，输出按参数顺序，每个 unit 一段，以空行分隔
+    """
+    import sh
+
+    output = sh.systemctl("show", f"--property={','.join(UNIT_PROPERTIES)}", *units)
+
+    states = []
+    for unit, block in zip(units, output.strip("\n").split("\n\n")):
+        values = dict(line.partition("=")[::2] for line in block.splitlines())
+        states.append(
+            UnitState(
+                unit,
+                values.get("LoadState", ""),
+                values.get("ActiveState", ""),
+                values.get("SubState", ""),
+                values.get("Result", ""),
+                int(values.get("ActiveEnterTimestampMonotonic") or 0),
+                int(values.get("InactiveExitTimestampMonotonic") or 0),
+            )
+        )
+
+    return states
+
+
+def run_unit_jobs(action: str, units: list[str], timeout: float = 300, interval: float = 0.2) -> list[UnitJob]:
+    """
+    用一次 `systemctl {action} --no-block` 同时提交所有 unit 的 job，由 systemd 并发执行，
+    然后轮询（每轮一次 `systemctl show`）直到每个 unit 进入 active、失败或者超时。
+
+    总耗时约等于最慢的一个 unit，而不是所有 unit 之和。返回按 units 顺序排列的结果。
+    """
+    import sh
+
+    from xrouter.gwlib import gw
+
+    jobs = {unit: UnitJob(unit) for unit in units}
+
+    # 不存在的 unit 会让整个 systemctl 命令失败，提前排除
+    pending = []
+    for state in show_units(units):
+        job = jobs[state.unit]
+        if state.load_state == "not-found":
+            job.ok, job.message = False, "unit not found"
+        elif action == "start" and state.active_state == "active":
+            job.ok, job.message = True, "already active"
+        else:
+            pending.append(state.unit)
+
+    if not pending:
+        return list(jobs.values())
+
+    # 和 systemd 的 *TimestampMonotonic 使用同一个时钟
+    start = time.monotonic_ns() // 1000
+    gw.run_command(sh.systemctl.bake(action, "--no-block", *pending))
+
+    deadline = time.monotonic() + timeout
+    while pending and time.monotonic() < deadline:
+        time.sleep(interval)
+        for state in show_units(pending):
+            if update_unit_job(jobs[state.unit], state, start):
+                pending.remove(state.unit)
+
+    for unit in pending:
+        job = jobs[unit]
+        job.ok = False
+        job.message = f"timeout after {timeout:g}s, {job.message or 'no progress'}"
+
+    return list(jobs.values())
+
+
+def update_unit_job(job: UnitJob, state: UnitState, start: int) -> bool:
+    """
+    根据 unit 状态更新 job，返回 job 是否已经结束。
+
+    只看 start 之后发生的状态变化，避免把 job 执行之前的旧状态（例如 restart 之前的 active、
+    上一次启动留下的 failed）当作结果。
+    """
+    job.message = f"{state.active_state}/{state.sub_state}"
+    if state.result and state.result != "success":
+        job.message += f" (result: {state.result})"
+
+    if state.active_state == "active" and state.active_enter >= start:
+        job.ok = True
+        job.elapsed = (state.active_enter - start) / 1e6
+        return True
+
+    if state.active_state in ("failed", "inactive") and state.inactive_exit >= start:
+        job.ok = state.active_state == "inactive" and state.result == "success"
+        job.elapsed = (time.monotonic_ns() // 1000 - start) / 1e6
+        return True
+
+    return False
+
+
+def report_unit_jobs(jobs: list[UnitJob]) -> bool:
+    """
+    按顺序输出每个 unit 的结果和耗时，全部成功时返回 True
+    """
+    from xrouter.gwlib import gw
+
+    for job in jobs:
+        if job.ok and job.message == "already active":
+            gw.print(f"{job.unit}: already active")
+        elif job.ok:
+            gw.print(f"{job.unit}: {job.message} in {job.elapsed:.2f}s")
+        else:
+            gw.logger.error(f"{job.unit}: failed, {job.message}")
+
+    return all(job.ok for job in jobs)
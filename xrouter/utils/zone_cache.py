@@ -0,0 +1,137 @@
+import hashlib
+import struct
+from pathlib import Path
+from typing import Callable
+
+from .cidr import Cidr
+
+MAGIC = b"XRZC"
+FORMAT_VERSION = 2
+
+# magic, format version, path length, size, mtime_ns, sha256, ipv4 count, ipv6 count
+HEADER = struct.Struct(">4sHHQQ32sII")
+IPV4_RECORD = struct.Struct(">IB")
+IPV6_RECORD = struct.Struct(">QQB")
+
+# 进程内缓存，同一个 zone 被多个路由表引用时只解析一次
+# {zone_file: ((size, mtime_ns), cidrs)}
+_zones: dict[Path, tuple[tuple[int, int], list[Cidr]]] = {}
+
+
+def load_zone(zone_file: Path, parser: Callable[[str], list[Cidr]], cache_root: Path | None = None) -> list[Cidr]:
+    """
+    读取 zone 文件，返回 [(version, network, prefixlen), ...]
+
+    解析结果会缓存两层：
+
+    * 进程内，以文件 size + mtime 判断是否失效
+    * cache_root 下的二进制文件，以文件路径、size、mtime 判断是否失效，size/mtime 变化但内容 hash 不变时仍然使用缓存
+
+    parser 用于在缓存失效时解析文件内容。
+    """
+    stat = zone_file.stat()
+    key = (stat.st_size, stat.st_mtime_ns)
+
+    cached = _zones.get(zone_file)
+    if cached and cached[0] == key:
+        return cached[1]
+
+    cidrs = None
+    cache_file = cache_root / f"{zone_file.name}.bin" if cache_root else None
+    if cache_file:
+        cidrs = _load_cache(cache_file, zone_file, key)
+
+    if cidrs is None:
+        content = zone_file.read_bytes()
+        cidrs = parser(content.decode())
+        if cache_file:
+            _write_cache(cache_file, zone_file, key, hashlib.sha256(content).digest(), cidrs)
+
+    _zones[zone_file] = (key, cidrs)
+    return cidrs
+
+
+def _load_cache(cache_file: Path, zone_file: Path, key: tuple[int, int]) -> list[Cidr] | None:
+    header = _read_cache_header(cache_file, zone_file)
+    if header is None:
+        return None
+
+    size, mtime_ns, digest = header
+    if (size, mtime_ns) == key:
+        return _read_cache_records(cache_file)
+
+    # size/mtime 变化（例如 fetch 时重写了同样的内容），内容 hash 不变时仍然可以使用缓存，更新一下 header 即可
+    if hashlib.sha256(zone_file.read_bytes()).digest() != digest:
+        return None
+
+    cidrs = _read_cache_records(cache_file)
+    if cidrs is not None:
+        _write_cache(cache_file, zone_file, key, digest, cidrs)
+    return cidrs
+
+
+def _read_cache_header(cache_file: Path, zone_file: Path) -> tuple[int, int, bytes] | None:
+    """
+    返回 (size, mtime_ns, sha256)，缓存不存在或不匹配时返回 None
+    """
+    try:
+        with cache_file.open("rb") as fp:
+            data = fp.read(HEADER.size)
+            if len(data) < HEADER.size:
+                return None
+            magic, version, path_len, size, mtime_ns, digest, _, _ = HEADER.unpack(data)
+            if magic != MAGIC or version != FORMAT_VERSION:
+                return None
+            if fp.read(path_len) != str(zone_file).encode():
+                return None
+            return size, mtime_ns, digest
+    except OSError:
+        return None
+
+
+def _read_cache_records(cache_file: Path) -> list[Cidr] | None:
+    try:
+        data = cache_file.read_bytes()
+    except OSError:
+        return None
+
+    *_, path_len, _, _, _, count4, count6 = HEADER.unpack_from(data)
+    offset = HEADER.size + path_len
+
+    size4 = IPV4_RECORD.size * count4
+    size6 = IPV6_RECORD.size * count6
+    if len(data) != offset + size4 + size6:
+        return None
+
+    cidrs: list[Cidr] = [
+        (4, network, prefixlen) for network, prefixlen in IPV4_RECORD.iter_unpack(data[offset : offset + size4])
+    ]
+    offset += size4
+    cidrs.extend(
+        (6, hi << 64 | lo, prefixlen) for hi, lo, prefixlen in IPV6_RECORD.iter_unpack(data[offset : offset + size6])
+    )
+
+    return cidrs
+
+
+def _write_cache(cache_file: Path, zone_file: Path, key: tuple[int, int], digest: bytes, cidrs: list[Cidr]):
+    """
+    写入缓存文件，先写临时文件再 rename，写入失败（例如没有权限）时忽略，不影响正常流程。
+    """
+    from xrouter.gwlib import gw
+
+    path = str(zone_file).encode()
+    ipv4 = [cidr for cidr in cidrs if cidr[0] == 4]
+    ipv6 = [cidr for cidr in cidrs if cidr[0] == 6]
+
+    parts = [HEADER.pack(MAGIC, FORMAT_VERSION, len(path), *key, digest, len(ipv4), len(ipv6)), path]
+    parts.extend(IPV4_RECORD.pack(network, prefixlen) for _, network, prefixlen in ipv4)
+    parts.extend(IPV6_RECORD.pack(network >> 64, network & (1 << 64) - 1, prefixlen) for _, network, prefixlen in ipv6)
+
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = cache_file.with_name(f".{cache_file.name}.tmp")
+        tmp_file.write_bytes(b"".join(parts))
+        tmp_file.replace(cache_file)
+    except OSError as e:
+        gw.logger.warning(f"Failed to write zone cache {cache_file}: {e}")